@@ -1,22 +1,66 @@
 import argparse
+import atexit
 
 from fat import cli
+from fat.utils import parse_size
+
+# actions which names are not valid function names
+ACTION_FUNCTIONS = {
+    'import': cli.import_tree,
+    'export': cli.export_tree,
+}
 
 
 def main():
     parser = argparse.ArgumentParser()
     add = parser.add_argument
 
-    add('action', choices=['mkdir', 'touch', 'write', 'read'])
-    add('path_name', help='path of a file or directory for an action')
+    add('action', choices=[
+        'format', 'df', 'ls', 'du', 'mkdir', 'rmdir', 'touch', 'rm', 'truncate', 'write', 'read', 'batch', 'shell',
+        'serve', 'import', 'export', 'defrag', 'fsck',
+    ])
+    add('path_name', nargs='?',
+        help='path of a file or directory for an action, script path for `batch`, socket path for `serve`')
+    add('target', nargs='?', help='destination of `import` (volume path) and `export` (host directory)')
     add('--data', help='data for `write` action')
+    add('--size', type=parse_size, help='bytes to reserve for a file created by `touch` action, '
+                                        'new size for `truncate`, volume size for `format` action (e.g. 64M)')
+    add('--cluster-size', type=parse_size, help='cluster size for `format` action (e.g. 4K)')
+    add('-r', '-R', '--recursive', action='store_true',
+        help='delete a directory with its content for `rmdir` action, list the whole tree for `ls` action')
+    add('--analyze', action='store_true', help='only report fragmentation for `defrag` action')
+    add('--pause', type=float, default=0.0, help='seconds to sleep after every file moved by `defrag` action')
+    add('--repair', action='store_true', help='fix found problems for `fsck` action')
+    add('--stats', action='store_true', help='print counters and latencies of operations to stderr')
 
     cmd = parser.parse_args()
+    if cmd.stats:
+        cli.collect_stats = True
+        atexit.register(cli.print_stats)
+    if cmd.action == 'fsck':
+        return cli.fsck(repair=cmd.repair)
+    if cmd.action == 'defrag':
+        return cli.defrag(analyze_only=cmd.analyze, pause=cmd.pause)
+    if cmd.action == 'format':
+        return cli.format_volume(cmd.size, cmd.cluster_size)
+    if cmd.action == 'rmdir' and cmd.path_name:
+        return cli.rmdir(cmd.path_name, recursive=cmd.recursive)
+    if cmd.action == 'ls':
+        return cli.ls(cmd.path_name or '/', recursive=cmd.recursive)
+    if cmd.action == 'truncate' and cmd.size is None:
+        parser.error('--size is required for `truncate` action')
+    if cmd.path_name is None and cmd.action not in ('batch', 'shell', 'df', 'du'):
+        parser.error(f'path_name is required for `{cmd.action}` action')
 
-    args = [cmd.path_name]
+    args = [cmd.path_name] if cmd.path_name else []
+    if cmd.target:
+        args.append(cmd.target)
     if cmd.data:
         args.append(cmd.data)
-    getattr(cli, cmd.action)(*args)
+    if cmd.size is not None:
+        args.append(cmd.size)
+    action = ACTION_FUNCTIONS.get(cmd.action) or getattr(cli, cmd.action)
+    action(*args)
 
 
 if __name__ == '__main__':
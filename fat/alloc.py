@@ -0,0 +1,226 @@
+"""Free space index for the data region of the FAT
+
+Free clusters are kept as a sorted list of extents (runs of consecutive free clusters),
+so looking for a free cluster near a goal is a binary search, and allocating/freeing
+only touches the extents around the affected clusters instead of scanning the table.
+The same extents ordered by their lengths make the best-fit search a binary search too.
+"""
+
+import bisect
+from itertools import groupby
+from typing import Iterable, List, Optional, Tuple
+
+from fat.exceptions import FATException
+from fat.utils import group_consecutive
+
+
+class FreeSpaceIndex:
+    """Sorted free extents: the extent `i` covers `starts[i]` .. `starts[i] + lengths[i] - 1`
+    """
+
+    def __init__(self, first: int, last: int):
+        self.first = first      # type: int  # first allocatable cluster
+        self.last = last        # type: int  # the first cluster number after the data region
+        self.starts = []        # type: List[int]
+        self.lengths = []       # type: List[int]
+        self.by_size = []       # type: List[Tuple[int, int]]  # sorted (length, start) of the extents
+        self.free_count = 0     # type: int
+
+    @classmethod
+    def from_entries(cls, entries, first: int, last: int) -> 'FreeSpaceIndex':
+        """Build the index from FAT entries (an empty entry is 0)
+        """
+        index = cls(first, last)
+        number = first
+        for used, group in groupby(entries[first:last], bool):
+            length = len(list(group))
+            if not used:
+                index.starts.append(number)
+                index.lengths.append(length)
+                index.free_count += length
+            number += length
+        index.by_size = sorted(zip(index.lengths, index.starts))
+        return index
+
+    def __len__(self):
+        return self.free_count
+
+    def __contains__(self, number: int) -> bool:
+        return self._locate(number) is not None
+
+    def extents(self):
+        """Iterate over free extents as (start, length) pairs
+        """
+        return zip(self.starts, self.lengths)
+
+    def _locate(self, number: int) -> Optional[int]:
+        """Index of the extent which contains the cluster `number`, None if it's not free
+        """
+        i = bisect.bisect_right(self.starts, number) - 1
+        if i >= 0 and number < self.starts[i] + self.lengths[i]:
+            return i
+        return None
+
+    def find(self, goal: int) -> Optional[int]:
+        """The first free cluster at or after `goal`, None if there is no any
+        """
+        i = bisect.bisect_right(self.starts, goal) - 1
+        if i >= 0 and goal < self.starts[i] + self.lengths[i]:
+            return goal
+        if i + 1 < len(self.starts):
+            return self.starts[i + 1]
+        return None
+
+    def _sized(self, start: int, length: int):
+        bisect.insort(self.by_size, (length, start))
+
+    def _unsized(self, start: int, length: int):
+        del self.by_size[bisect.bisect_left(self.by_size, (length, start))]
+
+    def take(self, start: int, count: int=1):
+        """Mark `count` clusters from `start` as used. They have to be in one free extent.
+        """
+        i = self._locate(start)
+        if i is None or start + count > self.starts[i] + self.lengths[i]:
+            raise FATException(f'Clusters {start}..{start + count - 1} are not free')
+
+        extent_start, extent_length = self.starts[i], self.lengths[i]
+        head = start - extent_start
+        tail = extent_start + extent_length - (start + count)
+        self._unsized(extent_start, extent_length)
+        if head:
+            self._sized(extent_start, head)
+        if tail:
+            self._sized(start + count, tail)
+        if head and tail:
+            self.lengths[i] = head
+            self.starts.insert(i + 1, start + count)
+            self.lengths.insert(i + 1, tail)
+        elif head:
+            self.lengths[i] = head
+        elif tail:
+            self.starts[i] = start + count
+            self.lengths[i] = tail
+        else:
+            del self.starts[i]
+            del self.lengths[i]
+        self.free_count -= count
+
+    def release(self, start: int, count: int=1):
+        """Mark `count` clusters from `start` as free, merging them with the neighbour extents
+        """
+        if start < self.first or start + count > self.last:
+            raise FATException(f'Clusters {start}..{start + count - 1} are out of the data region')
+
+        i = bisect.bisect_right(self.starts, start)
+        prev_end = self.starts[i - 1] + self.lengths[i - 1] if i > 0 else None
+        if prev_end is not None and prev_end > start or i < len(self.starts) and self.starts[i] < start + count:
+            raise FATException(f'Clusters {start}..{start + count - 1} are already free')
+
+        merge_prev = prev_end == start
+        merge_next = i < len(self.starts) and self.starts[i] == start + count
+        new_start, new_length = start, count
+        if merge_prev:
+            self._unsized(self.starts[i - 1], self.lengths[i - 1])
+            new_start = self.starts[i - 1]
+            new_length += self.lengths[i - 1]
+        if merge_next:
+            self._unsized(self.starts[i], self.lengths[i])
+            new_length += self.lengths[i]
+        self._sized(new_start, new_length)
+        if merge_prev and merge_next:
+            self.lengths[i - 1] += count + self.lengths[i]
+            del self.starts[i]
+            del self.lengths[i]
+        elif merge_prev:
+            self.lengths[i - 1] += count
+        elif merge_next:
+            self.starts[i] = start
+            self.lengths[i] += count
+        else:
+            self.starts.insert(i, start)
+            self.lengths.insert(i, count)
+        self.free_count += count
+
+    def release_many(self, numbers: Iterable[int]):
+        """Free a batch of clusters, consecutive numbers are released as one extent
+        """
+        for start, length in group_consecutive(sorted(numbers)):
+            self.release(start, length)
+
+    def _extents_from(self, goal: int):
+        """Iterate over extents as (start, length) pairs beginning with the one at/after `goal`
+        and wrapping around to the beginning of the region
+        """
+        total = len(self.starts)
+        i = bisect.bisect_right(self.starts, goal) - 1
+        if i >= 0 and goal < self.starts[i] + self.lengths[i]:
+            # the goal is inside of the extent: use its part from the goal first
+            yield goal, self.starts[i] + self.lengths[i] - goal
+            for k in range(1, total):
+                j = (i + k) % total
+                yield self.starts[j], self.lengths[j]
+            if goal > self.starts[i]:
+                yield self.starts[i], goal - self.starts[i]
+        else:
+            for k in range(total):
+                j = (i + 1 + k) % total
+                yield self.starts[j], self.lengths[j]
+
+    def best_fit(self, count: int, goal: int) -> Optional[int]:
+        """Start of the smallest extent which fits `count` clusters (the first one at/after `goal`
+        among equal ones, wrapping around to the beginning of the region)
+        """
+        i = bisect.bisect_left(self.by_size, (count, -1))
+        if i == len(self.by_size):
+            return None
+        length = self.by_size[i][0]
+        j = bisect.bisect_left(self.by_size, (length, goal), i)
+        if j == len(self.by_size) or self.by_size[j][0] != length:
+            j = i
+        return self.by_size[j][1]
+
+    def allocate(self, count: int, goal: int=None, contiguous: bool=False, best_fit: bool=False) -> List[int]:
+        """Take `count` free clusters as close after `goal` as possible.
+
+        One contiguous extent is preferred: the one starting right at a given `goal` if it's big enough,
+        otherwise the first one after `goal` which fits (next-fit) or the smallest one which fits
+        (`best_fit`, it keeps big extents for big files). If there is no such extent the clusters
+        are gathered from the following extents (unless `contiguous` is required).
+        """
+        if count <= 0:
+            return []
+        if count > self.free_count:
+            raise FATException('There is no free space')
+        given_goal = goal is not None and self.first <= goal < self.last
+        if not given_goal:
+            goal = self.first
+
+        start = None
+        i = self._locate(goal) if given_goal else None
+        if i is not None and self.starts[i] + self.lengths[i] - goal >= count:
+            # continue right from the goal (e.g. after the last cluster of a file)
+            start = goal
+        elif best_fit:
+            start = self.best_fit(count, goal)
+        else:
+            start = next((start for start, length in self._extents_from(goal) if length >= count), None)
+        if start is not None:
+            self.take(start, count)
+            return list(range(start, start + count))
+        if contiguous:
+            raise FATException(f'There is no contiguous free space for {count} clusters')
+
+        taken = []
+        remaining = count
+        for start, length in self._extents_from(goal):
+            length = min(length, remaining)
+            taken.append((start, length))
+            remaining -= length
+            if not remaining:
+                break
+        numbers = []
+        for start, length in taken:
+            self.take(start, length)
+            numbers.extend(range(start, start + length))
+        return numbers
@@ -0,0 +1,265 @@
+"""Benchmarks of the FAT operations on a generated volume
+
+    $ python -m fat.bench --files 2000 --fanout 4 --depth 3 --fragmentation 0.3 --output bench.json
+    $ python -m fat.bench --files 2000 --fanout 4 --depth 3 --fragmentation 0.3 --compare bench.json
+
+The volume is built in a temporary directory from a seeded random generator, so runs with
+the same parameters do the same work. Every phase reports ops/sec, MB/s (if it moves data) and
+the peak of memory allocated by Python during the phase (tracemalloc, it slows the phases down
+a bit, `--no-memory` disables it). Results are saved as JSON together with the parameters and
+the git commit, `--compare` prints the change of every phase against a saved file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from fat import constants as const
+from fat.core import FAT
+from fat.defrag import analyze
+from fat.file import File
+from fat.utils import parse_size
+
+RANDOM_READ_SIZE = 4096  # bytes
+
+
+class Phase:
+    """Measurements of one benchmark phase
+    """
+
+    def __init__(self, name: str):
+        self.name = name          # type: str
+        self.ops = 0              # type: int
+        self.bytes = 0            # type: int
+        self.seconds = 0.0        # type: float
+        self.peak_memory = None   # type: int
+
+    def result(self) -> dict:
+        result = {
+            'ops': self.ops,
+            'seconds': self.seconds,
+            'ops_per_sec': self.ops / self.seconds if self.seconds else 0,
+        }
+        if self.bytes:
+            result['bytes'] = self.bytes
+            result['mb_per_sec'] = self.bytes / self.seconds / 2**20 if self.seconds else 0
+        if self.peak_memory is not None:
+            result['peak_memory_kb'] = self.peak_memory // 1024
+        return result
+
+
+class Benchmark:
+    """Builds a volume by the parameters and times operations on it
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args                            # type: argparse.Namespace
+        self.random = random.Random(args.seed)      # type: random.Random
+        self.phases = []                            # type: List[Phase]
+        self.dirs = []                              # type: List[str]
+        self.files = []                             # type: List[str]
+        self.volume = {}                            # type: dict  # state of the built volume
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Phase]:
+        phase = Phase(name)
+        if self.args.memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds = time.perf_counter() - started
+            if self.args.memory:
+                phase.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.phases.append(phase)
+
+    def tree(self) -> List[str]:
+        """Directory paths: `fanout` subdirectories in every directory up to `depth` levels
+        """
+        dirs = []
+        level = ['']
+        for depth in range(self.args.depth):
+            level = [f'{parent}/d{depth}x{i}' for parent in level for i in range(self.args.fanout)]
+            dirs.extend(level)
+        return dirs
+
+    def run(self) -> Dict[str, dict]:
+        args = self.args
+        fat = FAT.format(args.volume_size, args.cluster_size, cache_size=args.cache_size,
+                         journal=args.journal, sync_commit=args.sync_commit)
+        self.dirs = self.tree()
+        leaves = [path for path in self.dirs if path.count('/') == args.depth] or ['']
+        self.files = [f'{self.random.choice(leaves)}/f{i}.bin' for i in range(args.files)]
+        payload = bytes(range(256)) * (args.file_size // 256 + 1)
+        # the fragmented share of files grows cluster by cluster in turns, so their chains interleave,
+        # other files are created with their sizes
+        fragmented = self.files[:int(len(self.files) * args.fragmentation)]
+
+        with self.phase('create') as phase:
+            for path in self.dirs:
+                fat.create_file(path, is_dir=True)
+            for path in fragmented:
+                fat.create_file(path)
+            for path in self.files[len(fragmented):]:
+                fat.create_file(path, size=args.file_size)
+            phase.ops = len(self.dirs) + len(self.files)
+
+        with self.phase('sequential_write') as phase, fat.volume:
+            for path in self.files[len(fragmented):]:
+                fat.write_file(fat.find_file(path), payload[:args.file_size])
+            streams = [File.open(fat, path, 'r+') for path in fragmented]
+            for offset in range(0, args.file_size, fat.cluster_size):
+                for stream in streams:
+                    stream.write(payload[offset:min(offset + fat.cluster_size, args.file_size)])
+            phase.ops = len(self.files)
+            phase.bytes = len(self.files) * args.file_size
+        report = analyze(fat)
+        self.volume = {
+            'fragmentation_score': report['score'],
+            'fragmented_files': report['fragmented_files'],
+            'free_clusters': report['free_clusters'],
+        }
+
+        with self.phase('find_free_cluster') as phase:
+            for _ in range(args.lookups):
+                fat.find_free_cluster(self.random.randrange(const.FAT_CLUSTER_TO_USE_FROM, fat.max_clusters))
+            phase.ops = args.lookups
+
+        lookups = [self.random.choice(self.files) for _ in range(args.lookups)]
+        with self.phase('lookup') as phase:
+            for path in lookups:
+                fat.find_file(path)
+            phase.ops = len(lookups)
+
+        with self.phase('sequential_read') as phase, fat.volume:
+            for path in self.files:
+                phase.bytes += len(fat.read_file(fat.find_file(path)))
+            phase.ops = len(self.files)
+
+        reads = [(self.random.choice(self.files), self.random.randrange(max(1, args.file_size - RANDOM_READ_SIZE)))
+                 for _ in range(args.lookups)]
+        with self.phase('random_read') as phase, fat.volume:
+            for path, offset in reads:
+                stream = File.open(fat, path)
+                stream.seek(offset)
+                phase.bytes += len(stream.read(RANDOM_READ_SIZE))
+            phase.ops = len(reads)
+
+        with self.phase('save') as phase:
+            fat.save()
+            phase.ops = 1
+        fat.close()
+
+        with self.phase('load') as phase:
+            fat = FAT(cache_size=args.cache_size)
+            fat.free_count
+            phase.ops = 1
+        fat.close()
+
+        return {phase.name: phase.result() for phase in self.phases}
+
+
+def git_commit() -> str or None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Run the benchmark on a volume in a temporary directory
+    """
+    data_path = const.DATA_PATH
+    with tempfile.TemporaryDirectory() as const.DATA_PATH:
+        try:
+            benchmark = Benchmark(args)
+            results = benchmark.run()
+        finally:
+            const.DATA_PATH = data_path
+    params = {name: value for name, value in vars(args).items() if name not in ('output', 'compare')}
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'params': params,
+        'volume': benchmark.volume,
+        'results': results,
+    }
+
+
+def compare(report: dict, baseline: dict) -> List[str]:
+    """Lines with the change of throughput of every phase against a baseline report
+    """
+    lines = []
+    if report['params'] != baseline['params']:
+        lines.append('warning: the baseline was run with other parameters')
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if not old or not old['ops_per_sec']:
+            continue
+        change = (result['ops_per_sec'] / old['ops_per_sec'] - 1) * 100
+        lines.append(f'{name:20} {old["ops_per_sec"]:12.1f} -> {result["ops_per_sec"]:12.1f} ops/sec ({change:+.1f}%)')
+    return lines
+
+
+def format_results(results: Dict[str, dict]) -> List[str]:
+    lines = []
+    for name, result in results.items():
+        line = f"{name:20} {result['ops']:8} ops {result['seconds']:8.3f}s {result['ops_per_sec']:12.1f} ops/sec"
+        if 'mb_per_sec' in result:
+            line += f" {result['mb_per_sec']:9.1f} MB/s"
+        if 'peak_memory_kb' in result:
+            line += f" peak {result['peak_memory_kb']} KB"
+        lines.append(line)
+    return lines
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add = parser.add_argument
+
+    add('--files', type=int, default=1000, help='number of files')
+    add('--file-size', type=parse_size, default=16 * 2**10, help='bytes per file')
+    add('--fanout', type=int, default=4, help='subdirectories per directory')
+    add('--depth', type=int, default=2, help='levels of directories (files are in the deepest ones)')
+    add('--fragmentation', type=float, default=0.0, help='share of files written with interleaved chains')
+    add('--lookups', type=int, default=1000, help='number of lookups and random reads')
+    add('--volume-size', type=parse_size, default=256 * 2**20, help='bytes')
+    add('--cluster-size', type=parse_size, default=4096, help='bytes')
+    add('--cache-size', type=parse_size, default=0, help='cluster cache size, 0 disables the cache')
+    add('--journal', action='store_true', help='log metadata changes to the journal')
+    add('--sync-commit', action='store_true', help='commit the journal after every operation (with --journal)')
+    add('--seed', type=int, default=0)
+    add('--no-memory', dest='memory', action='store_false', help="don't measure peak memory")
+    add('--output', help='save results to a JSON file')
+    add('--compare', help='compare results with a saved JSON file')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    report = run(args)
+    print('\n'.join(format_results(report['results'])))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(report, json.load(f))), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
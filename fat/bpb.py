@@ -0,0 +1,191 @@
+"""BIOS Parameter Block: geometry of the volume
+
+It's stored in the first sector of the volume with the FAT32 layout (only the fields used here
+are filled). The volume consists of:
+- reserved region: the BPB sector and the FS Information Sector, rounded up to a cluster
+- FAT region: `fat_count` copies of the table, every one is rounded up to whole clusters
+- data region: clusters #2, #3, ... (cluster #2 is the root directory)
+
+With the default geometry (see `BPB.default()`) clusters are at `number * cluster_size`,
+as they were on volumes written before the BPB was used.
+"""
+
+import struct
+from typing import Optional
+
+from fat import constants as const
+from fat.exceptions import FATException
+from fat.table import ENTRY_SIZE
+
+
+class BPB:
+    """BIOS Parameter Block
+    """
+
+    # jump, OEM name, bytes per sector, sectors per cluster, reserved sectors, number of FATs,
+    # root entries (FAT12/16), total sectors (16 bit), media, sectors per FAT (FAT12/16),
+    # sectors per track, heads, hidden sectors, total sectors, sectors per FAT, flags, version, root cluster,
+    # FS Information Sector, backup boot sector
+    FORMAT = struct.Struct('<3s8sHBHBHHBHHHIIIHHIHH')
+    SIGNATURE = b'\x55\xaa'
+    SIGNATURE_OFFSET = 0x1FE
+
+    JUMP = b'\xeb\x58\x90'
+    OEM_NAME = b'PYFAT'
+    MEDIA = 0xF8
+
+    def __init__(self, bytes_per_sector: int, sectors_per_cluster: int, reserved_sectors: int,
+                 fat_count: int, total_sectors: int, sectors_per_fat: int, root_cluster: int=const.ROOT_FILE_NUM,
+                 fsinfo_sector: int=1):
+        self.bytes_per_sector = bytes_per_sector        # type: int
+        self.sectors_per_cluster = sectors_per_cluster  # type: int
+        self.reserved_sectors = reserved_sectors        # type: int
+        self.fat_count = fat_count                      # type: int
+        self.total_sectors = total_sectors              # type: int
+        self.sectors_per_fat = sectors_per_fat          # type: int
+        self.root_cluster = root_cluster                # type: int
+        self.fsinfo_sector = fsinfo_sector              # type: int  # 0 if there is no FS Information Sector
+
+    @classmethod
+    def new(cls, size: int, cluster_size: int, sector_size: int=const.SECTOR_SIZE, fat_count: int=1) -> 'BPB':
+        """Geometry of a new volume of `size` bytes
+        """
+        if sector_size not in (512, 1024, 2048, 4096):
+            raise FATException(f'Unsupported sector size: {sector_size}')
+        sectors_per_cluster, rest = divmod(cluster_size, sector_size)
+        if rest or sectors_per_cluster not in (1, 2, 4, 8, 16, 32, 64, 128):
+            raise FATException(f'Cluster size has to be a power of two from 1 to 128 sectors: {cluster_size}')
+
+        total_sectors = size // sector_size
+        if total_sectors > 0xFFFFFFFF:
+            raise FATException(f'Volume is too big: {size} bytes')
+        # one entry for every cluster of the volume is a bit more than needed for the data region
+        fat_clusters = -(-(total_sectors // sectors_per_cluster) * ENTRY_SIZE // cluster_size)
+        bpb = cls(
+            bytes_per_sector=sector_size,
+            sectors_per_cluster=sectors_per_cluster,
+            # the BPB and FS Information sectors
+            reserved_sectors=max(sectors_per_cluster, 2),
+            fat_count=fat_count,
+            total_sectors=total_sectors,
+            sectors_per_fat=fat_clusters * sectors_per_cluster,
+        )
+        if bpb.cluster_count - 1 > const.FAT_ENTRY_CLUSTER_MAX:
+            raise FATException(f'Too many clusters: {bpb.cluster_count}, use bigger clusters')
+        if bpb.cluster_count <= const.FAT_CLUSTER_TO_USE_FROM:
+            raise FATException(f'Volume is too small: {size} bytes')
+        return bpb
+
+    @classmethod
+    def default(cls) -> 'BPB':
+        return cls.new(const.TOTAL_SECTORS * const.SECTOR_SIZE, const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE)
+
+    @classmethod
+    def parse(cls, data: bytes) -> 'BPB' or None:
+        """Read the BPB from the first sector of a volume, None if there is no BPB
+        """
+        if data[cls.SIGNATURE_OFFSET:cls.SIGNATURE_OFFSET + len(cls.SIGNATURE)] != cls.SIGNATURE:
+            return None
+        (_, _, bytes_per_sector, sectors_per_cluster, reserved_sectors, fat_count, _, _, _, _, _, _, _,
+         total_sectors, sectors_per_fat, _, _, root_cluster, fsinfo_sector, _) = cls.FORMAT.unpack_from(data)
+        if not bytes_per_sector or not sectors_per_cluster or not fat_count:
+            raise FATException('Incorrect BPB')
+        return cls(bytes_per_sector, sectors_per_cluster, reserved_sectors, fat_count,
+                   total_sectors, sectors_per_fat, root_cluster, fsinfo_sector)
+
+    def serialize(self) -> bytes:
+        sector = bytearray(self.bytes_per_sector)
+        self.FORMAT.pack_into(
+            sector, 0, self.JUMP, self.OEM_NAME, self.bytes_per_sector, self.sectors_per_cluster,
+            self.reserved_sectors, self.fat_count, 0, 0, self.MEDIA, 0, 0, 0, 0,
+            self.total_sectors, self.sectors_per_fat, 0, 0, self.root_cluster, self.fsinfo_sector, 0,
+        )
+        sector[self.SIGNATURE_OFFSET:self.SIGNATURE_OFFSET + len(self.SIGNATURE)] = self.SIGNATURE
+        return bytes(sector)
+
+    @property
+    def cluster_size(self) -> int:
+        return self.bytes_per_sector * self.sectors_per_cluster
+
+    @property
+    def volume_size(self) -> int:
+        return self.bytes_per_sector * self.total_sectors
+
+    @property
+    def fsinfo_offset(self) -> Optional[int]:
+        """Position of the FS Information Sector, None if there is no one
+        """
+        return self.fsinfo_sector * self.bytes_per_sector if self.fsinfo_sector else None
+
+    @property
+    def fat_offset(self) -> int:
+        """Position of the (first) FAT in the volume
+        """
+        return self.reserved_sectors * self.bytes_per_sector
+
+    def fat_copy_offset(self, copy: int) -> int:
+        """Position of the FAT copy #`copy` (0 is the first one) in the volume
+        """
+        return (self.reserved_sectors + copy * self.sectors_per_fat) * self.bytes_per_sector
+
+    @property
+    def data_offset(self) -> int:
+        """Position of the data region (cluster #2) in the volume
+        """
+        return (self.reserved_sectors + self.fat_count * self.sectors_per_fat) * self.bytes_per_sector
+
+    @property
+    def cluster_offset(self) -> int:
+        """Position cluster #0 would have: cluster N is at `cluster_offset + N * cluster_size`
+        """
+        return self.data_offset - const.FAT_ENTRY_CLUSTER_MIN * self.cluster_size
+
+    @property
+    def cluster_count(self) -> int:
+        """Number of FAT entries: 2 reserved ones and one for every cluster of the data region
+        """
+        data_sectors = self.total_sectors - self.data_offset // self.bytes_per_sector
+        return min(
+            data_sectors // self.sectors_per_cluster + const.FAT_ENTRY_CLUSTER_MIN,
+            self.sectors_per_fat * self.bytes_per_sector // ENTRY_SIZE,
+        )
+
+
+class FSInfo:
+    """FS Information Sector: the number of free clusters and the last allocated cluster.
+
+    Both values are hints kept up to date by allocations (`UNKNOWN` if they aren't known),
+    they let to get the free space without reading the whole FAT and to continue allocating
+    from the last allocated cluster.
+    """
+
+    LEAD_SIGNATURE = b'RRaA'
+    STRUCT_SIGNATURE = b'rrAa'
+    TRAIL_SIGNATURE = b'\x00\x00\x55\xaa'
+    # struct signature, free clusters, last allocated cluster
+    FORMAT = struct.Struct('<4sII')
+    FORMAT_OFFSET = 0x1E4
+    TRAIL_OFFSET = 0x1FC
+
+    UNKNOWN = 0xFFFFFFFF
+
+    def __init__(self, free_count: int=UNKNOWN, last_allocated: int=UNKNOWN):
+        self.free_count = free_count          # type: int
+        self.last_allocated = last_allocated  # type: int
+
+    @classmethod
+    def parse(cls, data: bytes) -> 'FSInfo':
+        """Read the sector, the values are unknown if it has no signatures
+        """
+        struct_signature, free_count, last_allocated = cls.FORMAT.unpack_from(data, cls.FORMAT_OFFSET)
+        if (data[:len(cls.LEAD_SIGNATURE)] != cls.LEAD_SIGNATURE or struct_signature != cls.STRUCT_SIGNATURE
+                or data[cls.TRAIL_OFFSET:cls.TRAIL_OFFSET + len(cls.TRAIL_SIGNATURE)] != cls.TRAIL_SIGNATURE):
+            return cls()
+        return cls(free_count, last_allocated)
+
+    def serialize(self, sector_size: int=const.SECTOR_SIZE) -> bytes:
+        sector = bytearray(sector_size)
+        sector[:len(self.LEAD_SIGNATURE)] = self.LEAD_SIGNATURE
+        self.FORMAT.pack_into(sector, self.FORMAT_OFFSET, self.STRUCT_SIGNATURE, self.free_count, self.last_allocated)
+        sector[self.TRAIL_OFFSET:self.TRAIL_OFFSET + len(self.TRAIL_SIGNATURE)] = self.TRAIL_SIGNATURE
+        return bytes(sector)
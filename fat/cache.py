@@ -0,0 +1,117 @@
+"""Write-back cache of volume clusters with LRU eviction
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from fat.volume import Volume
+
+
+class ClusterCache:
+    """Keeps recently used clusters in memory.
+
+    Writes only change cached buffers, the changed byte range of every cluster is written
+    back when the cluster is evicted or on `flush()`. A buffer holds as many bytes as
+    the volume file had for the cluster (it can be shorter than a cluster at the end of the file).
+    """
+
+    def __init__(self, volume: Volume, cluster_size: int, max_size: int, offset: int=0):
+        """
+        :param max_size: limit of cached data in bytes
+        :param offset: position of cluster #0 in the volume (see `BPB.cluster_offset`)
+        """
+        self.volume = volume                    # type: Volume
+        self.cluster_size = cluster_size        # type: int
+        self.max_size = max_size                # type: int
+        self.offset = offset                    # type: int
+
+        self.size = 0                           # type: int
+        self.hits = 0                           # type: int
+        self.misses = 0                         # type: int
+
+        self._clusters = OrderedDict()          # type: OrderedDict[int, bytearray]
+        self._dirty = {}                        # type: Dict[int, Tuple[int, int]]  # cluster -> changed range
+        self._lock = threading.RLock()
+
+    def __contains__(self, number: int) -> bool:
+        return number in self._clusters
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self.size,
+            'clusters': len(self._clusters),
+            'dirty': len(self._dirty),
+        }
+
+    def _get(self, number: int) -> bytearray:
+        buffer = self._clusters.get(number)
+        if buffer is not None:
+            self.hits += 1
+            self._clusters.move_to_end(number)
+            return buffer
+
+        self.misses += 1
+        buffer = bytearray(self.volume.read(self.offset + number * self.cluster_size, self.cluster_size))
+        self._put(number, buffer)
+        return buffer
+
+    def _put(self, number: int, buffer: bytearray):
+        self._clusters[number] = buffer
+        self.size += self.cluster_size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size and len(self._clusters) > 1:
+            number, buffer = self._clusters.popitem(last=False)
+            self.size -= self.cluster_size
+            if number in self._dirty:
+                self._write_back(number, buffer)
+
+    def _write_back(self, number: int, buffer: bytearray):
+        start, end = self._dirty.pop(number)
+        self.volume.write(self.offset + number * self.cluster_size + start, buffer[start:end])
+
+    def read(self, number: int) -> bytes:
+        """Cluster content (can be shorter than a cluster at the end of the volume file)
+        """
+        with self._lock:
+            return bytes(self._get(number))
+
+    def write(self, number: int, data: bytes, offset: int=0):
+        """Change cluster content starting from `offset` in the cluster
+        """
+        end = offset + len(data)
+        with self._lock:
+            if offset == 0 and end == self.cluster_size and number not in self._clusters:
+                # the whole cluster is overwritten: no need to read it first
+                self.misses += 1
+                buffer = bytearray(data)
+                self._put(number, buffer)
+            else:
+                buffer = self._get(number)
+                if len(buffer) < offset:
+                    buffer.extend(bytes(offset - len(buffer)))
+                buffer[offset:end] = data
+
+            dirty_start, dirty_end = self._dirty.get(number, (offset, end))
+            self._dirty[number] = (min(dirty_start, offset), max(dirty_end, end))
+
+    def discard(self, number: int):
+        """Drop a cluster from the cache without writing it back
+        """
+        with self._lock:
+            if self._clusters.pop(number, None) is not None:
+                self.size -= self.cluster_size
+            self._dirty.pop(number, None)
+
+    def flush(self):
+        """Write back all changed clusters (in the order of their positions)
+        """
+        if not self._dirty:
+            return
+        with self._lock, self.volume:
+            for number in sorted(self._dirty):
+                self._write_back(number, self._clusters[number])
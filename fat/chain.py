@@ -0,0 +1,67 @@
+"""Offset index of a file's cluster chain
+"""
+
+import bisect
+from typing import Iterable, Iterator, List, Tuple
+
+from fat.utils import group_consecutive
+
+
+class ChainIndex:
+    """Run-length map of logical cluster numbers of a file (0, 1, ...) to physical clusters.
+
+    Finding the cluster under a file offset is a binary search over the runs
+    instead of following the chain from its first cluster.
+    """
+
+    def __init__(self):
+        self.logical_starts = []   # type: List[int]
+        self.physical_starts = []  # type: List[int]
+        self.lengths = []          # type: List[int]
+        self.count = 0             # type: int  # clusters in the chain
+
+    @classmethod
+    def from_chain(cls, chain: Iterable[int]) -> 'ChainIndex':
+        index = cls()
+        index.append(chain)
+        return index
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def last_cluster(self) -> int:
+        return self.physical_starts[-1] + self.lengths[-1] - 1
+
+    def append(self, clusters: Iterable[int]):
+        """Add clusters to the end of the chain
+        """
+        for start, length in group_consecutive(clusters):
+            if self.lengths and self.last_cluster + 1 == start:
+                self.lengths[-1] += length
+            else:
+                self.logical_starts.append(self.count)
+                self.physical_starts.append(start)
+                self.lengths.append(length)
+            self.count += length
+
+    def lookup(self, logical: int) -> int:
+        """Physical cluster of the `logical`-th cluster of the file
+        """
+        if not 0 <= logical < self.count:
+            raise IndexError(f'Cluster #{logical} is out of the chain of {self.count} clusters')
+        i = bisect.bisect_right(self.logical_starts, logical) - 1
+        return self.physical_starts[i] + logical - self.logical_starts[i]
+
+    def runs(self, logical: int, count: int) -> Iterator[Tuple[int, int]]:
+        """Contiguous runs as (physical start, length) covering `count` clusters from the `logical`-th one
+        (less at the end of the chain)
+        """
+        i = bisect.bisect_right(self.logical_starts, logical) - 1
+        while count > 0 and i >= 0 and logical < self.count:
+            skip = logical - self.logical_starts[i]
+            length = min(self.lengths[i] - skip, count)
+            yield self.physical_starts[i] + skip, length
+            logical += length
+            count -= length
+            i += 1
@@ -1,27 +1,226 @@
+import sys
+from contextlib import nullcontext
+
+from fat import constants as const
+from fat import defrag as defragmentation
+from fat import fsck as consistency
+from fat import transfer
 from fat.core import FAT
+from fat.shell import Shell
+
+# set by `--stats`: volumes opened by actions collect statistics, they are printed by `print_stats()`
+collect_stats = False
+_opened = []
+
+
+def open_fat(**kwargs) -> FAT:
+    fat = FAT(stats=collect_stats, **kwargs)
+    if collect_stats:
+        _opened.append(fat)
+    return fat
+
+
+def print_stats():
+    """Print statistics of operations of the volumes opened by actions
+    """
+    for fat in _opened:
+        stats = fat.collect_stats()
+        for operation, latency in stats['latency'].items():
+            print(f"{operation:20} {latency['count']:8} calls {latency['total_ms']:10.3f} ms total "
+                  f"p50 {latency['p50_ms']:.3f} ms p99 {latency['p99_ms']:.3f} ms max {latency['max_ms']:.3f} ms",
+                  file=sys.stderr)
+        counters = dict(stats['counters'])
+        for group in ('volume', 'dentry_cache', 'cluster_cache'):
+            counters.update((f'{group}.{name}', value) for name, value in stats.get(group, {}).items())
+        for name, value in counters.items():
+            print(f'{name:30} {value}', file=sys.stderr)
+
+
+def format_volume(size: int=None, cluster_size: int=None):
+    """Create a new empty volume (the default geometry is used for not set parameters)
+    """
+    size = size or const.TOTAL_SECTORS * const.SECTOR_SIZE
+    cluster_size = cluster_size or const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE
+    with FAT.format(size, cluster_size, stats=collect_stats) as fat:
+        if collect_stats:
+            _opened.append(fat)
+        print(f'{fat.bpb.volume_size} bytes, {fat.max_clusters - const.FAT_CLUSTER_TO_USE_FROM} clusters '
+              f'of {fat.cluster_size} bytes', file=sys.stderr)
+
+
+def df():
+    """Print the size, used and free space of the volume
+    """
+    fat = open_fat()
+    usage = fat.disk_usage()
+    print(f"{usage['total']} bytes, {usage['used']} used, {usage['free']} free "
+          f"({usage['cluster_size']} bytes clusters)")
+    fat.close()
 
 
 def mkdir(path_name: str):
-    with FAT() as fat:
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
         fat.create_file(path_name, is_dir=True)
 
 
-def rmdir(path_name: str):
-    pass
+def rmdir(path_name: str, recursive: bool=False):
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        fat.rmdir(path_name, recursive=recursive)
 
 
-def touch(path_name: str):
-    with FAT() as fat:
-        fat.create_file(path_name)
+def rm(path_name: str):
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        fat.unlink(path_name)
+
+
+def truncate(path_name: str, size: int):
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        fat.truncate(fat.find_file(path_name), size)
+
+
+def touch(path_name: str, size: int=None):
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        fat.create_file(path_name, size=size)
 
 
 def write(path_name: str, data: str):
-    with FAT() as fat:
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
         file_number = fat.find_file(path_name)
         fat.write_file(file_number, data.encode())
 
 
 def read(path_name: str):
-    fat = FAT()
+    fat = open_fat(cache_size=const.CACHE_SIZE)
     file_number = fat.find_file(path_name)
     print(fat.read_file(file_number).decode())
+
+
+def ls(path_name: str='/', recursive: bool=False):
+    """Print names in a directory (`/` is appended to directories), full paths of its whole tree if `recursive`
+    """
+    fat = open_fat()
+    with fat.volume:
+        for entry in fat.walk(path_name) if recursive else fat.scandir(path_name):
+            name = entry.path if recursive else entry.name
+            print(f'{name}/' if entry.is_dir() else name)
+    fat.close()
+
+
+def du(path_name: str='/'):
+    """Print bytes taken by every file and directory in a directory and the total
+    """
+    fat = open_fat()
+    with fat.volume:
+        # the clusters of the directory itself
+        total = fat.stat(path_name)['size']
+        for entry in fat.scandir(path_name):
+            size = fat.du(entry.path)
+            total += size
+            print(f'{size}\t{entry.path}')
+        print(f'{total}\t{path_name}')
+    fat.close()
+
+
+def batch(script_path: str='-'):
+    """Run commands from a script file (`-` for stdin) on one loaded volume, commit once at the end
+    """
+    script = nullcontext(sys.stdin) if script_path == '-' else open(script_path)
+    with script as lines, open_fat(cache_size=const.CACHE_SIZE) as fat:
+        session = Shell(fat)
+        session.run_batch(lines)
+    # throughput includes the final commit
+    session.report()
+
+
+def shell():
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        session = Shell(fat)
+        session.cmdloop()
+    session.report()
+
+
+def import_tree(host_dir: str, vol_path: str):
+    """Copy a host directory tree into the volume
+    """
+    with open_fat(io_mode=const.IOMode.PERSISTENT) as fat:
+        report = transfer.import_tree(fat, host_dir, vol_path)
+    print_transfer_report(report)
+
+
+def export_tree(vol_path: str, host_dir: str):
+    """Copy a volume directory tree to the host
+    """
+    with open_fat(io_mode=const.IOMode.PERSISTENT) as fat:
+        report = transfer.export_tree(fat, vol_path, host_dir)
+    print_transfer_report(report)
+
+
+def print_transfer_report(report: dict):
+    print(
+        f"{report['dirs']} directories, {report['files']} files, {report['bytes']} bytes "
+        f"in {report['seconds']:.3f}s ({report['mb_per_sec']:.1f} MB/s)",
+        file=sys.stderr,
+    )
+
+
+def defrag(analyze_only: bool=False, pause: float=0.0):
+    """Print fragmentation of files and the volume, then move fragmented files into contiguous extents.
+    An interrupted run continues from the last processed file.
+    """
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        report = defragmentation.analyze(fat)
+        for file in report['files']:
+            if file['fragments'] > 1:
+                print(f"{file['path']}: {file['clusters']} clusters in {file['fragments']} fragments "
+                      f"(score {file['score']:.2f})")
+        print_fragmentation_report(report)
+        if analyze_only:
+            return
+
+        defragmenter = defragmentation.Defragmenter(fat, pause=pause)
+        defragmenter.run()
+        print(f'{defragmenter.moved} files ({defragmenter.moved_clusters} clusters) moved', file=sys.stderr)
+        print_fragmentation_report(defragmentation.analyze(fat))
+
+
+def print_fragmentation_report(report: dict):
+    print(
+        f"{report['fragmented_files']} of {len(report['files'])} files fragmented, score {report['score']:.2f}; "
+        f"{report['free_clusters']} free clusters in {report['free_extents']} extents, "
+        f"score {report['free_space_score']:.2f}",
+        file=sys.stderr,
+    )
+
+
+def fsck(repair: bool=False):
+    """Check consistency of the volume and repair it if `repair`, exits with 1 if errors are left
+    """
+    with open_fat(cache_size=const.CACHE_SIZE) as fat:
+        report = consistency.check(fat, repair=repair)
+    print(f"{report['directories']} directories, {report['files']} files, "
+          f"{report['used_clusters']} of {report['clusters']} clusters used ({report['backend']})", file=sys.stderr)
+    for name in ('bad_links', 'free_links', 'cross_linked', 'cycles'):
+        if report[name]:
+            clusters = ', '.join(map(str, report[name][:10])) + (', ...' if len(report[name]) > 10 else '')
+            print(f"{name.replace('_', ' ')}: {len(report[name])} clusters ({clusters})")
+    for entry in report['bad_entries']:
+        print(f"{entry['path']}: {entry['problem']} (cluster {entry['cluster']})")
+    if report['lost_clusters']:
+        print(f"lost: {report['lost_clusters']} clusters in {report['lost_chains']} chains")
+    if report['fsinfo_free_count'] not in (None, report['free_count']):
+        print(f"free count: {report['fsinfo_free_count']} in FSInfo, {report['free_count']} in the FAT")
+
+    errors = report.get('remaining_errors', report['errors'])
+    if 'remaining_errors' in report:
+        print(f"{report['errors']} errors, {errors} left after repair", file=sys.stderr)
+    else:
+        print(f'{errors} errors', file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+
+def serve(socket_path: str):
+    """Keep the volume loaded and serve requests over a Unix socket (see `fat.server`)
+    """
+    from fat.server import serve
+    serve(socket_path)
@@ -0,0 +1,93 @@
+"""Client of the volume server (see `fat.server`)
+
+Requests can be pipelined: every call sends its request right away and waits only for its
+own response, so several calls of one client can be in flight with `asyncio.gather`.
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque
+
+from fat.exceptions import FATException
+from fat.protocol import encode_header, read_chunks, read_header, split_body, write_chunks
+
+
+class Client:
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader                # type: asyncio.StreamReader
+        self._writer = writer                # type: asyncio.StreamWriter
+        self._send_lock = asyncio.Lock()     # type: asyncio.Lock
+        self._pending = deque()              # type: Deque[asyncio.Future]
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, socket_path: str) -> 'Client':
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        return cls(reader, writer)
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._receiver.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _receive(self):
+        """Resolve pending requests with responses in the order they were sent
+        """
+        try:
+            while True:
+                response = await read_header(self._reader)
+                if response is None:
+                    raise ConnectionError('Connection closed by the server')
+                if response.get('body'):
+                    response['data'] = b''.join([chunk async for chunk in read_chunks(self._reader)])
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            while self._pending:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(e)
+
+    async def request(self, op: str, path: str=None, data: bytes=None) -> dict:
+        future = asyncio.get_event_loop().create_future()
+        async with self._send_lock:
+            self._pending.append(future)
+            header = {'op': op, 'path': path, 'body': data is not None}
+            if data is not None:
+                # lets the server reserve clusters for the whole body at once
+                header['size'] = len(data)
+            self._writer.write(encode_header(header))
+            if data is not None:
+                await write_chunks(self._writer, split_body(data))
+            await self._writer.drain()
+
+        response = await future
+        if not response['ok']:
+            raise FATException(response['error'])
+        return response
+
+    async def mkdir(self, path: str):
+        await self.request('mkdir', path)
+
+    async def touch(self, path: str):
+        await self.request('touch', path)
+
+    async def stat(self, path: str) -> dict:
+        return (await self.request('stat', path))['stat']
+
+    async def read(self, path: str) -> bytes:
+        return (await self.request('read', path))['data']
+
+    async def write(self, path: str, data: bytes):
+        await self.request('write', path, data)
+
+    async def commit(self):
+        await self.request('commit')
@@ -1,11 +1,16 @@
 
 DATA_PATH = './fat/data'
 VOLUME_FILENAME = 'volume'
+JOURNAL_FILENAME = 'journal'
 
 SECTOR_SIZE = 0x200  # bytes
 TOTAL_SECTORS = 65536
 SECTORS_PER_CLUSTER = 32  # sectors
 
+CACHE_SIZE = 0x400000  # bytes, cluster cache of CLI commands
+DENTRY_CACHE_SIZE = 1024  # resolved directory paths kept in memory
+JOURNAL_GROUP_SIZE = 0x10000  # bytes of logged records committed at once (unless commits are synchronous)
+
 FAT_ENTRY_EMPTY = 0x00000000
 
 FAT_ENTRY_CLUSTER_MIN = 0x00000002
@@ -30,6 +35,14 @@ class FATType:
     FAT32 = 'fat32'
 
 
+class IOMode:
+    """How the volume file is accessed
+    """
+    DEFAULT = 'default'        # opened for every operation
+    PERSISTENT = 'persistent'  # one descriptor kept open while the FAT is used
+    MMAP = 'mmap'              # the whole volume is mapped into memory
+
+
 class FileAttributes:
     """File Attributes for directory entries
     Length: 1 byte
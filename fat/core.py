@@ -4,34 +4,96 @@ File Allocation Table
 https://en.wikipedia.org/wiki/Design_of_the_FAT_file_system
 https://www.pjrc.com/tech/8051/ide/fat32.html
 
-TODO:
-- use BPB
-- add cache
-- add FS Information Sector
 """
 
 import os
-import struct
-from typing import List
+import threading
+from contextlib import nullcontext
+from array import array
+from typing import Dict, Iterator, List, Set, Tuple
+from weakref import WeakValueDictionary
 
 from fat import constants as const
-from fat.dir import DirectoryTable
+from fat.alloc import FreeSpaceIndex
+from fat.bpb import BPB, FSInfo
+from fat.cache import ClusterCache
+from fat.chain import ChainIndex
+from fat.dentry import DentryCache
+from fat.dir import DirectoryEntry, DirectoryTable, ScanEntry, scan_slots
 from fat.exceptions import FATException
-from fat.utils import split_by_chunks
+from fat.file import File
+from fat.journal import Journal, Write
+from fat.locks import RWLock
+from fat.stats import Stats, timed
+from fat.table import ENTRY_SIZE, MappedTable, entries_from_bytes, entries_to_bytes, new_entries
+from fat.utils import group_consecutive
+from fat.volume import MappedVolume, Volume
 
 
 class FAT:
     """File Allocation Table
+
+    It's safe to share between threads: chain links are guarded by the readers-writer `table_lock`,
+    the free space index (and empty/used state of entries) by `alloc_lock`, and entries of a directory
+    by the lock of its `DirectoryTable`. Locks are taken in this order: directory, table, allocator.
     """
 
-    def __init__(self):
-        self.cluster_size = None                                                                  # type: int
-        self.max_clusters = None                                                                  # type: int
-        self.entries = None                                                                       # type: List[int]
-        self.volume_path = os.path.join(os.path.abspath(const.DATA_PATH), const.VOLUME_FILENAME)  # type: str
+    def __init__(self, mmap_table: bool=False, cache_size: int=0, io_mode: str=const.IOMode.DEFAULT,
+                 dentry_cache_size: int=const.DENTRY_CACHE_SIZE, bpb: BPB=None, deferred_free: bool=False,
+                 stats: bool=False, journal: bool=False, sync_commit: bool=False):
+        """
+        :param mmap_table: map the FAT region of the volume instead of loading it into memory
+            (not with the journal: changed entries of a mapped table could reach the volume before they're committed)
+        :param cache_size: size limit (in bytes) of the write-back cluster cache, 0 disables the cache
+        :param io_mode: how the volume file is accessed, one of `const.IOMode`
+        :param dentry_cache_size: number of resolved directory paths to keep, 0 disables the cache
+        :param bpb: geometry of a new volume if the volume file doesn't exist (`BPB.default()` if not set),
+            the geometry of an existing volume is read from its BPB
+        :param deferred_free: deleting only removes directory entries, clusters of deleted files are freed
+            by `reclaim()` (on save or when the free space runs out)
+        :param stats: collect statistics of operations (see `fat.stats`), it can be enabled later by `stats.enabled`
+        :param journal: log metadata changes to the journal (see `fat.journal`) before they're written in place,
+            a journal left by a crash is replayed on load whether it's enabled or not
+        :param sync_commit: commit the journal at the end of every operation (it's committed when
+            `JOURNAL_GROUP_SIZE` bytes of records are logged otherwise, and by `commit()` and `sync()`)
+        """
+        data_path = os.path.abspath(const.DATA_PATH)
+        self.stats = Stats(stats)                                            # type: Stats
+        self.bpb = bpb                                                       # type: BPB
+        self.fsinfo = None                                                   # type: FSInfo
+        self.cluster_size = None                                             # type: int
+        self.cluster_offset = None                                           # type: int
+        self.sector_size = None                                              # type: int
+        self.max_clusters = None                                             # type: int
+        self.entries = None                                                  # type: array or memoryview
+        self.volume_path = os.path.join(data_path, const.VOLUME_FILENAME)    # type: str
         self.type = const.FATType.FAT32
+        self.mmap_table = mmap_table                                         # type: bool
+        self.io_mode = io_mode                                               # type: str
+        self.volume = None                                                   # type: Volume
+        self.cache_size = cache_size                                         # type: int
+        self.cache = None                                                    # type: ClusterCache
+        self.dentries = DentryCache(dentry_cache_size)                       # type: DentryCache
+        self.chain_indexes = {}                                              # type: Dict[int, ChainIndex]
+        self.table_lock = RWLock()                                           # type: RWLock
+        self.alloc_lock = threading.Lock()                                   # type: threading.Lock
+        self.deferred_free = deferred_free                                   # type: bool
+        self.journal_path = os.path.join(data_path, const.JOURNAL_FILENAME)  # type: str
+        self.journal = None                                                  # type: Journal  # None if it's disabled
+        self.sync_commit = sync_commit                                       # type: bool
 
-        self.root = None                                                                          # type: DirectoryTable
+        self._table = None                                                   # type: MappedTable
+        self._free_space = None                                              # type: FreeSpaceIndex
+        self._dirty_sectors = set()                                          # type: Set[int]
+        self._boot_dirty = False                                             # type: bool  # BPB
+        self._fsinfo_dirty = False                                           # type: bool
+        # (first cluster, is directory) of deleted files which clusters aren't freed yet
+        self._pending_free = []                                              # type: List[Tuple[int, bool]]
+        self._use_journal = journal                                          # type: bool
+        # live directory tables: there is one object per directory to lock and change
+        self._dirs = WeakValueDictionary()                                   # type: Dict[int, DirectoryTable]
+
+        self.root = None                                                     # type: DirectoryTable
 
         self.load()
 
@@ -40,18 +102,211 @@ class FAT:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.save()
+        self.close()
+
+    @classmethod
+    def format(cls, size: int, cluster_size: int, sector_size: int=const.SECTOR_SIZE, fat_count: int=2,
+               **kwargs) -> 'FAT':
+        """Create a new empty volume (the existing one is removed) of `size` bytes and open it,
+        the FAT is mirrored to `fat_count` copies
+        """
+        bpb = BPB.new(size, cluster_size, sector_size, fat_count)
+        volume_path = os.path.join(os.path.abspath(const.DATA_PATH), const.VOLUME_FILENAME)
+        if os.path.isfile(volume_path):
+            os.remove(volume_path)
+        return cls(bpb=bpb, **kwargs)
+
+    def _set_geometry(self, bpb: BPB):
+        self.bpb = bpb
+        self.cluster_size = bpb.cluster_size
+        self.cluster_offset = bpb.cluster_offset
+        self.sector_size = bpb.bytes_per_sector
+        self.max_clusters = bpb.cluster_count
 
     def __create_new(self):
-        self.cluster_size = const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE
-        self.max_clusters = int(const.TOTAL_SECTORS / const.SECTORS_PER_CLUSTER)
-        self.entries = [0x0] * self.max_clusters
+        self._set_geometry(self.bpb or BPB.default())
+        # only the root directory cluster is used
+        self.fsinfo = FSInfo(self.max_clusters - const.FAT_CLUSTER_TO_USE_FROM, const.ROOT_FILE_NUM)
 
-        # create an empty volume
-        open(self.volume_path, 'a').close()
+        # a journal of a removed volume must not be replayed on the new one
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+        # create an empty volume (it grows while it's written)
+        with open(self.volume_path, 'wb') as volume:
+            volume.write(self.bpb.serialize())
+            volume.seek(self.bpb.fsinfo_offset)
+            volume.write(self.fsinfo.serialize(self.sector_size))
+        self._open_volume()
+        self._load_table(new=True)
+        # the FAT region isn't on the disk yet: save it whole
+        self._dirty_sectors.update(range(-(-self.max_clusters * ENTRY_SIZE // self.sector_size)))
 
         # init root dir
-        self.root = DirectoryTable(const.ROOT_FILE_NUM, b'')
-        self.entries[const.ROOT_FILE_NUM] = const.EOC
+        self.root = self._dirs[const.ROOT_FILE_NUM] = DirectoryTable(const.ROOT_FILE_NUM, b'')
+        self.set_entry(const.ROOT_FILE_NUM, const.EOC)
+        if self._use_journal:
+            self.journal = Journal(self.journal_path)
+        # the empty volume is saved right away: it can be opened again even if it's closed without saving
+        # (and changes logged to the journal are replayed onto it)
+        self.sync()
+
+    def _open_volume(self):
+        if self.io_mode == const.IOMode.MMAP:
+            self.volume = MappedVolume(self.volume_path, self.bpb.volume_size)
+        elif self.io_mode in (const.IOMode.DEFAULT, const.IOMode.PERSISTENT):
+            self.volume = Volume(self.volume_path, persistent=self.io_mode == const.IOMode.PERSISTENT)
+        else:
+            raise FATException(f'Unknown io_mode: {self.io_mode}')
+
+        if self.cache_size:
+            self.cache = ClusterCache(self.volume, self.cluster_size, self.cache_size, self.cluster_offset)
+
+    def _load_table(self, new: bool=False):
+        """Load (or map) FAT entries from the FAT region
+        """
+        self._free_space = None
+        self._dirty_sectors.clear()
+        # with the journal changed FAT sectors may be written to the volume only by checkpoints
+        if self.mmap_table and not self._use_journal:
+            self._table = MappedTable(self.volume_path, self.bpb.fat_offset, self.max_clusters)
+            self.entries = self._table.entries
+        elif new:
+            self.entries = new_entries(self.max_clusters)
+        else:
+            self.entries = entries_from_bytes(self.volume.read(self.bpb.fat_offset, self.max_clusters * ENTRY_SIZE))
+
+    def set_entry(self, number: int, value: int):
+        """Change a FAT entry and remember its FAT sector to be saved.
+        The caller has to hold the write `table_lock`.
+        """
+        self.entries[number] = value
+        self._dirty_sectors.add(number * ENTRY_SIZE // self.sector_size)
+        if self.journal is not None:
+            self.journal.log_entry(number, value)
+
+    @property
+    def free_space(self) -> FreeSpaceIndex:
+        """Free space index, built on the first use after the table is loaded
+        """
+        if self._free_space is None:
+            self._free_space = FreeSpaceIndex.from_entries(
+                self.entries, const.FAT_CLUSTER_TO_USE_FROM, self.max_clusters
+            )
+            # the count of FSInfo is a hint: correct it with the exact one
+            if self.fsinfo.free_count != self._free_space.free_count:
+                self.fsinfo.free_count = self._free_space.free_count
+                self._fsinfo_dirty = True
+        return self._free_space
+
+    @property
+    def free_count(self) -> int:
+        """Number of free clusters, it doesn't read the FAT if FSInfo has the count
+        """
+        with self.alloc_lock:
+            if self._free_space is None and self.fsinfo.free_count != FSInfo.UNKNOWN:
+                return self.fsinfo.free_count
+            return len(self.free_space)
+
+    def disk_usage(self) -> dict:
+        """Size, used and free space of the data region in bytes
+        """
+        total = (self.max_clusters - const.FAT_CLUSTER_TO_USE_FROM) * self.cluster_size
+        free = self.free_count * self.cluster_size
+        return {
+            'cluster_size': self.cluster_size,
+            'total': total,
+            'used': total - free,
+            'free': free,
+        }
+
+    def collect_stats(self) -> dict:
+        """Statistics of operations (if `stats` are enabled) together with counters of the volume and caches
+        """
+        stats = self.stats.snapshot()
+        stats['volume'] = {'opens': self.volume.opens}
+        stats['dentry_cache'] = {'hits': self.dentries.hits, 'misses': self.dentries.misses}
+        if self.cache is not None:
+            stats['cluster_cache'] = self.cache.stats()
+        return stats
+
+    def _allocation_start(self) -> int or None:
+        """Cluster after the last allocated one: allocations continue from it instead of
+        searching from the beginning of the data region, which is likely used already
+        """
+        last_allocated = self.fsinfo.last_allocated
+        if const.FAT_ENTRY_CLUSTER_MIN <= last_allocated < self.max_clusters - 1:
+            return last_allocated + 1
+        return None
+
+    def close(self):
+        """Release the mapped FAT region, the journal and the volume file (if they're kept open).
+        Logged metadata changes are committed: they're replayed on the next load if the volume isn't saved.
+        """
+        if self.journal is not None:
+            self.commit()
+            self.journal.close()
+            self.journal = None
+        if self._table is not None:
+            # keep a detached copy of the table, so the instance stays readable
+            self.entries = entries_from_bytes(entries_to_bytes(self.entries))
+            self._table.close()
+            self._table = None
+        self.volume.close()
+
+    def read_cluster(self, number: int) -> bytes:
+        """Read a cluster (through the cache if it's enabled)
+        """
+        position = self.get_cluster_position(number)
+        if self.cache is not None:
+            return self.cache.read(number)
+        return self.volume.read(position, self.cluster_size)
+
+    def read_extent(self, first_cluster: int, offset: int, buffer) -> int:
+        """Read contiguous clusters from `offset` bytes in `first_cluster` into a buffer,
+        returns the number of bytes read (less than the buffer size at the end of the volume file)
+        """
+        view = memoryview(buffer)
+        if self.stats.enabled:
+            self.stats.count('extent.reads')
+            self.stats.count('extent.read_bytes', len(view))
+        if self.cache is None:
+            return self.volume.readinto(self.get_cluster_position(first_cluster) + offset, view)
+
+        size = 0
+        last_cluster = first_cluster + (offset + len(view) - 1) // self.cluster_size
+        for number in range(first_cluster, last_cluster + 1):
+            length = min(self.cluster_size - offset, len(view) - size)
+            chunk = self.read_cluster(number)[offset:offset + length]
+            view[size:size + len(chunk)] = chunk
+            if number < last_cluster and len(chunk) < length:
+                # a cached cluster past the end of the volume file is short, the rest of it is zeros
+                view[size + len(chunk):size + length] = bytes(length - len(chunk))
+                size += length
+            else:
+                size += len(chunk)
+            offset = 0
+        return size
+
+    def write_extent(self, first_cluster: int, offset: int, data: bytes):
+        """Write data to contiguous clusters from `offset` bytes in `first_cluster`
+        """
+        position = self.get_cluster_position(first_cluster)
+        if self.stats.enabled:
+            self.stats.count('extent.writes')
+            self.stats.count('extent.write_bytes', len(data))
+        if self.cache is None:
+            self.volume.write(position + offset, data)
+            return
+
+        view = memoryview(data)
+        written = 0
+        number = first_cluster
+        while written < len(view):
+            chunk = view[written:written + self.cluster_size - offset]
+            self.cache.write(number, chunk, offset)
+            written += len(chunk)
+            number += 1
+            offset = 0
 
     def is_cluster_number(self, number: int):
         """Check whether a number it's a valid cluster number
@@ -63,7 +318,7 @@ class FAT:
         """
         if not self.is_cluster_number(number):
             raise FATException('Incorrect cluster position')
-        return self.cluster_size * number
+        return self.cluster_offset + self.cluster_size * number
 
     def find_free_cluster(self, start_index: int=const.FAT_CLUSTER_TO_USE_FROM) -> int or const.EOF:
         """Try to find a free cluster, returns EOF if no any
@@ -71,11 +326,69 @@ class FAT:
         if not self.is_cluster_number(start_index):
             raise FATException('Incorrect cluster position')
 
-        for index, entry in enumerate(self.entries[start_index:], start=start_index):
-            if entry == const.FAT_ENTRY_EMPTY:
-                return index
-        return const.EOF
+        with self.alloc_lock:
+            index = self.free_space.find(start_index)
+        return const.EOF if index is None else index
 
+    @timed('allocate_clusters')
+    def allocate_clusters(self, count: int, goal: int=None, best_fit: bool=False,
+                          contiguous: bool=False) -> List[int]:
+        """Allocate `count` clusters (contiguous if possible) near `goal` and link them into a chain,
+        see `FreeSpaceIndex.allocate`. Without `goal` the next-fit search starts after the last allocated cluster.
+        """
+        try:
+            numbers = self._take_clusters(count, goal, best_fit, contiguous)
+        except FATException:
+            # clusters of deleted files can be enough
+            if not self.reclaim():
+                raise
+            numbers = self._take_clusters(count, goal, best_fit, contiguous)
+        # the clusters are reserved in the index already: link them without holding the allocator
+        with self.table_lock.write:
+            for number, next_number in zip(numbers, numbers[1:]):
+                self.set_entry(number, next_number)
+            if numbers:
+                self.set_entry(numbers[-1], const.EOC)
+        if self.stats.enabled:
+            self.stats.count('allocate_clusters.clusters', len(numbers))
+        return numbers
+
+    def _take_clusters(self, count: int, goal: int, best_fit: bool, contiguous: bool) -> List[int]:
+        with self.alloc_lock:
+            if goal is None and not best_fit:
+                goal = self._allocation_start()
+            numbers = self.free_space.allocate(count, goal, contiguous=contiguous, best_fit=best_fit)
+            if numbers:
+                self.fsinfo.free_count = len(self.free_space)
+                self.fsinfo.last_allocated = numbers[-1]
+                self._fsinfo_dirty = True
+        return numbers
+
+    @timed('free_clusters')
+    def free_clusters(self, numbers: List[int]):
+        """Mark clusters as empty and return them to the free space index
+        """
+        with self.table_lock.write:
+            if self.journal is not None:
+                # directory slots of the clusters which aren't written yet must not go over their next owners
+                self.journal.revoke(numbers)
+            with self.alloc_lock:
+                # the index has to be built before the entries are cleared
+                free_space = self.free_space
+                for number in numbers:
+                    self.set_entry(number, const.FAT_ENTRY_EMPTY)
+                # changes of freed clusters must not be written back over their next owners:
+                # they're dropped before the clusters can be allocated again
+                if self.cache is not None:
+                    for number in numbers:
+                        self.cache.discard(number)
+                free_space.release_many(numbers)
+                self.fsinfo.free_count = len(free_space)
+                self._fsinfo_dirty = True
+        if self.stats.enabled:
+            self.stats.count('free_clusters.clusters', len(numbers))
+
+    @timed('find_dir')
     def find_dir(self, path: str) -> DirectoryTable or None:
         if not path.startswith('/'):
             raise FATException('path has to be absolute.')
@@ -83,179 +396,661 @@ class FAT:
         if len(path.strip()) == 1:
             return self.root
 
-        _, *dirs = path.split('/')
-        current_dir = self.root
-        for directory in dirs:
-            for dir_entry in current_dir.entries:
-                if dir_entry.is_dir() and dir_entry.filename == directory:
-                    current_dir = self.read_dir(dir_entry.first_file_cluster)
-                    break
+        path = path.rstrip('/')
+
+        # start from the deepest cached directory of the path
+        cached_path = path
+        while cached_path:
+            current_dir = self.dentries.get(cached_path)
+            if current_dir is not None:
+                break
+            cached_path = cached_path.rpartition('/')[0]
+        else:
+            current_dir = self.root
+
+        current_path = cached_path
+        for directory in path[len(cached_path):].split('/')[1:]:
+            current_path += f'/{directory}'
+            dir_entry = current_dir.find_dir_entry(directory)
             # directory doesn't have the next subdirectory in the path
-            else:
+            if dir_entry is None:
                 return None
+            if self.stats.enabled:
+                self.stats.count('find_dir.read_dir')
+            current_dir = self.read_dir(dir_entry.first_file_cluster)
+            self.dentries.put(current_path, current_dir)
 
         return current_dir
 
-    def find_file(self, path: str) -> int:
+    def find_parent(self, path: str) -> Tuple[DirectoryTable, str, str]:
+        """Directory of a file or directory by its path and the filename and extension of it
+        """
         dirname, fullname = os.path.split(path)
         file_dir = self.find_dir(dirname)
         if file_dir is None:
             raise FATException(f'{path} directory does not exist')
 
         filename, extension = os.path.splitext(fullname)
-        extension = extension.lstrip('.')
+        return file_dir, filename, extension.lstrip('.')
 
+    def find_entry(self, path: str) -> DirectoryEntry:
+        """Directory entry of a file or directory by its path
+        """
+        file_dir, filename, extension = self.find_parent(path)
         file_dir_entry = file_dir.find_entry(filename, extension)
         if not file_dir_entry:
             raise FATException(f'{path} file does not exist')
+        return file_dir_entry
 
+    def find_file(self, path: str) -> int:
+        file_dir_entry = self.find_entry(path)
         if file_dir_entry.is_dir():
             raise FATException(f'{path} is a directory. Use `find_dir` instead.')
 
         return file_dir_entry.first_file_cluster
 
-    def read_file(self, file_number: int) -> bytearray:
+    def stat(self, path: str) -> dict:
+        """Basic information about a file or directory
+        """
+        if path.rstrip('/') == '':
+            entry_cluster, is_dir = const.ROOT_FILE_NUM, True
+        else:
+            entry = self.find_entry(path)
+            entry_cluster, is_dir = entry.first_file_cluster, entry.is_dir()
+        return {
+            'path': path,
+            'cluster': entry_cluster,
+            'is_dir': is_dir,
+            'size': len(self.get_chain_index(entry_cluster)) * self.cluster_size,
+        }
+
+    def get_cluster_chain(self, file_number: int, limit: int=None) -> List[int]:
+        """Cluster numbers of a file in the chain order (the first `limit` of them if it's set)
+        """
         if not self.is_cluster_number(file_number):
             raise FATException(f'Incorrect file_number: {file_number}')
 
-        file_content = bytearray()
-
+        chain = []
         fat_number = file_number
-        with open(self.volume_path, 'rb') as volume:
-            while self.is_cluster_number(fat_number):
+        with self.table_lock.read:
+            while self.is_cluster_number(fat_number) and (limit is None or len(chain) < limit):
                 fat_entry = self.entries[fat_number]
                 if fat_entry == const.FAT_ENTRY_EMPTY:
                     raise FATException(f'Cluster is empty for the fat_number={fat_number}, file_number={file_number}')
-
-                # read cluster data
-                cluster_position = self.get_cluster_position(fat_number)
-                volume.seek(cluster_position)
-                cluster_value = volume.read(self.cluster_size)
-                file_content.extend(cluster_value)
-
+                chain.append(fat_number)
                 # go to the next cluster in the chain
                 fat_number = fat_entry
+        if self.stats.enabled:
+            self.stats.count('chain.walks')
+            self.stats.count('chain.hops', len(chain))
+        return chain
+
+    def get_chain_index(self, file_number: int) -> ChainIndex:
+        """Offset index of a file's chain, built on the first use and kept until the chain is reallocated
+        """
+        index = self.chain_indexes.get(file_number)
+        if index is None:
+            index = self.chain_indexes[file_number] = ChainIndex.from_chain(self.get_cluster_chain(file_number))
+        return index
 
+    @timed('read_file')
+    def read_file(self, file_number: int) -> bytearray:
+        chain = self.get_cluster_chain(file_number)
+        file_content = bytearray(len(chain) * self.cluster_size)
+        view = memoryview(file_content)
+
+        # read every run of contiguous clusters at once straight into the content buffer
+        size = 0
+        with self.volume:
+            for first_cluster, count in group_consecutive(chain):
+                size += self.read_extent(first_cluster, 0, view[size:size + count * self.cluster_size])
+        view.release()
+
+        # clusters after the end of the volume file are not read
+        del file_content[size:]
+        if self.stats.enabled:
+            self.stats.count('read_file.bytes', size)
+            self.stats.count('read_file.clusters', len(chain))
         return file_content
 
+    def read_file_view(self, file_number: int) -> memoryview:
+        """File content as a memoryview, it's zero-copy for a contiguous file on a mapped volume.
+        The view has to be released before the FAT is closed.
+        """
+        chain = self.get_cluster_chain(file_number)
+        runs = list(group_consecutive(chain))
+        if len(runs) == 1 and self.cache is None:
+            return self.volume.view(self.get_cluster_position(file_number), len(chain) * self.cluster_size)
+        return memoryview(self.read_file(file_number))
+
+    @timed('read_dir')
     def read_dir(self, entry_number: int) -> DirectoryTable:
-        file_content = self.read_file(entry_number)
-        directory = DirectoryTable(entry_number, file_content)
-        return directory
+        """Directory table by its cluster, a live table of the directory is returned if there is one
+        """
+        directory = self._dirs.get(entry_number)
+        if directory is not None:
+            if self.stats.enabled:
+                self.stats.count('read_dir.live')
+            return directory
 
-    def create_file(self, path: str, is_dir=False) -> int:
-        """Create a new file or directory
+        if self.stats.enabled:
+            self.stats.count('read_dir.disk')
+        with self.read_file_view(entry_number) as file_content:
+            directory = DirectoryTable(entry_number, file_content)
+        # another thread could have read the same directory meanwhile
+        return self._dirs.setdefault(entry_number, directory)
+
+    def scandir(self, path: str, cluster_number: int=None) -> Iterator[ScanEntry]:
+        """Entries of a directory in the order of slots. They are parsed cluster by cluster until
+        the end of directory, without building a directory table (a live one is used if there is one).
+        The path isn't resolved if the `cluster_number` of the directory is given.
         """
-        dirname, fullname = os.path.split(path)
+        if cluster_number is None and path.rstrip('/'):
+            entry = self.find_entry(path)
+            if not entry.is_dir():
+                raise FATException(f'{path} is not a directory')
+            cluster_number = entry.first_file_cluster
+        elif cluster_number is None:
+            cluster_number = const.ROOT_FILE_NUM
 
-        file_dir = self.find_dir(dirname)
-        if file_dir is None:
-            raise FATException(f'{path} directory does not exist')
+        directory = self._dirs.get(cluster_number)
+        if directory is not None:
+            for entry in list(directory.entries):
+                if not entry.is_deleted:
+                    yield ScanEntry.from_entry(path, entry)
+            return
 
-        filename, extension = os.path.splitext(fullname)
-        extension = extension.lstrip('.')
+        slots_per_cluster = self.cluster_size // DirectoryEntry.SIZE
+        buffer = bytearray(self.cluster_size)
+        for number in self.get_cluster_chain(cluster_number):
+            size = self.read_extent(number, 0, buffer)
+            slots = 0
+            for fields in scan_slots(memoryview(buffer)[:size]):
+                slots += 1
+                if fields is not None:
+                    yield ScanEntry.from_fields(path, fields)
+            # the end of directory is in this cluster (or after the end of the volume file)
+            if slots < slots_per_cluster:
+                return
 
-        # does the file already exist?
-        if file_dir.find_entry(filename, extension):
-            raise FATException(f'{path} file already exists')
+    def walk(self, path: str='/', cluster_number: int=None) -> Iterator[ScanEntry]:
+        """All files and directories under a directory, depth-first (a directory goes before its content).
+        Only the directories on the way to the current entry are being read, so memory doesn't grow with the tree:
+        subdirectories are scanned by their clusters, their paths aren't resolved (see `scandir`).
+        """
+        pending = [self.scandir(path, cluster_number)]
+        while pending:
+            entry = next(pending[-1], None)
+            if entry is None:
+                pending.pop()
+                continue
+            yield entry
+            if entry.is_dir():
+                pending.append(self.scandir(entry.path, entry.first_file_cluster))
+
+    def du(self, path: str='/') -> int:
+        """Bytes taken by a file or a directory with all its content
+        """
+        cluster_number = const.ROOT_FILE_NUM
+        if path.rstrip('/'):
+            entry = self.find_entry(path)
+            cluster_number = entry.first_file_cluster
+            if not entry.is_dir():
+                return len(self.get_cluster_chain(cluster_number)) * self.cluster_size
+        total = len(self.get_cluster_chain(cluster_number)) * self.cluster_size
+        for entry in self.walk(path, cluster_number):
+            total += len(self.get_cluster_chain(entry.first_file_cluster)) * self.cluster_size
+        return total
+
+    def save_dir(self, directory: DirectoryTable):
+        """Write changed entries of a directory in place: only the runs of changed slots are written,
+        a full directory grows by the clusters its new slots need
+        """
+        slots_per_cluster = self.cluster_size // DirectoryEntry.SIZE
+        with directory.lock:
+            if not directory.dirty_slots:
+                return
+            slots = sorted(directory.dirty_slots)
+            index = self.get_chain_index(directory.cluster_number)
+            missing = slots[-1] // slots_per_cluster + 1 - len(index)
+            with self.volume:
+                if missing > 0:
+                    new_clusters = self.extend_chain(index.last_cluster, missing)
+                    index.append(new_clusters)
+                    # clusters can have content of deleted files: empty slots end the directory
+                    for first_cluster, count in group_consecutive(new_clusters):
+                        self._clear_clusters(first_cluster, count, directory)
+
+                # runs of consecutive changed slots within a cluster
+                for first, count in group_consecutive(slots):
+                    while count:
+                        run = min(count, slots_per_cluster - first % slots_per_cluster)
+                        self._write_slots(
+                            index.lookup(first // slots_per_cluster),
+                            first % slots_per_cluster * DirectoryEntry.SIZE,
+                            directory.serialize_slots(first, run),
+                            directory,
+                        )
+                        first += run
+                        count -= run
+            directory.dirty_slots.clear()
+
+    def _write_slots(self, cluster: int, offset: int, data: bytes, directory: DirectoryTable):
+        """Write directory slots in place, with the journal they're logged and written after their commit
+        (the directory table is kept alive until then, so it isn't read from the disk without them)
+        """
+        if self.journal is None:
+            self.write_extent(cluster, offset, data)
+        else:
+            self.journal.log_write(cluster, offset, data, directory)
+
+    def _clear_clusters(self, first_cluster: int, count: int, directory: DirectoryTable):
+        """Fill new clusters of a directory with empty slots (see `_write_slots`)
+        """
+        if self.journal is None:
+            self.write_extent(first_cluster, 0, bytes(count * self.cluster_size))
+            return
+        for number in range(first_cluster, first_cluster + count):
+            self.journal.log_write(number, 0, None, directory)
+
+    def _apply_writes(self, writes: List[Write]):
+        """Write directory slots of a committed journal group in place
+        """
+        empty = bytes(self.cluster_size)
+        with self.volume:
+            for cluster, offset, data, _ in writes:
+                self.write_extent(cluster, offset, empty if data is None else data)
+
+    def commit(self) -> bool:
+        """Commit logged metadata changes of all threads with one fsync of the journal and write
+        their directory slots in place. Returns False if there was nothing to commit (or no journal).
+        """
+        if self.journal is None:
+            return False
+        size = self.journal.commit(self._apply_writes)
+        if size and self.stats.enabled:
+            self.stats.count('journal.commits')
+            self.stats.count('journal.bytes', size)
+        return bool(size)
+
+    def _operation_done(self):
+        """Commit the journal at the end of an operation if commits are synchronous or enough is logged
+        """
+        journal = self.journal
+        if journal is not None and (self.sync_commit or journal.pending >= const.JOURNAL_GROUP_SIZE):
+            self.commit()
+
+    @timed('create_file')
+    def create_file(self, path: str, is_dir=False, size: int=None) -> int:
+        """Create a new file or directory,
+        clusters for `size` bytes (if it's known) are reserved as one extent
+        """
+        file_dir, filename, extension = self.find_parent(path)
+        # before any cluster is allocated, they would be lost otherwise
+        DirectoryEntry.validate_name(filename, extension, is_dir)
+        with file_dir.lock:
+            # does the file already exist?
+            if file_dir.find_entry(filename, extension):
+                raise FATException(f'{path} file already exists')
 
-        # find a free cluster for the new file
-        file_cluster = self.find_free_cluster()
-        if file_cluster == const.EOF:
-            raise FATException('There is no free space')
-        self.entries[file_cluster] = const.EOC
+            # find free clusters for the new file
+            if size is None:
+                file_cluster, = self.allocate_clusters(1)
+            else:
+                file_cluster = self.allocate_clusters(max(1, -(-size // self.cluster_size)), best_fit=True)[0]
 
-        # create file entry
-        additional_entry_options = {}
-        if is_dir:
-            additional_entry_options['attributes'] = const.FileAttributes.DIRECTORY
-        file_dir.add_entry(filename, extension, file_cluster, **additional_entry_options)
-        self.write_file(file_dir.cluster_number, file_dir.serialize())
+            # create file entry
+            additional_entry_options = {}
+            if is_dir:
+                additional_entry_options['attributes'] = const.FileAttributes.DIRECTORY
+                # the cluster can have content of a deleted file: a new directory has to be empty
+                # (with the journal its live table is read until the cluster is cleared)
+                new_dir = None
+                if self.journal is not None:
+                    new_dir = self._dirs.setdefault(file_cluster, DirectoryTable(file_cluster, b''))
+                self._clear_clusters(file_cluster, 1, new_dir)
+            file_dir.add_entry(filename, extension, file_cluster, **additional_entry_options)
+            self.save_dir(file_dir)
+        self._operation_done()
 
         return file_cluster
 
+    def extend_chain(self, last_cluster: int, count: int) -> List[int]:
+        """Append `count` new clusters to the chain ending with `last_cluster`.
+        They continue the chain if there is enough free space right after it,
+        otherwise they are reserved as the best fitting extent.
+        """
+        with self.table_lock.write:
+            new_clusters = self.allocate_clusters(count, last_cluster + 1, best_fit=True)
+            self.set_entry(last_cluster, new_clusters[0])
+        return new_clusters
+
+    def preallocate(self, file_number: int, size: int) -> List[int]:
+        """Make a file chain long enough for `size` bytes, the missing clusters are reserved at once.
+        Returns the clusters covering `size` bytes.
+        """
+        clusters_needed = max(1, -(-size // self.cluster_size))
+        with self.table_lock.write:
+            chain = self.get_cluster_chain(file_number, limit=clusters_needed)
+            if len(chain) < clusters_needed:
+                chain.extend(self.extend_chain(chain[-1], clusters_needed - len(chain)))
+                self.chain_indexes.pop(file_number, None)
+        return chain
+
+    @timed('write_file')
     def write_file(self, file_number: int, data: bytes):
-        if not self.is_cluster_number(file_number):
-            raise FATException(f'Incorrect file_number: {file_number}')
+        # the size is known: add all missing clusters to the file at once
+        chain = self.preallocate(file_number, len(data))
 
-        # TODO: oprimize it for contiguous clusters (don't need to split by chunks)
+        # rewrite every run of contiguous clusters at once
+        view = memoryview(data)
+        offset = 0
+        with self.volume:
+            for first_cluster, count in group_consecutive(chain):
+                run_size = count * self.cluster_size
+                self.write_extent(first_cluster, 0, view[offset:offset + run_size])
+                offset += run_size
+        if self.stats.enabled:
+            self.stats.count('write_file.bytes', len(data))
+            self.stats.count('write_file.clusters', len(chain))
 
-        # rewrire all clusters
-        fat_number = file_number
-        prev_number = None
-        with open(self.volume_path, 'r+b') as volume:
-            for data_chunk in split_by_chunks(data, self.cluster_size):
-                # there's no enough size in the file? -> add a new cluster to the file
-                if fat_number == const.EOC:
-                    fat_number = self.find_free_cluster(prev_number)
-                    if fat_number == const.EOF:
-                        fat_number = self.find_free_cluster()
-                        if fat_number == const.EOF:
-                            raise FATException('There is no free space')
-                    self.entries[prev_number] = fat_number
+        # free not used clusters
+        self.truncate(file_number, len(data))
+        self._operation_done()
 
-                fat_entry = self.entries[fat_number]
-                if fat_entry == const.FAT_ENTRY_EMPTY:
-                    raise FATException(f'Cluster is empty for the fat_number={fat_number}, file_number={file_number}')
+    @timed('truncate')
+    def truncate(self, file_number: int, size: int):
+        """Free clusters of a file after the first `size` bytes at once (a file keeps at least one cluster)
+        """
+        keep = max(1, -(-size // self.cluster_size))
+        with self.table_lock.write:
+            chain = self.get_cluster_chain(file_number, limit=keep + 1)
+            if len(chain) <= keep:
+                return
+            tail = self.get_cluster_chain(chain[keep])
+            self.set_entry(chain[keep - 1], const.EOC)
+            self.free_clusters(tail)
+            self.chain_indexes.pop(file_number, None)
+        self._operation_done()
 
-                # write data
-                cluster_position = self.get_cluster_position(fat_number)
-                volume.seek(cluster_position)
-                volume.write(data_chunk)
+    @timed('unlink')
+    def unlink(self, path: str):
+        """Delete a file
+        """
+        file_dir, filename, extension = self.find_parent(path)
+        with file_dir.lock:
+            entry = file_dir.find_entry(filename, extension)
+            if entry is None:
+                raise FATException(f'{path} file does not exist')
+            if entry.is_dir():
+                raise FATException(f'{path} is a directory. Use `rmdir` instead.')
+            self._delete_entry(file_dir, entry)
+        self._operation_done()
 
-                # go to the next cluster in the chain
-                prev_number = fat_number
-                fat_number = fat_entry
+    @timed('rmdir')
+    def rmdir(self, path: str, recursive: bool=False):
+        """Delete a directory, with all its content if `recursive` (otherwise it has to be empty)
+        """
+        path = path.rstrip('/')
+        if not path:
+            raise FATException('The root directory can not be deleted')
 
-        # free not used clusters
-        # TODO
-        pass
+        file_dir, filename, extension = self.find_parent(path)
+        with file_dir.lock:
+            entry = file_dir.find_entry(filename, extension)
+            if entry is None or not entry.is_dir():
+                raise FATException(f'{path} directory does not exist')
+            if not recursive and not self.read_dir(entry.first_file_cluster).is_empty():
+                raise FATException(f'{path} directory is not empty')
+            # lookups must not find the directory once its clusters can be reused
+            self.dentries.invalidate(path)
+            self._delete_entry(file_dir, entry)
+        self._operation_done()
+
+    def _delete_entry(self, file_dir: DirectoryTable, entry: DirectoryEntry):
+        """Remove an entry and free its clusters (or queue them for `reclaim()`)
+        """
+        file_dir.remove_entry(entry.filename, entry.extension)
+        self.save_dir(file_dir)
+        if self.deferred_free:
+            with self.alloc_lock:
+                self._pending_free.append((entry.first_file_cluster, entry.is_dir()))
+        else:
+            self._free_tree(entry.first_file_cluster, entry.is_dir())
+
+    def _free_tree(self, first_cluster: int, is_dir: bool) -> int:
+        """Free chains of a deleted file or directory (with all its content) in one batch,
+        returns the number of freed clusters
+        """
+        numbers = []
+        pending = [(first_cluster, is_dir)]
+        while pending:
+            first_cluster, is_dir = pending.pop()
+            if is_dir:
+                directory = self.read_dir(first_cluster)
+                pending.extend(
+                    (entry.first_file_cluster, entry.is_dir()) for entry in directory.entries if entry.filename
+                )
+                self._dirs.pop(first_cluster, None)
+            numbers.extend(self.get_cluster_chain(first_cluster))
+            self.chain_indexes.pop(first_cluster, None)
+        self.free_clusters(numbers)
+        return len(numbers)
+
+    def reclaim(self) -> int:
+        """Free clusters of files deleted with `deferred_free`, returns the number of freed clusters
+        """
+        with self.alloc_lock:
+            pending, self._pending_free = self._pending_free, []
+        return sum(self._free_tree(first_cluster, is_dir) for first_cluster, is_dir in pending)
+
+    @timed('relocate_file')
+    def relocate_file(self, directory: DirectoryTable, entry: DirectoryEntry, goal: int=None) -> bool:
+        """Move the chain of a file or directory into one contiguous extent (the first one after `goal`
+        which fits it). Returns False if there is no such extent or it wouldn't be closer to the volume start.
 
+        The new chain is written and saved before the entry is switched to it, so the volume
+        is consistent at every moment (a crash in the middle leaks the new clusters at worst).
+        Open `File` objects of the moved file keep the old first cluster and have to be reopened.
+        """
+        # a moved directory must not change meanwhile
+        moved = self._dirs.get(entry.first_file_cluster) if entry.is_dir() else None
+        with directory.lock, moved.lock if moved is not None else nullcontext(), self.table_lock.write:
+            old_first = entry.first_file_cluster
+            old_chain = self.get_cluster_chain(old_first)
+            try:
+                # first-fit from the beginning of the data region unless `goal` is set
+                new_chain = self.allocate_clusters(
+                    len(old_chain), const.FAT_CLUSTER_TO_USE_FROM if goal is None else goal, contiguous=True
+                )
+            except FATException:
+                return False
+            if new_chain[0] >= old_first and len(list(group_consecutive(old_chain))) == 1:
+                # the file is contiguous already and there is no better place for it
+                self.free_clusters(new_chain)
+                return False
+
+            # slots of a moved directory have to be written before they're copied
+            self.commit()
+            # copy content run by run (zeros for clusters after the end of the volume file)
+            position = 0
+            with self.volume:
+                for first_cluster, count in group_consecutive(old_chain):
+                    buffer = bytearray(count * self.cluster_size)
+                    self.read_extent(first_cluster, 0, buffer)
+                    self.write_extent(new_chain[position], 0, buffer)
+                    position += count
+            self.sync()
+
+            # switch the entry to the new chain
+            entry.first_file_cluster = new_chain[0]
+            directory.mark_dirty(entry)
+            self.save_dir(directory)
+            if moved is not None:
+                del self._dirs[old_first]
+                moved.cluster_number = new_chain[0]
+                self._dirs[new_chain[0]] = moved
+
+            self.free_clusters(old_chain)
+            self.chain_indexes.pop(old_first, None)
+        self._operation_done()
+        return True
+
+    def open_file(self, path: str, mode: str='r') -> File:
+        """Open a file as a seekable binary stream
+        """
+        return File.open(self, path, mode)
+
+    @timed('load')
     def load(self):
         if not os.path.isfile(self.volume_path):
             return self.__create_new()
 
-        # TODO: remove it (get from BPB instead)
-        self.cluster_size = const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE
-        self.max_clusters = int(const.TOTAL_SECTORS / const.SECTORS_PER_CLUSTER)
-
-        # self.volume.seek(0)
-        # self.bpb = BPB(self.volume.read(const.SECTOR_SIZE))
-
+        # the BPB fields and signature are in the first 512 bytes whatever the sector size is
         with open(self.volume_path, 'rb') as volume:
-            volume.seek(self.cluster_size)  # go to cluster #1
-            entries_data = volume.read(self.max_clusters*4)
-        # 4 bytes - size of a fat entry
-        self.entries = list(struct.unpack(f'<{len(entries_data)//4}I', entries_data))
+            bpb = BPB.parse(volume.read(const.SECTOR_SIZE))
+        self._boot_dirty = False
+        if bpb is None:
+            # volumes written before the BPB was used have the default geometry, the BPB is added on save
+            bpb = BPB.default()
+            self._boot_dirty = True
+        elif not bpb.fsinfo_sector and bpb.reserved_sectors > 1:
+            # the sector after the BPB is free: add the FS Information Sector
+            bpb.fsinfo_sector = 1
+            self._boot_dirty = True
+        self._set_geometry(bpb)
+
+        self._open_volume()
+        self.fsinfo = FSInfo()
+        if bpb.fsinfo_offset is not None:
+            data = self.volume.read(bpb.fsinfo_offset, self.sector_size)
+            self.fsinfo = FSInfo.parse(data.ljust(self.sector_size, b'\0'))
+            if self.fsinfo.free_count > self.max_clusters:
+                self.fsinfo.free_count = FSInfo.UNKNOWN
+        self._fsinfo_dirty = self._boot_dirty
+        self._load_table()
+        self.dentries.clear()
+        self.chain_indexes.clear()
+        self._dirs.clear()
+        self._open_journal()
 
         self.root = self.read_dir(const.ROOT_FILE_NUM)
 
-    def save(self):
-        # FAT region
-        # TODO: use FAT#1 and FAT#2
-        # FIXME: use real FAT algorithm
-        serialized_entries = struct.pack(f'<{len(self.entries)}I', *self.entries)
-        with open(self.volume_path, 'r+b') as volume:
-            volume.seek(self.cluster_size)  # go to cluster #1
-            volume.write(serialized_entries)
+    def _open_journal(self):
+        """Replay changes committed to a journal before a crash (whether the journal is enabled or not)
+        and open the journal if it's enabled
+        """
+        left = os.path.isfile(self.journal_path) and os.path.getsize(self.journal_path) > 0
+        if not self._use_journal and not left:
+            return
+        journal = Journal(self.journal_path)
+        if journal.size:
+            self._replay(journal)
+            # the replayed changes are saved by a checkpoint, which empties the journal
+            self.journal = journal
+            self.sync()
+        if self._use_journal:
+            self.journal = journal
+        else:
+            self.journal = None
+            journal.close()
+            os.remove(self.journal_path)
 
-        # save root
-        self.write_file(self.root.cluster_number, self.root.serialize())
+    def _replay(self, journal: Journal):
+        """Apply records of the journal: FAT entries are set and directory slots are written,
+        except for slots of clusters freed afterwards (they can belong to other files already)
+        """
+        records = list(journal.records())
+        freed = set()
+        writes = []
+        for record in reversed(records):
+            if record[0] == Journal.ENTRY:
+                if record[2] == const.FAT_ENTRY_EMPTY:
+                    freed.add(record[1])
+            elif record[1] not in freed and self.is_cluster_number(record[1]):
+                writes.append(record)
 
+        with self.table_lock.write:
+            for record in records:
+                if record[0] == Journal.ENTRY and self.is_cluster_number(record[1]):
+                    self.set_entry(record[1], record[2])
+        with self.volume:
+            for record in reversed(writes):
+                if record[0] == Journal.WRITE:
+                    _, cluster, offset, data = record
+                    self.write_extent(cluster, offset, data[:max(0, self.cluster_size - offset)])
+                else:
+                    self.write_extent(record[1], 0, bytes(self.cluster_size))
+        # the free space index and count are built from the replayed table
+        self._free_space = None
+        self.fsinfo.free_count = FSInfo.UNKNOWN
+        self._fsinfo_dirty = True
+        if self.stats.enabled:
+            self.stats.count('journal.replayed', len(records))
 
-class BPB:
-    """BIOS Parameter Block
-    """
+    @timed('save')
+    def save(self):
+        """Write changed FAT sectors and the root directory (if it's changed)
+        """
+        self.reclaim()
+        # save root
+        with self.root.lock:
+            if self.root.dirty:
+                self.save_dir(self.root)
+        self.sync()
 
-    def __init__(self, data):
-        self.bytes_per_sector = None     # type: int
-        self.sectors_per_cluster = None  # type: int
-        self.total_sectors = None        # type: int
+    @timed('sync')
+    def sync(self):
+        """Write cached file data and changed FAT sectors (but not the root directory).
+        With the journal it's a checkpoint: logged changes are committed and written in place,
+        the volume is flushed to the disk and the journal is emptied.
+        """
+        if self.journal is None:
+            self._write_back()
+            return
 
-        self.fat_numbers = 2  # not used yet
+        # nothing can be committed or changed in the FAT meanwhile
+        with self.table_lock.write, self.journal.commit_lock:
+            self.commit()
+            self._write_back()
+            self.volume.fsync()
+            self.journal.reset()
+        if self.stats.enabled:
+            self.stats.count('journal.checkpoints')
 
-    def save(self):
-        pass
+    def _write_back(self):
+        # file data goes to the disk before metadata referencing it
+        if self.cache is not None:
+            self.cache.flush()
 
-    def load(self):
-        pass
+        # FAT region: changed sectors go to every copy of the FAT
+        # FIXME: use real FAT algorithm
+        with self.table_lock.write:
+            if self._table is not None:
+                # the first copy is mapped
+                self._table.flush()
+                copies = range(1, self.bpb.fat_count)
+            else:
+                copies = range(self.bpb.fat_count)
+            if self._dirty_sectors and copies:
+                entries_per_sector = self.sector_size // ENTRY_SIZE
+                with self.volume:
+                    # write runs of consecutive changed sectors at once
+                    for sector, count in group_consecutive(sorted(self._dirty_sectors)):
+                        first_entry = sector * entries_per_sector
+                        data = entries_to_bytes(self.entries[first_entry:first_entry + count * entries_per_sector])
+                        for copy in copies:
+                            self.volume.write(self.bpb.fat_copy_offset(copy) + sector * self.sector_size, data)
+                if self.stats.enabled:
+                    self.stats.count('sync.fat_sectors', len(self._dirty_sectors) * len(copies))
+            self._dirty_sectors.clear()
+
+        # FSInfo is a hint: it's written after the FAT
+        with self.alloc_lock:
+            if self._boot_dirty:
+                self.volume.write(0, self.bpb.serialize())
+                self._boot_dirty = False
+            if self._fsinfo_dirty and self.bpb.fsinfo_offset is not None:
+                self.volume.write(self.bpb.fsinfo_offset, self.fsinfo.serialize(self.sector_size))
+                self._fsinfo_dirty = False
+        self.volume.flush()
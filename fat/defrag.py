@@ -0,0 +1,159 @@
+"""Fragmentation report and online defragmentation of the volume
+
+A file is fragmented when its cluster chain consists of more than one contiguous run.
+Its score is the share of cluster links which jump to another run:
+0 for a contiguous file, 1 when no two consecutive clusters are adjacent.
+
+The defragmenter moves chains (one file at a time, see `FAT.relocate_file`) into the first
+contiguous extent which fits them, so files are packed towards the volume start and the free
+space at the end of the volume grows into one extent. The path of the last processed file is
+kept in a checkpoint file: an interrupted run continues from the next one.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterator, List, Tuple
+
+from fat import constants as const
+from fat.core import FAT
+from fat.dir import DirectoryEntry, DirectoryTable
+from fat.utils import group_consecutive
+
+CHECKPOINT_FILENAME = 'defrag.json'
+
+
+def fragmentation_score(chain: List[int]) -> float:
+    """Share of links between clusters of a chain which aren't adjacent clusters
+    """
+    if len(chain) < 2:
+        return 0.0
+    runs = len(list(group_consecutive(chain)))
+    return (runs - 1) / (len(chain) - 1)
+
+
+def walk_entries(fat: FAT) -> Iterator[Tuple[str, DirectoryTable, DirectoryEntry]]:
+    """All files and directories of the volume as (path, parent directory, entry),
+    depth-first in the order of names (so paths are ordered by `path_key`)
+    """
+    def entries(path: str, directory: DirectoryTable):
+        for entry in sorted((entry for entry in directory.entries if entry.filename), key=lambda e: e.fullname):
+            yield f'{path}/{entry.fullname}', directory, entry
+
+    pending = [entries('', fat.root)]
+    while pending:
+        item = next(pending[-1], None)
+        if item is None:
+            pending.pop()
+            continue
+        yield item
+        path, _, entry = item
+        if entry.is_dir():
+            pending.append(entries(path, fat.read_dir(entry.first_file_cluster)))
+
+
+def path_key(path: str) -> List[str]:
+    return path.split('/')
+
+
+def analyze(fat: FAT) -> dict:
+    """Fragmentation of every file and of the whole volume
+    """
+    files = []
+    total_links = fragmented_links = 0
+    for path, _, entry in walk_entries(fat):
+        chain = fat.get_cluster_chain(entry.first_file_cluster)
+        runs = len(list(group_consecutive(chain)))
+        files.append({
+            'path': path,
+            'clusters': len(chain),
+            'fragments': runs,
+            'score': fragmentation_score(chain),
+        })
+        total_links += len(chain) - 1
+        fragmented_links += runs - 1
+
+    with fat.alloc_lock:
+        free_extents = list(fat.free_space.extents())
+    free_clusters = sum(length for _, length in free_extents)
+    largest_free = max((length for _, length in free_extents), default=0)
+    return {
+        'files': files,
+        'fragmented_files': sum(1 for file in files if file['fragments'] > 1),
+        'score': fragmented_links / total_links if total_links else 0.0,
+        'free_clusters': free_clusters,
+        'free_extents': len(free_extents),
+        # 0 when all free space is one extent
+        'free_space_score': 1 - largest_free / free_clusters if free_clusters else 0.0,
+    }
+
+
+class Defragmenter:
+    """Moves files into contiguous extents, it can run in a background thread on a live volume
+
+    `pause` is the number of seconds to sleep after every moved file (to leave the volume
+    to other users), `max_files` limits the number of files moved by one run.
+    """
+
+    def __init__(self, fat: FAT, pause: float=0.0, max_files: int=None):
+        self.fat = fat                                                                                # type: FAT
+        self.pause = pause                                                                            # type: float
+        self.max_files = max_files                                                                    # type: int
+        self.checkpoint_path = os.path.join(os.path.abspath(const.DATA_PATH), CHECKPOINT_FILENAME)  # type: str
+        self.moved = 0                                                                                # type: int
+        self.moved_clusters = 0                                                                       # type: int
+        self._stop = threading.Event()
+
+    def load_checkpoint(self) -> str or None:
+        """Path of the last processed file of an interrupted run
+        """
+        if not os.path.isfile(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)['path']
+
+    def save_checkpoint(self, path: str or None):
+        if path is None:
+            if os.path.isfile(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            return
+        with open(self.checkpoint_path, 'w') as f:
+            json.dump({'path': path}, f)
+
+    def stop(self):
+        """Ask a running `run()` to stop after the current file
+        """
+        self._stop.set()
+
+    def run(self, resume: bool=True) -> bool:
+        """Move files (from the checkpoint if `resume`), returns True if the whole volume is processed
+        """
+        self._stop.clear()
+        last_path = self.load_checkpoint() if resume else None
+        moved = 0
+        for path, directory, entry in walk_entries(self.fat):
+            if last_path is not None and path_key(path) <= path_key(last_path):
+                continue
+            if self._stop.is_set() or (self.max_files is not None and moved >= self.max_files):
+                return False
+
+            if self.fat.relocate_file(directory, entry):
+                moved += 1
+                self.moved += 1
+                self.moved_clusters += len(self.fat.get_chain_index(entry.first_file_cluster))
+                if self.pause:
+                    time.sleep(self.pause)
+            # keep the progress saved with the moved chains
+            self.fat.save()
+            self.save_checkpoint(path)
+
+        self.save_checkpoint(None)
+        return True
+
+    def start(self) -> threading.Thread:
+        """Run in a background (daemon) thread
+        """
+        thread = threading.Thread(target=self.run, name='defrag', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,57 @@
+"""Cache of resolved directory paths
+"""
+
+import threading
+from collections import OrderedDict
+
+from fat.dir import DirectoryTable
+
+
+class DentryCache:
+    """Maps absolute directory paths to parsed `DirectoryTable` objects (LRU, bounded by number of paths).
+
+    Cached tables are the same objects the FAT changes when it adds entries, so they stay up to date;
+    a path has to be invalidated only when the directory itself is moved or removed.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries  # type: int
+        self.hits = 0                   # type: int
+        self.misses = 0                 # type: int
+
+        self._dirs = OrderedDict()      # type: OrderedDict[str, DirectoryTable]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def get(self, path: str) -> DirectoryTable or None:
+        with self._lock:
+            directory = self._dirs.get(path)
+            if directory is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._dirs.move_to_end(path)
+            return directory
+
+    def put(self, path: str, directory: DirectoryTable):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._dirs[path] = directory
+            self._dirs.move_to_end(path)
+            while len(self._dirs) > self.max_entries:
+                self._dirs.popitem(last=False)
+
+    def invalidate(self, path: str):
+        """Forget a directory and all its subdirectories
+        """
+        prefix = path.rstrip('/') + '/'
+        with self._lock:
+            for cached_path in [p for p in self._dirs if p == path or p.startswith(prefix)]:
+                del self._dirs[cached_path]
+
+    def clear(self):
+        with self._lock:
+            self._dirs.clear()
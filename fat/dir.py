@@ -1,41 +1,105 @@
+import heapq
 import struct
-from typing import List
+import threading
+from typing import Dict, Iterator, List, Set, Tuple
 
 from fat.constants import FileAttributes
 from fat.exceptions import FATException
-from fat.utils import split_by_chunks
 
 
 class DirectoryTable:
+    """Entries of a directory: its slots up to the end of directory (the first never used slot)
+    """
 
     def __init__(self, cluster_number: int, data: bytes):
         self.cluster_number = cluster_number       # type: int
         self.entries = []                          # type: List[DirectoryEntry]
+        self.index = {}                            # type: Dict[Tuple[str, str], DirectoryEntry]
+        self.positions = {}                        # type: Dict[DirectoryEntry, int]  # slots of live entries
+        self.free_slots = []                       # type: List[int]  # heap of positions of deleted entries
+        self.dirty_slots = set()                   # type: Set[int]  # positions of changed but not saved entries
+        self.lock = threading.RLock()              # type: threading.RLock  # held while entries are changed
 
         self.parse(data)
 
-    def add_entry(self, filename: str, extension: str, first_file_cluster: int, **kwargs):
-        self.entries.append(
-            DirectoryEntry(filename=filename, extension=extension, first_file_cluster=first_file_cluster, **kwargs)
-        )
+    @property
+    def dirty(self) -> bool:
+        return bool(self.dirty_slots)
+
+    def add_entry(self, filename: str, extension: str, first_file_cluster: int, **kwargs) -> int:
+        """Add an entry to the first deleted slot (or after the last entry if there is no one),
+        returns the slot position
+        """
+        entry = DirectoryEntry(filename=filename, extension=extension, first_file_cluster=first_file_cluster, **kwargs)
+        if self.free_slots:
+            position = heapq.heappop(self.free_slots)
+            self.entries[position] = entry
+        else:
+            position = len(self.entries)
+            self.entries.append(entry)
+        self.index[filename, extension] = entry
+        self.positions[entry] = position
+        self.dirty_slots.add(position)
+        return position
+
+    def remove_entry(self, filename: str, extension: str) -> 'DirectoryEntry':
+        """Mark an entry deleted, its slot is reused by the next added entry
+        """
+        entry = self.index.pop((filename, extension), None)
+        if entry is None:
+            raise FATException(f'{filename}.{extension} does not exist')
+        position = self.positions.pop(entry)
+        self.entries[position] = DirectoryEntry.deleted()
+        heapq.heappush(self.free_slots, position)
+        self.dirty_slots.add(position)
+        return entry
+
+    def mark_dirty(self, entry: 'DirectoryEntry'):
+        """Save a changed entry with the next save of the directory
+        """
+        self.dirty_slots.add(self.positions[entry])
+
+    def is_empty(self) -> bool:
+        return not self.index
 
     def find_entry(self, filename: str, extension: str) -> 'DirectoryEntry' or None:
-        found_entry = None
-        for entry in self.entries:
-            if entry.filename == filename and entry.extension == extension:
-                found_entry = entry
-                break
-        return found_entry
+        return self.index.get((filename, extension))
+
+    def find_dir_entry(self, filename: str) -> 'DirectoryEntry' or None:
+        """Find a subdirectory entry (directories don't have extensions)
+        """
+        entry = self.index.get((filename, ''))
+        if entry is not None and entry.is_dir():
+            return entry
+        return None
 
     def parse(self, data: bytes):
         self.entries.clear()
-        for entry_bytes in split_by_chunks(data, DirectoryEntry.SIZE):
-            entry = DirectoryEntry()
-            entry.parse(entry_bytes)
+        self.index.clear()
+        self.positions.clear()
+        self.free_slots.clear()
+        self.dirty_slots.clear()
+        for fields in scan_slots(data):
+            if fields is None:
+                self.free_slots.append(len(self.entries))
+                entry = DirectoryEntry.deleted()
+            else:
+                entry = DirectoryEntry.from_fields(fields)
+                # the first entry wins for duplicated names, like the linear search did
+                self.index.setdefault((entry.filename, entry.extension), entry)
+                self.positions[entry] = len(self.entries)
             self.entries.append(entry)
 
+    def serialize_slots(self, first: int, count: int) -> bytearray:
+        """Encoded entries of `count` slots from the `first` one (never used slots are zeros)
+        """
+        buffer = bytearray(count * DirectoryEntry.SIZE)
+        for offset, entry in enumerate(self.entries[first:first + count]):
+            entry.serialize_into(buffer, offset * DirectoryEntry.SIZE)
+        return buffer
+
     def serialize(self) -> bytes:
-        return b''.join(entry.serialize() for entry in self.entries)
+        return bytes(self.serialize_slots(0, len(self.entries)))
 
     def __repr__(self):
         return f"<DirectoryTable: {self.cluster_number}>"
@@ -43,10 +107,12 @@ class DirectoryTable:
 
 class DirectoryEntry:
 
-    FORMAT = '<8s3sBHH'
+    FORMAT = struct.Struct('<8s3sBHH')
+    DELETED_MARK = 0xE5  # the first byte of a deleted entry
     # SIZE = 32
     # FIXME: remove it. It's here while we don't save all entry fields
     SIZE = 16
+    DELETED_SLOT = bytes([DELETED_MARK]) + bytes(SIZE - 1)
 
     def __init__(self, **kwargs):
         self.filename = kwargs.get('filename', None)                            # type: str
@@ -56,17 +122,37 @@ class DirectoryEntry:
         self.file_size = None                                                   # type: int
         self.last_modified_time = None                                          # type: int
         self.last_modified_date = None                                          # type: int
+        self.is_deleted = False                                                 # type: bool
 
         self._validation()
 
-    def _validation(self):
-        if self.filename and len(self.filename) > 8:
-            raise FATException(f'Validation error: filename is too long: {len(self.filename)}')
-        if self.extension and len(self.extension) > 3:
-            raise FATException(f'Validation error: extension is too long: {len(self.extension)}')
-        if self.is_dir() and self.extension:
+    @classmethod
+    def deleted(cls) -> 'DirectoryEntry':
+        """An entry of a deleted file (a free slot)
+        """
+        entry = cls(filename='', extension='', first_file_cluster=0)
+        entry.is_deleted = True
+        return entry
+
+    @staticmethod
+    def validate_name(filename: str, extension: str, is_dir: bool):
+        """Check the name of a new entry
+        """
+        # a slot with an empty name would end the directory
+        if not filename:
+            raise FATException('Validation error: filename is empty')
+        if len(filename) > 8:
+            raise FATException(f'Validation error: filename is too long: {len(filename)}')
+        if extension and len(extension) > 3:
+            raise FATException(f'Validation error: extension is too long: {len(extension)}')
+        if is_dir and extension:
             raise FATException('Validation error: directory has to have not specified extension')
 
+    def _validation(self):
+        # entries without a name are free slots
+        if self.filename:
+            self.validate_name(self.filename, self.extension, self.is_dir())
+
     @property
     def fullname(self):
         fullname = self.filename
@@ -82,29 +168,98 @@ class DirectoryEntry:
     def parse(self, data: bytes):
         if len(data) != self.SIZE:
             raise FATException(f'data has to have length={self.SIZE}')
+        if data[0] == self.DELETED_MARK:
+            self.filename, self.extension, self.attributes, self.first_file_cluster = '', '', 0, 0
+            self.is_deleted = True
+            return
+
+        self._set_fields(self.FORMAT.unpack(data))
 
-        (self.filename,
-         self.extension,
-         self.attributes,
-         high_first_cluster,
-         low_first_cluster) = struct.unpack(self.FORMAT, data)
+    @classmethod
+    def from_fields(cls, fields: tuple) -> 'DirectoryEntry':
+        """An entry from the unpacked fields of a slot (see `scan_slots`)
+        """
+        entry = cls()
+        entry._set_fields(fields)
+        return entry
 
-        self.filename = self.filename.rstrip(b'\x00').decode()
-        self.extension = self.extension.rstrip(b'\x00').decode()
+    def _set_fields(self, fields: tuple):
+        filename, extension, self.attributes, high_first_cluster, low_first_cluster = fields
+        self.filename = filename.rstrip(b'\x00').decode()
+        self.extension = extension.rstrip(b'\x00').decode()
         self.first_file_cluster = (high_first_cluster << 16) | low_first_cluster
 
     def serialize(self) -> bytes:
+        data = bytearray(self.SIZE)
+        self.serialize_into(data, 0)
+        return bytes(data)
+
+    def serialize_into(self, buffer: bytearray, offset: int):
+        """Encode the entry into a buffer at `offset` (all `SIZE` bytes of the slot are written)
+        """
         # TODO: first_file_cluster has to be serialized like this:
         # - save low high 2 bytes of first cluster at 0x14 offset
         # - save low two 2 bytes of first cluster at 0x1A offset
         # more info at https://en.wikipedia.org/wiki/Design_of_the_FAT_file_system#Directory_entry
+        if self.is_deleted:
+            buffer[offset:offset + self.SIZE] = self.DELETED_SLOT
+            return
 
         high_first_cluster, low_first_cluster = divmod(self.first_file_cluster, 2**16)
-        return struct.pack(
-            self.FORMAT,
+        self.FORMAT.pack_into(
+            buffer,
+            offset,
             self.filename.encode(),
             self.extension.encode(),
             self.attributes,
             high_first_cluster,
             low_first_cluster,
         )
+
+
+class ScanEntry:
+    """A directory entry yielded by `FAT.scandir` and `FAT.walk`: the fields of a slot and the path,
+    it's lighter than a `DirectoryEntry` and isn't kept by the directory
+    """
+
+    __slots__ = ('path', 'name', 'attributes', 'first_file_cluster')
+
+    def __init__(self, path: str, name: str, attributes: int, first_file_cluster: int):
+        self.path = path                              # type: str
+        self.name = name                              # type: str
+        self.attributes = attributes                  # type: int
+        self.first_file_cluster = first_file_cluster  # type: int
+
+    @classmethod
+    def from_fields(cls, dir_path: str, fields: tuple) -> 'ScanEntry':
+        filename, extension, attributes, high_first_cluster, low_first_cluster = fields
+        name = filename.rstrip(b'\x00').decode()
+        if extension[0]:
+            name += '.' + extension.rstrip(b'\x00').decode()
+        return cls(f'{dir_path.rstrip("/")}/{name}', name, attributes, (high_first_cluster << 16) | low_first_cluster)
+
+    @classmethod
+    def from_entry(cls, dir_path: str, entry: DirectoryEntry) -> 'ScanEntry':
+        return cls(f'{dir_path.rstrip("/")}/{entry.fullname}', entry.fullname, entry.attributes,
+                   entry.first_file_cluster)
+
+    def is_dir(self) -> bool:
+        return bool(self.attributes & FileAttributes.DIRECTORY)
+
+    def __repr__(self):
+        return f"<ScanEntry: {self.path}>"
+
+
+def scan_slots(data) -> Iterator[tuple or None]:
+    """Unpacked fields of the slots of directory data (None for deleted slots),
+    nothing is parsed after the end of directory (the first never used slot)
+    """
+    view = memoryview(data)
+    try:
+        for fields in DirectoryEntry.FORMAT.iter_unpack(view[:len(view) - len(view) % DirectoryEntry.SIZE]):
+            first_byte = fields[0][0]
+            if not first_byte:
+                return
+            yield None if first_byte == DirectoryEntry.DELETED_MARK else fields
+    finally:
+        view.release()
@@ -1,26 +1,131 @@
+import io
+import os
+from typing import TYPE_CHECKING, Iterator
 
+from fat.chain import ChainIndex
+from fat.exceptions import FATException
 
-class File:
+if TYPE_CHECKING:
+    from fat.core import FAT
 
-    def __init__(self):
-        self._pointer = 0
+
+class File(io.RawIOBase):
+    """Seekable binary stream over a file's cluster chain.
+
+    Reads and writes touch only the clusters under the current position. Directory entries
+    don't store file sizes yet (see `DirectoryEntry.SIZE`), so the end of a file is the end of
+    its last cluster; writing after it appends new clusters to the chain.
+    """
+
+    MODES = ('r', 'rb', 'r+', 'r+b')
+
+    def __init__(self, fat: 'FAT', first_cluster: int, mode: str='r'):
+        super().__init__()
+        if mode not in self.MODES:
+            raise FATException(f'Unsupported file mode: {mode}')
+
+        self.fat = fat                      # type: FAT
+        self.first_cluster = first_cluster  # type: int
+        self.mode = mode                    # type: str
+        self._pointer = 0                   # type: int
 
     @staticmethod
-    def create(path_name: str):
-        pass
+    def create(fat: 'FAT', path_name: str) -> 'File':
+        return File(fat, fat.create_file(path_name), 'r+')
 
     @staticmethod
-    def open(path_name: str):
-        return File()
+    def open(fat: 'FAT', path_name: str, mode: str='r') -> 'File':
+        return File(fat, fat.find_file(path_name), mode)
 
-    def close(self):
-        pass
+    def readable(self) -> bool:
+        return True
 
-    def read(self):
-        pass
+    def writable(self) -> bool:
+        return '+' in self.mode
 
-    def write(self):
-        pass
+    def seekable(self) -> bool:
+        return True
 
-    def seek(self, value: int):
+    @property
+    def chain(self) -> ChainIndex:
+        return self.fat.get_chain_index(self.first_cluster)
+
+    @property
+    def size(self) -> int:
+        """Allocated size of the file
+        """
+        return len(self.chain) * self.fat.cluster_size
+
+    def tell(self) -> int:
+        return self._pointer
+
+    def seek(self, value: int, whence: int=os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            value += self._pointer
+        elif whence == os.SEEK_END:
+            value += self.size
+        elif whence != os.SEEK_SET:
+            raise FATException(f'Incorrect whence: {whence}')
+        if value < 0:
+            raise FATException(f'Incorrect position: {value}')
         self._pointer = value
+        return value
+
+    def readinto(self, buffer) -> int:
+        self._checkClosed()
+        view = memoryview(buffer).cast('B')
+        cluster_size = self.fat.cluster_size
+        first_index, offset = divmod(self._pointer, cluster_size)
+        count = -(-(offset + len(view)) // cluster_size)
+
+        size = 0
+        with self.fat.volume:
+            for first_cluster, run_length in self.chain.runs(first_index, count):
+                requested = view[size:size + run_length * cluster_size - offset]
+                read = self.fat.read_extent(first_cluster, offset, requested)
+                size += read
+                # the rest of the file is after the end of the volume file
+                if read < len(requested):
+                    break
+                offset = 0
+
+        self._pointer += size
+        return size
+
+    def write(self, data: bytes) -> int:
+        self._checkClosed()
+        if not self.writable():
+            raise FATException('File is not opened for writing')
+
+        view = memoryview(data).cast('B')
+        if not view:
+            return 0
+        cluster_size = self.fat.cluster_size
+        first_index, offset = divmod(self._pointer, cluster_size)
+        count = -(-(offset + len(view)) // cluster_size)
+
+        # allocate missing clusters (if the write goes after the end of the file) at once
+        chain = self.chain
+        if len(chain) < first_index + count:
+            chain.append(self.fat.extend_chain(chain.last_cluster, first_index + count - len(chain)))
+
+        written = 0
+        with self.fat.volume:
+            for first_cluster, run_length in chain.runs(first_index, count):
+                chunk = view[written:written + run_length * cluster_size - offset]
+                self.fat.write_extent(first_cluster, offset, chunk)
+                written += len(chunk)
+                offset = 0
+
+        self._pointer += written
+        return written
+
+    def chunks(self, size: int=None) -> Iterator[bytes]:
+        """Iterate over the rest of the file by chunks (of a cluster by default)
+        """
+        size = size or self.fat.cluster_size
+        while True:
+            chunk = self.read(size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,374 @@
+"""Consistency check (fsck) of the volume
+
+The FAT is checked as a whole array: values of entries are classified (free, link, end of chain,
+bad value), links give reference counts of clusters, and pointer doubling over the links
+(log2(clusters) passes) finds the last cluster and the first one (head) of the chain of every cluster.
+With NumPy every step is a vectorized operation over all entries, so a volume of a million
+clusters is checked in well under a second. Without NumPy the same checks run as loops over entries.
+
+The tree is walked from the root then, and the first cluster of every entry is cross-checked with
+the table: it has to be a used head of a chain which ends with an end-of-chain mark, and it can't
+be shared by entries. Used clusters which chains don't start at any entry are lost.
+
+Repair removes entries which clusters are free, invalid or belong to another file, ends chains
+at bad links, at links to free clusters and at links which close cycles, keeps a cross-linked
+cluster in the chain of its first predecessor only, and frees lost clusters. The check already
+counts a cross-linked cluster into the chain of its first predecessor, so clusters reported lost
+are the ones freed by repair whichever backend is used.
+"""
+
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+from fat import constants as const
+from fat.bpb import FSInfo
+from fat.core import FAT
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INVALID = 'invalid first cluster'
+FREE = 'first cluster is free'
+CYCLE = 'cluster chain has a cycle'
+INSIDE = 'first cluster is inside another chain'
+SHARED = 'first cluster is shared with'
+BROKEN = 'cluster chain ends with a bad link'
+
+# entries with these problems don't own their clusters: repair removes them
+REMOVED_PROBLEMS = (INVALID, FREE, INSIDE, SHARED)
+
+
+class TableCheck:
+    """Chains of all clusters of a FAT. Per cluster sequences are NumPy arrays if NumPy is installed,
+    lists otherwise (they're indexed the same way).
+    """
+
+    def __init__(self, entries, size: int, use_numpy: bool=numpy is not None):
+        self.size = size                 # type: int  # number of entries (clusters)
+        self.use_numpy = use_numpy       # type: bool
+        self.used = None                 # used clusters
+        self.refcount = None             # numbers of clusters linking to a cluster
+        self.head_of = None              # the first cluster of the chain of a cluster, -1 in a cycle without a head
+        self.ended = None                # True if the chain from a cluster ends (it doesn't run into a cycle)
+        self.end_ok = None               # True if the chain from a cluster ends with an end-of-chain mark
+        self.bad_links = []              # type: List[int]  # clusters with values which are neither links nor ends
+        self.free_links = []             # type: List[int]  # clusters linking to free clusters
+        self.cross_linked = []           # type: List[int]  # clusters linked by more than one cluster
+        self.in_cycles = []              # type: List[int]  # clusters which chains never end
+        self.used_count = 0              # type: int
+        self.free_count = 0              # type: int  # free allocatable clusters
+
+        if use_numpy:
+            self._analyze_numpy(entries)
+        else:
+            self._analyze_python(entries)
+
+    def _analyze_numpy(self, entries):
+        size = self.size
+        numbers = numpy.arange(size, dtype=numpy.int64)
+        values = numpy.zeros(size, dtype=numpy.int64)
+        table = numpy.frombuffer(entries, dtype=numpy.uint32)[:size]
+        values[:len(table)] = table
+        # entries 0 and 1 are reserved
+        values[:const.FAT_ENTRY_CLUSTER_MIN] = 0
+
+        used = values != const.FAT_ENTRY_EMPTY
+        link = used & (values >= const.FAT_ENTRY_CLUSTER_MIN) & (values < size)
+        end = used & (values >= const.FAT_ENTRY_EOF[0]) & (values <= const.FAT_ENTRY_EOF[1])
+        sources, targets = numbers[link], values[link]
+        to_used = used[targets]
+        sources, targets = sources[to_used], targets[to_used]
+
+        # the next and the previous cluster, a cluster without one points to itself
+        following = numbers.copy()
+        following[sources] = targets
+        # a cross-linked cluster belongs to the chain of its first (lowest) predecessor
+        order = numpy.lexsort((sources, targets))
+        ordered_targets, ordered_sources = targets[order], sources[order]
+        first_link = numpy.ones(len(order), dtype=bool)
+        first_link[1:] = ordered_targets[1:] != ordered_targets[:-1]
+        preceding = numbers.copy()
+        preceding[ordered_targets[first_link]] = ordered_sources[first_link]
+        last, first = following, preceding
+        for _ in range(size.bit_length()):
+            last = last[last]
+            first = first[first]
+        # a cluster linking to itself is a cycle, not an end
+        self_linked = numpy.zeros(size, dtype=bool)
+        self_linked[sources[sources == targets]] = True
+
+        self.used = used
+        self.refcount = numpy.bincount(targets, minlength=size)
+        self.ended = (following[last] == last) & ~self_linked[last]
+        self.end_ok = self.ended & end[last]
+        self.head_of = numpy.where((preceding[first] == first) & ~self_linked[first], first, -1)
+        self.bad_links = numbers[used & ~link & ~end].tolist()
+        self.free_links = numbers[link][~to_used].tolist()
+        self.cross_linked = numbers[self.refcount > 1].tolist()
+        self.in_cycles = numbers[used & ~self.ended].tolist()
+        self.used_count = int(numpy.count_nonzero(used))
+        self.free_count = int(numpy.count_nonzero(~used[const.FAT_CLUSTER_TO_USE_FROM:]))
+        self._links = sources, targets
+        self._following = numpy.where(following != numbers, following, -1)
+
+    def _analyze_python(self, entries):
+        size = self.size
+        values = array('q', entries[:size])
+        values.extend(bytes(size - len(values)))
+        # entries 0 and 1 are reserved
+        values[0] = values[1] = 0
+
+        used = [bool(value) for value in values]
+        refcount = [0] * size
+        following = [-1] * size  # -1 if a cluster doesn't link to a used cluster
+        for number in range(const.FAT_ENTRY_CLUSTER_MIN, size):
+            value = values[number]
+            if not value:
+                continue
+            if const.FAT_ENTRY_CLUSTER_MIN <= value < size:
+                if used[value]:
+                    following[number] = value
+                    refcount[value] += 1
+                else:
+                    self.free_links.append(number)
+            elif not const.FAT_ENTRY_EOF[0] <= value <= const.FAT_ENTRY_EOF[1]:
+                self.bad_links.append(number)
+
+        # follow chains once: 0 - not visited, 1 - on the current path, 2 - done
+        ended, end_ok = [False] * size, [False] * size
+        state = bytearray(size)
+        for number in range(const.FAT_ENTRY_CLUSTER_MIN, size):
+            if not used[number] or state[number]:
+                continue
+            path = []
+            current = number
+            while current != -1 and not state[current]:
+                state[current] = 1
+                path.append(current)
+                current = following[current]
+            if current == -1:
+                is_ended = True
+                is_ok = const.FAT_ENTRY_EOF[0] <= values[path[-1]] <= const.FAT_ENTRY_EOF[1]
+            elif state[current] == 1:
+                is_ended = is_ok = False
+            else:
+                is_ended, is_ok = ended[current], end_ok[current]
+            for cluster in path:
+                state[cluster] = 2
+                ended[cluster], end_ok[cluster] = is_ended, is_ok
+
+        # a cross-linked cluster belongs to the chain of its first (lowest) predecessor
+        preceding = [-1] * size
+        for number in range(const.FAT_ENTRY_CLUSTER_MIN, size):
+            target = following[number]
+            if target != -1 and preceding[target] == -1:
+                preceding[target] = number
+        # go back through predecessors once to the head of the chain
+        head_of = [-1] * size
+        state = bytearray(size)
+        for number in range(const.FAT_ENTRY_CLUSTER_MIN, size):
+            if not used[number] or state[number]:
+                continue
+            path = []
+            current = number
+            while current != -1 and not state[current]:
+                state[current] = 1
+                path.append(current)
+                current = preceding[current]
+            if current == -1:
+                head = path[-1]
+            elif state[current] == 1:
+                # a cycle without a head
+                head = -1
+            else:
+                head = head_of[current]
+            for cluster in path:
+                state[cluster] = 2
+                head_of[cluster] = head
+
+        self.used, self.refcount, self.head_of, self.ended, self.end_ok = used, refcount, head_of, ended, end_ok
+        self.cross_linked = [number for number, count in enumerate(refcount) if count > 1]
+        self.in_cycles = [number for number in range(size) if used[number] and not ended[number]]
+        self.used_count = sum(used)
+        self.free_count = used[const.FAT_CLUSTER_TO_USE_FROM:].count(False)
+        self._following = following
+
+    def is_cluster_number(self, number: int) -> bool:
+        return const.FAT_ENTRY_CLUSTER_MIN <= number < self.size
+
+    def lost(self, referenced: Iterable[int]) -> List[int]:
+        """Used clusters which chains don't start at any of `referenced` clusters
+        """
+        referenced = set(referenced)
+        # chains of referenced clusters which aren't heads (they loop back) are followed one by one
+        looped = set()
+        for number in referenced:
+            if self.is_cluster_number(number) and self.used[number] and self.head_of[number] != number:
+                current = number
+                while current != -1 and current not in looped:
+                    looped.add(current)
+                    current = int(self._following[current])
+
+        if self.use_numpy:
+            starts = numpy.zeros(self.size, dtype=bool)
+            starts[numpy.fromiter(referenced, dtype=numpy.int64)] = True
+            reachable = (self.head_of >= 0) & starts[numpy.maximum(self.head_of, 0)]
+            reachable[numpy.fromiter(looped, dtype=numpy.int64)] = True
+            return numpy.flatnonzero(self.used & ~reachable).tolist()
+
+        return [
+            number for number in range(self.size)
+            if self.used[number] and self.head_of[number] not in referenced and number not in looped
+        ]
+
+    def predecessors(self, targets: Set[int]) -> Dict[int, List[int]]:
+        """Clusters linking to each of `targets`
+        """
+        result = {target: [] for target in targets}
+        if self.use_numpy:
+            sources, links = self._links
+            selected = numpy.isin(links, numpy.fromiter(targets, dtype=numpy.int64))
+            pairs = zip(sources[selected].tolist(), links[selected].tolist())
+        else:
+            pairs = ((source, target) for source, target in enumerate(self._following) if target in result)
+        for source, target in pairs:
+            result[target].append(source)
+        return result
+
+
+def entry_problem(table: TableCheck, first_cluster: int, referenced: Dict[int, str]) -> str or None:
+    if not table.is_cluster_number(first_cluster):
+        return INVALID
+    if not table.used[first_cluster]:
+        return FREE
+    if not table.ended[first_cluster]:
+        return CYCLE
+    if table.refcount[first_cluster]:
+        return INSIDE
+    if first_cluster in referenced:
+        return f'{SHARED} {referenced[first_cluster]}'
+    if not table.end_ok[first_cluster]:
+        return BROKEN
+    return None
+
+
+def check_tree(fat: FAT, table: TableCheck) -> Tuple[Dict[int, str], List[dict], int, int]:
+    """Cross-check entries of all directories with the table. Returns first clusters of entries
+    which own their chains (with their paths), problems of entries, numbers of directories and files.
+    """
+    referenced = {const.ROOT_FILE_NUM: '/'}
+    bad_entries = []
+    dirs = files = 0
+    problem = entry_problem(table, const.ROOT_FILE_NUM, {})
+    if problem is not None:
+        bad_entries.append({'path': '/', 'cluster': const.ROOT_FILE_NUM, 'problem': problem})
+        return referenced, bad_entries, dirs, files
+
+    pending = [('/', const.ROOT_FILE_NUM)]
+    while pending:
+        path, cluster_number = pending.pop()
+        for entry in fat.scandir(path, cluster_number):
+            if entry.is_dir():
+                dirs += 1
+            else:
+                files += 1
+            first_cluster = entry.first_file_cluster
+            problem = entry_problem(table, first_cluster, referenced)
+            if problem is not None:
+                bad_entries.append({'path': entry.path, 'cluster': first_cluster, 'problem': problem})
+            if problem is None or not problem.startswith(REMOVED_PROBLEMS):
+                referenced[first_cluster] = entry.path
+            # only directories with sound chains are read
+            if problem is None and entry.is_dir():
+                pending.append((entry.path, first_cluster))
+    return referenced, bad_entries, dirs, files
+
+
+def cycle_breaks(entries, in_cycles: List[int]) -> List[int]:
+    """Clusters which links close cycles
+    """
+    in_cycles_set = set(in_cycles)
+    seen = set()
+    breaks = []
+    for number in in_cycles:
+        path = set()
+        current = number
+        while current not in seen:
+            seen.add(current)
+            path.add(current)
+            following = entries[current]
+            if following in path:
+                breaks.append(current)
+                break
+            if following not in in_cycles_set:
+                break
+            current = following
+    return breaks
+
+
+def check(fat: FAT, repair: bool=False) -> dict:
+    """Check the volume, repair it if `repair` (the volume shouldn't be used by others meanwhile).
+    Clusters of deleted files which are not freed yet (see `FAT.reclaim`) are freed first.
+    """
+    fat.reclaim()
+    table = TableCheck(fat.entries, fat.max_clusters)
+    referenced, bad_entries, dirs, files = check_tree(fat, table)
+    lost = table.lost(referenced)
+    report = {
+        'backend': 'numpy' if table.use_numpy else 'python',
+        'clusters': fat.max_clusters - const.FAT_CLUSTER_TO_USE_FROM,
+        'used_clusters': table.used_count,
+        'directories': dirs,
+        'files': files,
+        'bad_links': table.bad_links,
+        'free_links': table.free_links,
+        'cross_linked': table.cross_linked,
+        'cycles': table.in_cycles,
+        'bad_entries': bad_entries,
+        'lost_clusters': len(lost),
+        'lost_chains': sum(1 for number in lost if table.head_of[number] == number),
+        'free_count': table.free_count,
+        'fsinfo_free_count': None if fat.fsinfo.free_count == FSInfo.UNKNOWN else fat.fsinfo.free_count,
+    }
+    report['errors'] = (
+        len(table.bad_links) + len(table.free_links) + len(table.cross_linked) + len(table.in_cycles)
+        + len(bad_entries) + len(lost) + (report['fsinfo_free_count'] not in (None, table.free_count))
+    )
+    if repair and report['errors']:
+        repair_volume(fat, table, bad_entries)
+        report['remaining_errors'] = check(fat)['errors']
+    return report
+
+
+def repair_volume(fat: FAT, table: TableCheck, bad_entries: List[dict]):
+    for bad_entry in bad_entries:
+        if bad_entry['problem'].startswith(REMOVED_PROBLEMS) and bad_entry['path'] != '/':
+            directory, filename, extension = fat.find_parent(bad_entry['path'])
+            with directory.lock:
+                directory.remove_entry(filename, extension)
+                fat.save_dir(directory)
+            fat.dentries.invalidate(bad_entry['path'])
+
+    ends = set(table.bad_links) | set(table.free_links)
+    # a cross-linked cluster stays in the chain of its first predecessor
+    for sources in table.predecessors(set(table.cross_linked)).values():
+        ends.update(sorted(sources)[1:])
+    ends.update(cycle_breaks(fat.entries, table.in_cycles))
+    with fat.table_lock.write:
+        for number in ends:
+            fat.set_entry(number, const.EOC)
+        fat.chain_indexes.clear()
+
+    # the tree is sound now: clusters which no entry reaches are lost
+    table = TableCheck(fat.entries, fat.max_clusters, table.use_numpy)
+    referenced, _, _, _ = check_tree(fat, table)
+    lost = table.lost(referenced)
+    with fat.alloc_lock:
+        # the index could be built from the broken table: rebuild it, it corrects the free count of FSInfo
+        fat._free_space = None
+        fat.free_space
+    if lost:
+        fat.free_clusters(lost)
+    fat.save()
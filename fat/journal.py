@@ -0,0 +1,152 @@
+"""Write-ahead journal of metadata changes
+
+Changes of FAT entries and directory slots are logged as records before they're written in place.
+Records of many operations are committed together as one group with one fsync (group commit):
+a thread which commits while another one is syncing waits for it and commits everything logged
+meanwhile at once. Directory slots are written in place only after their group is committed,
+and FAT sectors only by a checkpoint (`FAT.sync`), which makes the volume durable and empties
+the journal (so the FAT is kept in memory, it isn't mapped with the journal). A journal left
+by a crash is replayed when the volume is loaded.
+
+A group is: header (magic, sequence number, size of records), records, CRC32 of the records.
+A torn group at the end of the journal (a crash during its commit) is ignored.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# (cluster, offset, data or None for a cleared cluster, an object to keep alive until it's written)
+Write = Tuple[int, int, Optional[bytes], object]
+
+
+class Journal:
+    """Journal file of a volume
+    """
+
+    MAGIC = b'FATJ'
+    GROUP_HEADER = struct.Struct('<4sQI')
+    GROUP_TRAILER = struct.Struct('<I')
+
+    ENTRY = 1  # a FAT entry: cluster, value
+    WRITE = 2  # directory slots: cluster, offset in the cluster, length, data
+    CLEAR = 3  # a cleared cluster (a new directory cluster): cluster
+    ENTRY_RECORD = struct.Struct('<BII')
+    WRITE_RECORD = struct.Struct('<BIII')
+    CLEAR_RECORD = struct.Struct('<BI')
+
+    def __init__(self, path: str):
+        self.path = path                      # type: str
+        self.sequence = 0                     # type: int  # of the last committed group
+        self.commits = 0                      # type: int  # groups written (fsyncs)
+        self.size = 0                         # type: int  # bytes in the journal file
+        self._buffer = bytearray()            # records which aren't committed yet
+        self._writes = []                     # type: List[Write]  # directory slots to write after the commit
+        self._lock = threading.Lock()         # guards the buffer
+        self._commit_lock = threading.RLock()  # held while a group is written and applied, and by checkpoints
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o666)
+        self.size = os.fstat(self._fd).st_size
+
+    @property
+    def commit_lock(self) -> threading.RLock:
+        return self._commit_lock
+
+    @property
+    def pending(self) -> int:
+        """Bytes of records which aren't committed yet
+        """
+        return len(self._buffer)
+
+    def log_entry(self, cluster: int, value: int):
+        with self._lock:
+            self._buffer += self.ENTRY_RECORD.pack(self.ENTRY, cluster, value)
+
+    def log_write(self, cluster: int, offset: int, data: Optional[bytes], owner: object=None):
+        """Log directory slots (a cleared cluster if `data` is None), they're written by the commit
+        """
+        with self._lock:
+            if data is None:
+                self._buffer += self.CLEAR_RECORD.pack(self.CLEAR, cluster)
+            else:
+                self._buffer += self.WRITE_RECORD.pack(self.WRITE, cluster, offset, len(data))
+                self._buffer += data
+            self._writes.append((cluster, offset, data, owner))
+
+    def revoke(self, clusters: List[int]):
+        """Drop not written slots of freed clusters, so they aren't written over the next owners.
+        The logged records stay: replay skips writes followed by freeing of their clusters.
+        """
+        freed = set(clusters)
+        with self._commit_lock, self._lock:
+            self._writes = [write for write in self._writes if write[0] not in freed]
+
+    def commit(self, apply: Callable[[List[Write]], None]) -> int:
+        """Write logged records as one group and fsync it, then `apply` the directory slots of the group.
+        Returns the size of the group, 0 if there was nothing to commit (records logged before
+        the call are committed by another thread already then).
+        """
+        with self._commit_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                records, writes = bytes(self._buffer), self._writes
+                self._buffer.clear()
+                self._writes = []
+            self.sequence += 1
+            group = (self.GROUP_HEADER.pack(self.MAGIC, self.sequence, len(records)) + records
+                     + self.GROUP_TRAILER.pack(zlib.crc32(records)))
+            os.write(self._fd, group)
+            os.fsync(self._fd)
+            self.size += len(group)
+            self.commits += 1
+            apply(writes)
+        return len(group)
+
+    def reset(self):
+        """Empty the journal after a checkpoint (the caller holds `commit_lock`)
+        """
+        os.ftruncate(self._fd, 0)
+        os.fsync(self._fd)
+        self.size = 0
+
+    def records(self) -> Iterator[tuple]:
+        """Records of committed groups in the journal file: (ENTRY, cluster, value),
+        (WRITE, cluster, offset, data) and (CLEAR, cluster)
+        """
+        data = os.pread(self._fd, self.size, 0)
+        position = 0
+        while position + self.GROUP_HEADER.size <= len(data):
+            magic, sequence, size = self.GROUP_HEADER.unpack_from(data, position)
+            start = position + self.GROUP_HEADER.size
+            end = start + size
+            if magic != self.MAGIC or end + self.GROUP_TRAILER.size > len(data):
+                return
+            records = data[start:end]
+            if self.GROUP_TRAILER.unpack_from(data, end)[0] != zlib.crc32(records):
+                return
+            self.sequence = sequence
+            yield from self._parse(records)
+            position = end + self.GROUP_TRAILER.size
+
+    def _parse(self, records: bytes) -> Iterator[tuple]:
+        position = 0
+        while position < len(records):
+            kind = records[position]
+            if kind == self.ENTRY:
+                yield self.ENTRY_RECORD.unpack_from(records, position)
+                position += self.ENTRY_RECORD.size
+            elif kind == self.WRITE:
+                _, cluster, offset, length = self.WRITE_RECORD.unpack_from(records, position)
+                position += self.WRITE_RECORD.size
+                yield self.WRITE, cluster, offset, records[position:position + length]
+                position += length
+            else:
+                yield self.CLEAR_RECORD.unpack_from(records, position)
+                position += self.CLEAR_RECORD.size
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
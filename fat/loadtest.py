@@ -0,0 +1,96 @@
+"""Load test of the volume server: requests/sec and latency percentiles
+
+    $ python -m fat serve /tmp/fat.sock &
+    $ python -m fat.loadtest /tmp/fat.sock --clients 16 --requests 1000 --pipeline 4
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import List
+
+from fat.client import Client
+from fat.exceptions import FATException
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def prepare(socket_path: str, files: int, file_size: int) -> List[str]:
+    paths = [f'/loadtest/f{i}.bin' for i in range(files)]
+    async with await Client.connect(socket_path) as client:
+        try:
+            await client.mkdir('/loadtest')
+        except FATException:
+            pass  # left from a previous run
+        for path in paths:
+            try:
+                await client.touch(path)
+            except FATException:
+                pass
+            await client.write(path, bytes(file_size))
+        await client.commit()
+    return paths
+
+
+async def run_client(socket_path: str, paths: List[str], requests: int, pipeline: int, write_ratio: float,
+                     file_size: int, latencies: List[float]):
+    payload = b'x' * file_size
+    async with await Client.connect(socket_path) as client:
+
+        async def worker(count: int):
+            for _ in range(count):
+                path = random.choice(paths)
+                started = time.perf_counter()
+                if random.random() < write_ratio:
+                    await client.write(path, payload)
+                else:
+                    await client.read(path)
+                latencies.append(time.perf_counter() - started)
+
+        # `pipeline` requests of the client are in flight at once
+        await asyncio.gather(*(worker(requests // pipeline) for _ in range(pipeline)))
+
+
+async def load_test(args) -> dict:
+    paths = await prepare(args.socket_path, args.files, args.file_size)
+    latencies = []  # type: List[float]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(args.socket_path, paths, args.requests, args.pipeline, args.write_ratio, args.file_size, latencies)
+        for _ in range(args.clients)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add = parser.add_argument
+
+    add('socket_path', help='Unix socket of a running volume server')
+    add('--clients', type=int, default=8, help='concurrent connections')
+    add('--requests', type=int, default=500, help='requests per connection')
+    add('--pipeline', type=int, default=1, help='requests in flight per connection')
+    add('--files', type=int, default=32, help='files used by the test')
+    add('--file-size', type=int, default=4096, help='bytes read/written per request')
+    add('--write-ratio', type=float, default=0.2, help='share of write requests')
+
+    result = asyncio.run(load_test(parser.parse_args()))
+    print(
+        f"{result['requests']} requests in {result['seconds']:.3f}s: {result['requests_per_sec']:.1f} req/sec, "
+        f"p50 {result['p50_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Wire format of the volume server
+
+Every message is a JSON header on one line, optionally followed by a body.
+A body is streamed as chunks: 4-byte big-endian length + data, an empty chunk ends the body.
+The optional "size" of a write request is the total body size, known in advance.
+
+    request:  {"op": "write", "path": "/foo/test.txt", "body": true, "size": 11}\\n <chunks>
+    response: {"ok": true, "body": false}\\n
+              {"ok": false, "error": "..."}\\n
+"""
+
+import asyncio
+import json
+import struct
+from typing import AsyncIterator, Iterable
+
+CHUNK_HEADER = struct.Struct('>I')
+CHUNK_SIZE = 0x10000  # bytes
+
+OPERATIONS = ('mkdir', 'touch', 'read', 'write', 'stat', 'commit')
+
+
+def encode_header(header: dict) -> bytes:
+    return json.dumps(header, separators=(',', ':')).encode() + b'\n'
+
+
+async def read_header(reader: asyncio.StreamReader) -> dict or None:
+    """Read the next message header, None if the connection is closed
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+async def read_chunks(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while True:
+        size, = CHUNK_HEADER.unpack(await reader.readexactly(CHUNK_HEADER.size))
+        if not size:
+            return
+        yield await reader.readexactly(size)
+
+
+async def write_chunks(writer: asyncio.StreamWriter, chunks: Iterable[bytes]):
+    """Stream a body, waiting for the transport buffer to drain after every chunk
+    """
+    for chunk in chunks:
+        if chunk:
+            writer.write(CHUNK_HEADER.pack(len(chunk)))
+            writer.write(chunk)
+            await writer.drain()
+    writer.write(CHUNK_HEADER.pack(0))
+
+
+def split_body(data: bytes, chunk_size: int=CHUNK_SIZE) -> Iterable[bytes]:
+    view = memoryview(data)
+    return (view[i:i + chunk_size] for i in range(0, len(view), chunk_size))
@@ -0,0 +1,148 @@
+"""Long-running volume server
+
+One FAT (with its caches) stays loaded and serves requests of many clients over a Unix socket.
+Requests of a connection are handled in order, so clients can pipeline them; the event loop
+serializes FAT operations of all connections. Changes are committed on `commit` requests,
+every `commit_interval` seconds and on shutdown. Metadata changes between them are logged
+to the journal, so a crashed server loses at most the not committed group of them.
+"""
+
+import asyncio
+import os
+
+from fat import constants as const
+from fat.core import FAT
+from fat.exceptions import FATException
+from fat.file import File
+from fat.protocol import CHUNK_SIZE, OPERATIONS, encode_header, read_chunks, read_header, write_chunks
+
+
+class FATServer:
+
+    def __init__(self, fat: FAT, socket_path: str, commit_interval: float=None):
+        self.fat = fat                            # type: FAT
+        self.socket_path = socket_path            # type: str
+        self.commit_interval = commit_interval    # type: float
+        self.requests = 0                         # type: int
+
+        self._server = None                       # type: asyncio.AbstractServer
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self.handle_connection, path=self.socket_path)
+
+    async def serve_forever(self):
+        await self.start()
+        committer = asyncio.ensure_future(self._commit_periodically()) if self.commit_interval else None
+        try:
+            await self._server.serve_forever()
+        finally:
+            if committer is not None:
+                committer.cancel()
+            await self.close()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self.fat.save()
+
+    async def _commit_periodically(self):
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            self.fat.save()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_header(reader)
+                except ValueError:
+                    # not a JSON line: the next one can be a correct request
+                    writer.write(encode_header({'ok': False, 'error': 'Malformed request'}))
+                    await writer.drain()
+                    continue
+                if request is None:
+                    break
+                await self.handle_request(request, reader, writer)
+                self.requests += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, request: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        if not isinstance(request, dict):
+            request = {}
+        op = request.get('op')
+        try:
+            if op not in OPERATIONS:
+                raise FATException(f'Unknown operation: {op}')
+            handler = getattr(self, f'op_{op}')
+            await handler(request, reader, writer)
+        except (FATException, KeyError, TypeError, ValueError) as e:
+            if request.get('body') and op == 'write':
+                # skip the rest of the request body
+                async for _ in read_chunks(reader):
+                    pass
+            error = str(e) if isinstance(e, FATException) else f'Malformed request: {e!r}'
+            writer.write(encode_header({'ok': False, 'error': error}))
+        await writer.drain()
+
+    @staticmethod
+    def _path(request: dict) -> str:
+        path = request.get('path')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise FATException(f'Incorrect path: {path!r}')
+        return path
+
+    async def op_mkdir(self, request: dict, reader, writer):
+        path = self._path(request)
+        self.fat.create_file(path, is_dir=True)
+        writer.write(encode_header({'ok': True}))
+
+    async def op_touch(self, request: dict, reader, writer):
+        path = self._path(request)
+        self.fat.create_file(path)
+        writer.write(encode_header({'ok': True}))
+
+    async def op_stat(self, request: dict, reader, writer):
+        path = self._path(request)
+        writer.write(encode_header({'ok': True, 'stat': self.fat.stat(path)}))
+
+    async def op_commit(self, request: dict, reader, writer):
+        self.fat.save()
+        writer.write(encode_header({'ok': True}))
+
+    async def op_read(self, request: dict, reader, writer):
+        path = self._path(request)
+        file = File(self.fat, self.fat.find_file(path))
+        writer.write(encode_header({'ok': True, 'body': True}))
+        await write_chunks(writer, file.chunks(CHUNK_SIZE))
+
+    async def op_write(self, request: dict, reader, writer):
+        path = self._path(request)
+        file_number = self.fat.find_file(path)
+        if request.get('size') is not None:
+            # the whole body size is known: reserve its clusters at once
+            self.fat.preallocate(file_number, request['size'])
+        file = File(self.fat, file_number, 'r+')
+        received = 0
+        async for chunk in read_chunks(reader):
+            received += file.write(chunk)
+        # the body replaces the content: clusters of a longer old content are freed
+        self.fat.truncate(file_number, received)
+        writer.write(encode_header({'ok': True}))
+
+
+def serve(socket_path: str, commit_interval: float=None, cache_size: int=const.CACHE_SIZE):
+    """Serve the volume until interrupted
+    """
+    with FAT(cache_size=cache_size, io_mode=const.IOMode.PERSISTENT, journal=True) as fat:
+        server = FATServer(fat, socket_path, commit_interval)
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
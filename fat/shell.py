@@ -0,0 +1,122 @@
+"""Batch and interactive modes of the CLI: many operations on one loaded volume,
+committed at the end or at explicit `commit` checkpoints
+"""
+
+import cmd
+import shlex
+import sys
+import time
+from typing import Iterable
+
+from fat.core import FAT
+from fat.exceptions import FATException
+
+
+class Shell(cmd.Cmd):
+    """Commands: mkdir, rmdir, touch, rm, write, read, ls, du, commit, stats, quit
+    """
+
+    intro = 'FAT shell. Type help or ? to list commands.'
+    prompt = 'fat> '
+
+    def __init__(self, fat: FAT, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        self.fat = fat                        # type: FAT
+        self.operations = 0                   # type: int
+        self.started = time.perf_counter()    # type: float
+
+    def emptyline(self):
+        # don't repeat the last command
+        pass
+
+    def default(self, line: str):
+        raise FATException(f'Unknown command: {line}')
+
+    def do_mkdir(self, arg: str):
+        """mkdir <path>: create a directory"""
+        self.fat.create_file(arg.strip(), is_dir=True)
+        self.operations += 1
+
+    def do_rmdir(self, arg: str):
+        """rmdir [-r] <path>: delete a directory (with its content if -r)"""
+        *options, path_name = arg.split()
+        self.fat.rmdir(path_name, recursive='-r' in options)
+        self.operations += 1
+
+    def do_rm(self, arg: str):
+        """rm <path>: delete a file"""
+        self.fat.unlink(arg.strip())
+        self.operations += 1
+
+    def do_touch(self, arg: str):
+        """touch <path> [size]: create a file, reserving clusters for `size` bytes"""
+        path_name, *size = arg.split()
+        self.fat.create_file(path_name, size=int(size[0]) if size else None)
+        self.operations += 1
+
+    def do_write(self, arg: str):
+        """write <path> <data>: write data to a file (quote data with spaces)"""
+        path_name, *data = shlex.split(arg)
+        self.fat.write_file(self.fat.find_file(path_name), ' '.join(data).encode())
+        self.operations += 1
+
+    def do_read(self, arg: str):
+        """read <path>: print content of a file"""
+        print(self.fat.read_file(self.fat.find_file(arg.strip())).decode(), file=self.stdout)
+        self.operations += 1
+
+    def do_ls(self, arg: str):
+        """ls [-R] [path]: list a directory (its whole tree with -R)"""
+        options = arg.split()
+        recursive = '-R' in options
+        path_name = next((option for option in options if option != '-R'), '/')
+        for entry in self.fat.walk(path_name) if recursive else self.fat.scandir(path_name):
+            name = entry.path if recursive else entry.name
+            print(f'{name}/' if entry.is_dir() else name, file=self.stdout)
+        self.operations += 1
+
+    def do_du(self, arg: str):
+        """du [path]: print bytes taken by a file or directory with all its content"""
+        print(self.fat.du(arg.strip() or '/'), file=self.stdout)
+        self.operations += 1
+
+    def do_commit(self, arg: str):
+        """commit: save all changes to the volume"""
+        self.fat.save()
+
+    def do_stats(self, arg: str):
+        """stats: print throughput of the session"""
+        self.report(self.stdout)
+
+    def do_quit(self, arg: str):
+        """quit: commit changes and exit"""
+        return True
+
+    do_EOF = do_quit
+
+    def onecmd(self, line: str):
+        try:
+            return super().onecmd(line)
+        except (FATException, ValueError) as e:
+            # interactive session goes on after a failed command
+            print(f'error: {e}', file=self.stdout)
+
+    def run_batch(self, lines: Iterable[str]):
+        """Execute commands line by line, stops at the first failed one
+        """
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                if super().onecmd(line):
+                    break
+            except (FATException, ValueError) as e:
+                raise FATException(f'line {line_number}: {e}') from e
+
+    def report(self, file=None):
+        """Print the number of operations and throughput (to stderr by default)
+        """
+        elapsed = time.perf_counter() - self.started
+        rate = self.operations / elapsed if elapsed else 0
+        print(f'{self.operations} operations in {elapsed:.3f}s ({rate:.1f} ops/sec)', file=file or sys.stderr)
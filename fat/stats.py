@@ -0,0 +1,113 @@
+"""Instrumentation of FAT operations: counters, latency histograms and trace hooks
+
+Statistics are disabled by default: an instrumented operation only checks `Stats.enabled` then.
+
+    fat = FAT(stats=True)
+    fat.stats.add_hook(lambda operation, seconds: print(operation, seconds))
+    ...
+    fat.collect_stats()
+"""
+
+import functools
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+TraceHook = Callable[[str, float], None]
+
+
+class Histogram:
+    """Latencies in power-of-two buckets of microseconds (bucket N holds latencies below 2**N us)
+    """
+
+    def __init__(self):
+        self.buckets = defaultdict(int)  # type: Dict[int, int]
+        self.count = 0                   # type: int
+        self.total = 0.0                 # type: float  # seconds
+        self.max = 0.0                   # type: float  # seconds
+
+    def add(self, seconds: float):
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket with the percentile (in seconds)
+        """
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class Stats:
+    """Counters (calls, bytes, clusters, ...) and latencies of operations
+    """
+
+    def __init__(self, enabled: bool=False):
+        self.enabled = enabled                 # type: bool
+        self.counters = defaultdict(int)       # type: Dict[str, int]
+        self.latencies = defaultdict(Histogram)  # type: Dict[str, Histogram]
+        self.hooks = []                        # type: List[TraceHook]
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: TraceHook):
+        """Call `hook(operation, seconds)` after every timed operation
+        """
+        self.hooks.append(hook)
+
+    def count(self, name: str, value: int=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record(self, operation: str, seconds: float):
+        with self._lock:
+            self.counters[f'{operation}.calls'] += 1
+            self.latencies[operation].add(seconds)
+        for hook in self.hooks:
+            hook(operation, seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.latencies.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': dict(sorted(self.counters.items())),
+                'latency': {operation: histogram.summary() for operation, histogram in sorted(self.latencies.items())},
+            }
+
+
+def timed(operation: str):
+    """Count calls and record latencies of a method of an object with `stats`
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if not stats.enabled:
+                return method(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.record(operation, time.perf_counter() - started)
+        return wrapper
+    return decorator
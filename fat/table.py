@@ -0,0 +1,82 @@
+"""Compact storage of FAT entries
+
+Entries are kept as raw 4-byte little-endian words instead of a list of Python ints:
+- `array('I')` loaded from the FAT region with a single copy (default)
+- `MappedTable`: a memory map over the FAT region of the volume file, opening it costs O(1)
+  and changed entries are written back by the OS page cache
+
+Both of them support the same indexing API as a list (`entries[n]`, `entries[n] = value`, `len`, slices).
+"""
+
+import mmap
+import sys
+from array import array
+
+from fat.exceptions import FATException
+
+ENTRY_SIZE = 4  # bytes
+ENTRY_TYPECODE = next(code for code in 'IL' if array(code).itemsize == ENTRY_SIZE)
+
+
+def new_entries(count: int) -> array:
+    """Create a table of `count` empty entries
+    """
+    return array(ENTRY_TYPECODE, bytes(count * ENTRY_SIZE))
+
+
+def entries_from_bytes(data: bytes) -> array:
+    """Load entries from the raw FAT region
+    """
+    entries = array(ENTRY_TYPECODE)
+    entries.frombytes(data[:len(data) - len(data) % ENTRY_SIZE])
+    if sys.byteorder == 'big':
+        entries.byteswap()
+    return entries
+
+
+def entries_to_bytes(entries) -> bytes:
+    """Serialize entries into the raw FAT region
+    """
+    if isinstance(entries, array):
+        if sys.byteorder == 'big':
+            entries = array(ENTRY_TYPECODE, entries)
+            entries.byteswap()
+        return entries.tobytes()
+    return bytes(entries)
+
+
+class MappedTable:
+    """FAT entries mapped directly from the FAT region of the volume file
+    """
+
+    def __init__(self, volume_path: str, offset: int, count: int):
+        if sys.byteorder == 'big':
+            raise FATException('Memory mapped FAT table is supported on little-endian hosts only')
+
+        self.offset = offset                           # type: int
+        self.size = count * ENTRY_SIZE                 # type: int
+
+        # the mapping offset has to be aligned to the allocation granularity
+        self._map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self._file = open(volume_path, 'r+b')
+        self._file.seek(0, 2)
+        if self._file.tell() < offset + self.size:
+            self._file.truncate(offset + self.size)
+        self._map = mmap.mmap(
+            self._file.fileno(), offset - self._map_offset + self.size, offset=self._map_offset
+        )
+        view = memoryview(self._map)
+        self._raw = view[offset - self._map_offset:]
+        self.entries = self._raw.cast(ENTRY_TYPECODE)  # type: memoryview
+        view.release()
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map.closed:
+            return
+        self.entries.release()
+        self._raw.release()
+        self._map.close()
+        self._file.close()
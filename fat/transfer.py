@@ -0,0 +1,127 @@
+"""Bulk import/export between a host directory tree and the volume
+
+The tree is created first (all directories, then all files with clusters preallocated
+for their known sizes), after that file bodies are copied by a pool of threads,
+so reads of host files overlap with writes to the volume.
+
+Directory entries don't store file sizes yet, so exported files have the content of all
+their clusters (up to the end of the volume file).
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from fat.core import FAT
+from fat.exceptions import FATException
+from fat.file import File
+
+CHUNK_SIZE = 0x100000  # bytes copied at once
+WORKERS = 4
+
+
+def _volume_path(vol_dir: str, relative_path: str) -> str:
+    parts = [part for part in relative_path.split(os.sep) if part and part != '.']
+    return '/'.join([vol_dir.rstrip('/')] + parts) or '/'
+
+
+def _copy_to_volume(fat: FAT, host_path: str, file_number: int) -> int:
+    copied = 0
+    with open(host_path, 'rb', buffering=0) as source:
+        target = File(fat, file_number, 'r+')
+        buffer = bytearray(CHUNK_SIZE)
+        while True:
+            size = source.readinto(buffer)
+            if not size:
+                break
+            target.write(memoryview(buffer)[:size])
+            copied += size
+    return copied
+
+
+def _copy_from_volume(fat: FAT, file_number: int, host_path: str) -> int:
+    copied = 0
+    with open(host_path, 'wb') as target:
+        for chunk in File(fat, file_number).chunks(CHUNK_SIZE):
+            target.write(chunk)
+            copied += len(chunk)
+    return copied
+
+
+def import_tree(fat: FAT, host_dir: str, vol_dir: str, workers: int=WORKERS) -> dict:
+    """Copy a host directory tree into the volume directory `vol_dir` (created if it doesn't exist)
+    """
+    started = time.perf_counter()
+    if not os.path.isdir(host_dir):
+        raise FATException(f'{host_dir} is not a directory')
+    if fat.find_dir(vol_dir) is None:
+        fat.create_file(vol_dir.rstrip('/'), is_dir=True)
+
+    dirs = []   # type: List[str]
+    files = []  # type: List[Tuple[str, str, int]]
+    for root, dir_names, file_names in os.walk(host_dir):
+        relative_root = os.path.relpath(root, host_dir)
+        dir_names.sort()
+        for name in dir_names:
+            dirs.append(_volume_path(vol_dir, os.path.join(relative_root, name)))
+        for name in sorted(file_names):
+            host_path = os.path.join(root, name)
+            files.append((host_path, _volume_path(vol_dir, os.path.join(relative_root, name)),
+                          os.path.getsize(host_path)))
+
+    # os.walk is top-down: parents are created before their subdirectories
+    for path in dirs:
+        fat.create_file(path, is_dir=True)
+
+    # allocate all the files with their sizes, so their chains are contiguous
+    jobs = []  # type: List[Tuple[str, int]]
+    for host_path, path, size in files:
+        jobs.append((host_path, fat.create_file(path, size=size)))
+
+    with fat.volume, ThreadPoolExecutor(max_workers=workers) as pool:
+        copied = sum(pool.map(lambda job: _copy_to_volume(fat, *job), jobs))
+
+    return _report(len(dirs), len(files), copied, started)
+
+
+def export_tree(fat: FAT, vol_dir: str, host_dir: str, workers: int=WORKERS) -> dict:
+    """Copy a volume directory tree into a host directory (created if it doesn't exist)
+    """
+    started = time.perf_counter()
+    directory = fat.find_dir(vol_dir)
+    if directory is None:
+        raise FATException(f'{vol_dir} directory does not exist')
+
+    dirs = 0
+    files = []  # type: List[Tuple[int, str]]
+    pending = [(directory, host_dir)]
+    while pending:
+        directory, host_path = pending.pop()
+        os.makedirs(host_path, exist_ok=True)
+        for entry in directory.entries:
+            # skip unused slots
+            if not entry.filename:
+                continue
+            entry_path = os.path.join(host_path, entry.fullname)
+            if entry.is_dir():
+                dirs += 1
+                pending.append((fat.read_dir(entry.first_file_cluster), entry_path))
+            else:
+                files.append((entry.first_file_cluster, entry_path))
+
+    with fat.volume, ThreadPoolExecutor(max_workers=workers) as pool:
+        copied = sum(pool.map(lambda job: _copy_from_volume(fat, *job), files))
+
+    return _report(dirs, len(files), copied, started)
+
+
+def _report(dirs: int, files: int, copied: int, started: float) -> dict:
+    elapsed = time.perf_counter() - started
+    return {
+        'dirs': dirs,
+        'files': files,
+        'bytes': copied,
+        'seconds': elapsed,
+        'mb_per_sec': copied / elapsed / 2**20 if elapsed else 0,
+    }
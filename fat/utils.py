@@ -7,3 +7,34 @@ def split_by_chunks(data: Iterable, chunk_length: int):
         chunk = data[read:read + chunk_length]
         read += chunk_length
         yield chunk
+
+
+def group_consecutive(numbers: Iterable[int]):
+    """Group sorted numbers into runs of consecutive ones, yields (start, length) pairs
+    """
+    run_start = run_length = None
+    for number in numbers:
+        if run_start is not None and number == run_start + run_length:
+            run_length += 1
+            continue
+        if run_start is not None:
+            yield run_start, run_length
+        run_start, run_length = number, 1
+    if run_start is not None:
+        yield run_start, run_length
+
+
+SIZE_SUFFIXES = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(value: str) -> int:
+    """Number of bytes from a string like `4096`, `64K`, `512M`, `2G`
+    """
+    value = value.strip().upper().rstrip('B')
+    multiplier = SIZE_SUFFIXES.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    try:
+        return int(value) * multiplier
+    except ValueError:
+        raise ValueError(f'Incorrect size: {value}') from None
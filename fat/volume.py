@@ -0,0 +1,133 @@
+"""Raw access to the volume file
+"""
+
+import mmap
+import os
+import threading
+
+
+class Volume:
+    """The volume file opened on demand.
+
+    Used as a (reentrant) context manager it keeps one descriptor open for the whole block,
+    outside of it every read/write opens the file for itself. A persistent volume keeps
+    its descriptor open until `close()`.
+    """
+
+    def __init__(self, path: str, persistent: bool=False):
+        self.path = path              # type: str
+        self.persistent = persistent  # type: bool
+        self._fd = None               # type: int
+        self._depth = 0               # type: int
+        self.opens = 0                # type: int  # times the file was opened
+        self._lock = threading.Lock()
+
+        if persistent:
+            self.__enter__()
+
+    def __enter__(self):
+        # the descriptor is shared by all threads: it's closed when the last of them leaves
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR)
+                self.opens += 1
+            self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._lock:
+            self._depth -= 1
+            if not self._depth:
+                os.close(self._fd)
+                self._fd = None
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._depth = 0
+
+    def flush(self):
+        pass
+
+    def fsync(self):
+        """Make written data durable on the disk
+        """
+        with self:
+            os.fsync(self._fd)
+
+    def view(self, position: int, size: int) -> memoryview:
+        """Volume content as a memoryview (a copy unless the volume is mapped)
+        """
+        return memoryview(self.read(position, size))
+
+    def read(self, position: int, size: int) -> bytes:
+        """Read up to `size` bytes (less at the end of the volume file)
+        """
+        with self:
+            return os.pread(self._fd, size, position)
+
+    def readinto(self, position: int, buffer) -> int:
+        """Read into a writable buffer at once, returns the number of bytes read
+        (less than the buffer size at the end of the volume file)
+        """
+        view = memoryview(buffer)
+        total = 0
+        with self:
+            while total < len(view):
+                read = os.preadv(self._fd, [view[total:]], position + total)
+                if not read:
+                    break
+                total += read
+        return total
+
+    def write(self, position: int, data: bytes):
+        with self:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self._fd, view, position)
+                view = view[written:]
+                position += written
+
+
+class MappedVolume(Volume):
+    """The whole volume file mapped into memory: reads and writes are memory copies,
+    `view()` exposes the volume content without copying it
+    """
+
+    def __init__(self, path: str, size: int):
+        super().__init__(path, persistent=True)
+        # the mapping has to cover the whole volume
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._view = memoryview(self._map)
+
+    def close(self):
+        if not self._map.closed:
+            self._view.release()
+            self._map.close()
+        super().close()
+
+    def flush(self):
+        self._map.flush()
+
+    def fsync(self):
+        self._map.flush()
+        os.fsync(self._fd)
+
+    def view(self, position: int, size: int) -> memoryview:
+        return self._view[position:position + size]
+
+    def read(self, position: int, size: int) -> bytes:
+        return bytes(self.view(position, size))
+
+    def readinto(self, position: int, buffer) -> int:
+        view = memoryview(buffer)
+        size = len(self._view[position:position + len(view)])
+        view[:size] = self._view[position:position + size]
+        return size
+
+    def write(self, position: int, data: bytes):
+        self._view[position:position + len(data)] = data
@@ -0,0 +1,81 @@
+"""Tests for the free space index of the FAT
+"""
+
+import random
+
+import pytest
+
+from fat.alloc import FreeSpaceIndex
+from fat.exceptions import FATException
+
+
+class TestFreeSpaceIndex:
+    """Free extents bookkeeping and allocation policy
+    """
+
+    def test_from_entries(self):
+        """Test building extents from FAT entries
+        """
+        entries = [1, 1, 1, 0, 0, 5, 0, 0, 0, 9]
+        index = FreeSpaceIndex.from_entries(entries, 3, len(entries))
+        assert list(index.extents()) == [(3, 2), (6, 3)]
+        assert len(index) == 5
+        assert index.find(5) == 6
+        assert index.find(9) is None
+
+    def test_take_and_release_merge(self):
+        """Test splitting an extent and merging it back on release
+        """
+        index = FreeSpaceIndex.from_entries([0] * 16, 3, 16)
+        index.take(6, 2)
+        assert list(index.extents()) == [(3, 3), (8, 8)]
+        index.release_many([7, 6])
+        assert list(index.extents()) == [(3, 13)]
+        with pytest.raises(FATException):
+            index.release(5)
+
+    def test_allocate_prefers_contiguous_near_goal(self):
+        """Test allocation picks the first extent after the goal which fits all clusters
+        """
+        entries = [1, 1, 1, 0, 1, 0, 0, 1, 0, 0, 0, 0, 1]
+        index = FreeSpaceIndex.from_entries(entries, 3, len(entries))
+        assert index.allocate(3, goal=4) == [8, 9, 10]
+        # no contiguous run left: gather from the goal and wrap around
+        assert index.allocate(3, goal=6) == [6, 11, 3]
+        assert len(index) == 1
+        with pytest.raises(FATException):
+            index.allocate(2)
+
+    def test_allocate_best_fit(self):
+        """Test a known size takes the smallest extent which fits it, unless the goal extent fits
+        """
+        entries = [1, 1, 1, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 1]
+        index = FreeSpaceIndex.from_entries(entries, 3, len(entries))
+        assert index.allocate(2, best_fit=True) == [9, 10]
+        assert index.allocate(2, goal=4, best_fit=True) == [4, 5]
+        assert index.allocate(3, best_fit=True) == [12, 13, 14]
+        assert list(index.extents()) == [(3, 1), (6, 2)]
+
+    def test_size_index_follows_extents(self):
+        """Test extents ordered by size stay in sync with the extents through allocations and releases
+        """
+        rng = random.Random(0)
+        entries = [rng.choice((0, 0, 1)) for _ in range(2000)]
+        index = FreeSpaceIndex.from_entries(entries, 3, len(entries))
+        taken = []
+        for _ in range(500):
+            if taken and rng.random() < 0.4:
+                index.release_many(taken.pop(rng.randrange(len(taken))))
+            elif len(index) > 20:
+                taken.append(index.allocate(rng.randint(1, 20), rng.randrange(3, 2000), best_fit=rng.random() < 0.5))
+            assert index.by_size == sorted((length, start) for start, length in index.extents())
+
+    def test_best_fit_nearest_after_goal(self):
+        """Test the first of equally sized extents after the goal is taken, wrapping around
+        """
+        entries = [1, 1, 1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1]
+        index = FreeSpaceIndex.from_entries(entries, 3, len(entries))
+        assert index.best_fit(2, 5) == 10
+        assert index.best_fit(2, 11) == 3
+        assert index.best_fit(3, 3) == 6
+        assert index.best_fit(4, 3) is None
@@ -0,0 +1,37 @@
+"""Tests for the benchmark harness
+"""
+
+import json
+
+from pathlib import PosixPath
+
+from fat import bench
+
+
+class TestBench:
+    """A small benchmark run
+    """
+
+    def test_run_and_compare(self, tmp_path: PosixPath):
+        """Test every phase is reported, the report is saved as JSON and compared with a baseline
+        """
+        output = tmp_path / 'bench.json'
+        args = bench.build_parser().parse_args([
+            '--files', '20', '--fanout', '2', '--depth', '2', '--fragmentation', '0.5', '--lookups', '10',
+            '--file-size', '10K', '--volume-size', '8M', '--output', output.as_posix(),
+        ])
+        report = bench.run(args)
+
+        assert set(report['results']) == {
+            'create', 'sequential_write', 'find_free_cluster', 'lookup', 'sequential_read', 'random_read',
+            'save', 'load',
+        }
+        assert report['results']['create']['ops'] == 2 + 4 + 20
+        assert report['results']['sequential_read']['bytes'] >= 20 * 10 * 1024
+        assert 'peak_memory_kb' in report['results']['lookup']
+        assert report['volume']['fragmented_files'] >= 10
+
+        output.write_text(json.dumps(report))
+        lines = bench.compare(report, json.loads(output.read_text()))
+        assert len(lines) == len(report['results'])
+        assert all('(+0.0%)' in line for line in lines)
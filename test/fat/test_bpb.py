@@ -0,0 +1,112 @@
+"""Tests for the volume geometry
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.bpb import BPB, FSInfo
+from fat.core import FAT
+from fat.exceptions import FATException
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestBPB:
+    """BPB parsing and volumes of different geometry
+    """
+
+    def test_default_layout(self):
+        """Test the default geometry keeps clusters where volumes without a BPB have them
+        """
+        bpb = BPB.default()
+        assert bpb.cluster_size == const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE
+        assert bpb.cluster_count == const.TOTAL_SECTORS // const.SECTORS_PER_CLUSTER
+        assert bpb.fat_offset == bpb.cluster_size
+        assert bpb.cluster_offset == 0
+
+    def test_serialize_parse(self):
+        """Test a BPB is read back from its sector and a sector without the signature has no BPB
+        """
+        bpb = BPB.new(3 * 2**30, 4096, sector_size=1024)
+        data = bpb.serialize()
+        assert len(data) == 1024
+        assert data[0x1FE:0x200] == b'\x55\xaa'
+
+        parsed = BPB.parse(data)
+        assert vars(parsed) == vars(bpb)
+        assert BPB.parse(bytes(512)) is None
+
+    def test_incorrect_geometry(self):
+        """Test unsupported sector and cluster sizes are rejected
+        """
+        with pytest.raises(FATException):
+            BPB.new(2**20, 4096, sector_size=100)
+        with pytest.raises(FATException):
+            BPB.new(2**20, 3000)
+        with pytest.raises(FATException):
+            BPB.new(2**20, 512 * 256)
+        with pytest.raises(FATException):
+            BPB.new(4096, 4096)
+
+    def test_format(self):
+        """Test a formatted volume is loaded with its geometry
+        """
+        with FAT.format(2**30, 4096) as fat:
+            assert fat.max_clusters > 250000
+            fat.create_file('/dir', is_dir=True)
+            file_number = fat.create_file('/dir/big.bin', size=2**20)
+            data = bytes(range(256)) * 4096
+            fat.write_file(file_number, data)
+
+        fat = FAT()
+        assert (fat.cluster_size, fat.max_clusters) == (4096, fat.bpb.cluster_count)
+        assert fat.get_cluster_position(const.ROOT_FILE_NUM) == fat.bpb.data_offset
+        assert fat.read_file(fat.find_file('/dir/big.bin')) == data
+        assert len(fat.get_cluster_chain(fat.find_file('/dir/big.bin'))) == 256
+
+    @pytest.mark.parametrize('kwargs', [{}, {'mmap_table': True}, {'io_mode': const.IOMode.MMAP}])
+    def test_format_closed_without_saving(self, kwargs: dict):
+        """Test a formatted volume closed before it's saved is opened again with the root directory in use
+        """
+        FAT.format(2**30, 4096, **kwargs).close()
+
+        fat = FAT(**kwargs)
+        assert fat.entries[const.ROOT_FILE_NUM] == const.EOC
+        assert fat.create_file('/a.txt') != const.ROOT_FILE_NUM
+        assert len(fat.free_space) == fat.max_clusters - const.FAT_CLUSTER_TO_USE_FROM - 1
+
+    def test_fsinfo(self):
+        """Test FSInfo is read back from its sector and a sector without signatures has unknown values
+        """
+        data = FSInfo(1000, 42).serialize(4096)
+        assert len(data) == 4096
+        fsinfo = FSInfo.parse(data)
+        assert (fsinfo.free_count, fsinfo.last_allocated) == (1000, 42)
+
+        fsinfo = FSInfo.parse(bytes(512))
+        assert (fsinfo.free_count, fsinfo.last_allocated) == (FSInfo.UNKNOWN, FSInfo.UNKNOWN)
+
+    def test_free_count_and_allocation_hint(self):
+        """Test the free count is known without reading the FAT and allocations continue
+        after the last allocated cluster across reloads
+        """
+        with FAT() as fat:
+            first = fat.create_file('/a.txt')
+            second = fat.create_file('/b.txt', size=fat.cluster_size * 3)
+            fat.free_clusters([first])
+            free_count = len(fat.free_space)
+            assert fat.free_count == free_count
+
+        fat = FAT()
+        assert fat.free_count == free_count
+        assert fat._free_space is None
+        # the freed cluster before the last allocated one isn't reused yet
+        assert fat.create_file('/c.txt') == second + 3
+        assert fat.disk_usage()['free'] == (free_count - 1) * fat.cluster_size
@@ -0,0 +1,87 @@
+"""Tests for the cluster cache
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestClusterCache:
+    """Cluster cache behind `FAT.read_file`/`FAT.write_file`
+    """
+
+    fat: FAT
+
+    def setup_method(self):
+        """Common initialization for every test
+        """
+        self.fat = FAT(cache_size=const.SECTORS_PER_CLUSTER * const.SECTOR_SIZE * 2)
+
+    def read_from_disk(self, number: int, size: int) -> bytes:
+        with open(self.fat.volume_path, 'rb') as volume:
+            volume.seek(self.fat.get_cluster_position(number))
+            return volume.read(size)
+
+    def test_write_back_on_flush(self):
+        """Test written data stays in the cache until flush
+        """
+        file_number = self.fat.create_file('/test.txt')
+        self.fat.write_file(file_number, b'cached data')
+        assert self.read_from_disk(file_number, 11) == b''
+        assert self.fat.read_file(file_number) == b'cached data'
+
+        self.fat.save()
+        assert self.read_from_disk(file_number, 11) == b'cached data'
+        assert self.fat.cache.stats()['dirty'] == 0
+
+    def test_repeated_lookups_hit_cache(self):
+        """Test path lookups read directory clusters from disk only once
+        """
+        self.fat.dentries.max_entries = 0
+        self.fat.create_file('/data', is_dir=True)
+        self.fat.create_file('/data/test.txt')
+        misses = self.fat.cache.misses
+
+        for _ in range(3):
+            self.fat.find_file('/data/test.txt')
+        assert self.fat.cache.misses == misses
+        assert self.fat.cache.hits >= 3
+
+    def test_lru_eviction_writes_back(self):
+        """Test the least recently used dirty cluster is written on eviction
+        """
+        numbers = [self.fat.create_file(f'/f{i}.txt') for i in range(3)]
+        for i, number in enumerate(numbers):
+            self.fat.write_file(number, f'data {i}'.encode())
+
+        # the limit is two clusters: the root and the first file were evicted
+        assert self.fat.cache.size <= self.fat.cache.max_size
+        assert numbers[0] not in self.fat.cache
+        assert self.read_from_disk(numbers[0], 6) == b'data 0'
+        assert self.read_from_disk(numbers[2], 6) == b''
+
+    def test_short_cluster_in_the_middle(self):
+        """Test a cached cluster past the end of the volume file is read as a whole one when
+        the file continues after it
+        """
+        fat = self.fat
+        # nothing is evicted: the clusters stay as short as they were read
+        fat.cache.max_size = const.CACHE_SIZE
+        file_number = fat.create_file('/test.txt')
+        fat.write_file(file_number, b'A' * 100)
+        with fat.open_file('/test.txt', 'r+') as f:
+            f.seek(fat.cluster_size)
+            f.write(b'B' * 10)
+
+        expected = b'A' * 100 + bytes(fat.cluster_size - 100) + b'B' * 10
+        assert fat.read_file(file_number)[:len(expected)] == expected
@@ -0,0 +1,29 @@
+"""Tests for the cluster chain offset index
+"""
+
+from fat.chain import ChainIndex
+
+
+class TestChainIndex:
+    """Logical to physical cluster mapping
+    """
+
+    def test_lookup_and_runs(self):
+        """Test lookups and runs over a fragmented chain
+        """
+        index = ChainIndex.from_chain([10, 11, 12, 40, 41, 7])
+        assert len(index) == 6
+        assert index.logical_starts == [0, 3, 5]
+        assert index.lookup(4) == 41
+        assert index.lookup(5) == 7
+        assert list(index.runs(1, 4)) == [(11, 2), (40, 2)]
+        assert list(index.runs(4, 10)) == [(41, 1), (7, 1)]
+        assert list(index.runs(6, 1)) == []
+
+    def test_append_merges_contiguous_run(self):
+        """Test appended clusters continue the last run when they're contiguous
+        """
+        index = ChainIndex.from_chain([5, 6])
+        index.append([7, 8, 20])
+        assert list(zip(index.physical_starts, index.lengths)) == [(5, 4), (20, 1)]
+        assert index.last_cluster == 20
@@ -0,0 +1,99 @@
+"""Tests for fragmentation report and defragmentation
+"""
+
+import os
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.defrag import Defragmenter, analyze, fragmentation_score
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestDefrag:
+    """Moving chains into contiguous extents
+    """
+
+    def setup_method(self):
+        self.fat = FAT()
+        self.contents = {}
+        self.fat.create_file('/dir', is_dir=True)
+        for path in ('/a.txt', '/dir/b.txt', '/c.txt'):
+            self.fat.create_file(path)
+        # files grow in turns, so their chains interleave
+        for path, fill in (('/a.txt', b'a'), ('/dir/b.txt', b'b'), ('/c.txt', b'c')):
+            self.contents[path] = fill * (self.fat.cluster_size * 2)
+            self.fat.write_file(self.fat.find_file(path), self.contents[path])
+
+    def assert_contents(self, fat: FAT):
+        for path, content in self.contents.items():
+            assert fat.read_file(fat.find_file(path))[:len(content)] == content
+
+    def test_fragmentation_score(self):
+        """Test the score is the share of links between non adjacent clusters
+        """
+        assert fragmentation_score([5]) == 0
+        assert fragmentation_score([3, 4, 5]) == 0
+        assert fragmentation_score([3, 4, 9, 10, 7]) == 0.5
+
+        report = analyze(self.fat)
+        assert [file['path'] for file in report['files']] == ['/a.txt', '/c.txt', '/dir', '/dir/b.txt']
+        assert report['fragmented_files'] == 3
+        assert report['score'] == 1
+
+    def test_defrag(self):
+        """Test all files become contiguous with the same content, which survives reloading
+        """
+        defragmenter = Defragmenter(self.fat)
+        assert defragmenter.run()
+        assert defragmenter.moved == 3
+
+        report = analyze(self.fat)
+        assert report['fragmented_files'] == 0
+        assert report['score'] == 0
+        self.assert_contents(self.fat)
+        self.fat.save()
+        self.assert_contents(FAT())
+
+    def test_defrag_resume(self):
+        """Test an interrupted run continues after the last processed file
+        """
+        first = Defragmenter(self.fat, max_files=1)
+        assert not first.run()
+        assert first.moved == 1
+        assert os.path.isfile(first.checkpoint_path)
+
+        second = Defragmenter(self.fat)
+        assert second.run()
+        assert second.moved == 2
+        assert not os.path.isfile(second.checkpoint_path)
+        assert analyze(self.fat)['fragmented_files'] == 0
+        self.assert_contents(self.fat)
+
+    def test_relocate_dir(self):
+        """Test a moved directory is found by its path and keeps its files
+        """
+        spare = self.fat.allocate_clusters(1)
+        self.fat.create_file('/late', is_dir=True)
+        self.fat.create_file('/late/d.txt')
+        self.contents['/late/d.txt'] = b'd' * 10
+        self.fat.write_file(self.fat.find_file('/late/d.txt'), self.contents['/late/d.txt'])
+        # free space before the directory
+        self.fat.free_clusters(spare)
+
+        dir_entry = self.fat.find_entry('/late')
+        assert self.fat.relocate_file(self.fat.root, dir_entry)
+        assert dir_entry.first_file_cluster == spare[0]
+        assert self.fat.find_dir('/late').cluster_number == spare[0]
+        self.assert_contents(self.fat)
+        self.fat.save()
+        self.assert_contents(FAT())
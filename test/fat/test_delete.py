@@ -0,0 +1,108 @@
+"""Tests for truncating and deleting files and directories
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.exceptions import FATException
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestDelete:
+    """Freeing clusters of truncated and deleted files
+    """
+
+    fat: FAT
+
+    def setup_method(self):
+        """Common initialization for every test
+        """
+        self.fat = FAT()
+        self.free_count = self.fat.free_count
+
+    def test_truncate(self):
+        """Test tail clusters are freed by truncate and by rewriting a file with less data
+        """
+        file_number = self.fat.create_file('/test.txt')
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 4))
+        assert self.fat.free_count == self.free_count - 4
+
+        self.fat.truncate(file_number, self.fat.cluster_size + 1)
+        assert self.fat.get_cluster_chain(file_number) == [file_number, file_number + 1]
+        assert self.fat.free_count == self.free_count - 2
+
+        self.fat.write_file(file_number, b'short')
+        assert self.fat.get_cluster_chain(file_number) == [file_number]
+        assert self.fat.free_count == self.free_count - 1
+        assert self.fat.read_file(file_number)[:5] == b'short'
+
+    def test_unlink(self):
+        """Test a deleted file frees its chain and its slot is reused by the next file
+        """
+        self.fat.create_file('/a.txt')
+        file_number = self.fat.create_file('/b.txt')
+        self.fat.create_file('/c.txt')
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 3))
+
+        self.fat.unlink('/b.txt')
+        assert self.fat.free_count == self.free_count - 2
+        with pytest.raises(FATException):
+            self.fat.find_file('/b.txt')
+        with pytest.raises(FATException):
+            self.fat.unlink('/b.txt')
+
+        self.fat.create_file('/d.txt')
+        assert [entry.fullname for entry in self.fat.root.entries] == ['a.txt', 'd.txt', 'c.txt']
+        self.fat.save()
+        assert [entry.fullname for entry in FAT().root.entries if entry.filename] == ['a.txt', 'd.txt', 'c.txt']
+
+    def test_rmdir(self):
+        """Test a non-empty directory is deleted only recursively with all its content
+        """
+        self.fat.create_file('/data', is_dir=True)
+        self.fat.create_file('/data/sub', is_dir=True)
+        file_number = self.fat.create_file('/data/sub/test.txt')
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 2))
+        assert self.fat.find_dir('/data/sub') is not None
+
+        with pytest.raises(FATException):
+            self.fat.rmdir('/data')
+        with pytest.raises(FATException):
+            self.fat.unlink('/data')
+        with pytest.raises(FATException):
+            self.fat.rmdir('/')
+
+        self.fat.rmdir('/data', recursive=True)
+        assert self.fat.find_dir('/data/sub') is None
+        assert self.fat.find_dir('/data') is None
+        assert self.fat.free_count == self.free_count
+
+        self.fat.create_file('/empty', is_dir=True)
+        self.fat.rmdir('/empty/')
+        assert self.fat.free_count == self.free_count
+
+    def test_deferred_free(self):
+        """Test deferred deletes only remove entries, clusters are freed by reclaim on save
+        """
+        fat = self.fat
+        fat.deferred_free = True
+        fat.create_file('/data', is_dir=True)
+        file_number = fat.create_file('/data/big.bin', size=fat.cluster_size * 10)
+        assert fat.free_count == self.free_count - 11
+
+        fat.rmdir('/data', recursive=True)
+        assert fat.find_dir('/data') is None
+        assert fat.free_count == self.free_count - 11
+
+        fat.save()
+        assert fat.free_count == self.free_count
+        assert fat.entries[file_number] == const.FAT_ENTRY_EMPTY
@@ -0,0 +1,60 @@
+"""Tests for directory tables
+"""
+
+from fat.constants import FileAttributes
+from fat.dir import DirectoryTable
+
+
+class TestDirectoryTable:
+    """Parsing and lookups of directory entries
+    """
+
+    def test_name_index(self):
+        """Test entries are found by the index after adding and after parsing
+        """
+        directory = DirectoryTable(2, b'')
+        for i in range(100):
+            directory.add_entry(f'file{i}', 'txt', i + 3)
+        directory.add_entry('data', '', 200, attributes=FileAttributes.DIRECTORY)
+
+        assert directory.find_entry('file42', 'txt').first_file_cluster == 45
+        assert directory.find_entry('file42', 'bin') is None
+        assert directory.find_dir_entry('file42') is None
+
+        parsed = DirectoryTable(2, directory.serialize())
+        assert parsed.find_entry('file99', 'txt').first_file_cluster == 102
+        assert parsed.find_dir_entry('data').first_file_cluster == 200
+
+    def test_deleted_slots(self):
+        """Test a deleted entry leaves a free slot which is parsed back and reused first
+        """
+        directory = DirectoryTable(2, b'')
+        for i in range(4):
+            directory.add_entry(f'file{i}', 'txt', i + 3)
+        directory.remove_entry('file2', 'txt')
+        directory.remove_entry('file0', 'txt')
+        assert directory.find_entry('file2', 'txt') is None
+
+        parsed = DirectoryTable(2, directory.serialize())
+        assert parsed.free_slots == [0, 2]
+        assert parsed.find_entry('file3', 'txt').first_file_cluster == 6
+        parsed.add_entry('new', 'txt', 10)
+        assert [entry.fullname for entry in parsed.entries] == ['new.txt', 'file1.txt', '', 'file3.txt']
+
+    def test_slot_positions(self):
+        """Test slots of entries are known without searching them, deleted slots are reused lowest first
+        """
+        directory = DirectoryTable(2, b'')
+        for i in range(10):
+            directory.add_entry(f'file{i}', 'txt', i + 3)
+        parsed = DirectoryTable(2, directory.serialize())
+        for i in (7, 2, 5):
+            parsed.remove_entry(f'file{i}', 'txt')
+        assert parsed.dirty_slots == {2, 5, 7}
+
+        parsed.dirty_slots.clear()
+        parsed.mark_dirty(parsed.find_entry('file9', 'txt'))
+        assert parsed.dirty_slots == {9}
+        assert [parsed.add_entry(f'new{i}', 'txt', 20 + i) for i in range(4)] == [2, 5, 7, 10]
+        for position, entry in enumerate(parsed.entries):
+            assert parsed.positions[entry] == position
@@ -7,6 +7,8 @@ from pathlib import PosixPath
 
 from fat import constants as const
 from fat.core import FAT
+from fat.dir import DirectoryEntry
+from fat.exceptions import FATException
 
 
 @pytest.fixture(scope='function', autouse=True)
@@ -89,6 +91,30 @@ class TestFAT:
             saved_entry = volume.read(dir_entry.SIZE)
         assert saved_entry == b'data\x00\x00\x00\x00\x00\x00\x00\x10\x00\x00\x03\x00'
 
+    def test_create_file_without_name(self):
+        """Test a file with an empty name isn't created, it would hide the entries after it
+        """
+        self.fat.create_file('/foo', is_dir=True)
+        self.fat.create_file('/foo/a.t')
+        with pytest.raises(FATException):
+            self.fat.create_file('/foo/')
+        self.fat.create_file('/foo/b.t')
+        self.fat.save()
+
+        fat = FAT()
+        assert [entry.name for entry in fat.scandir('/foo')] == ['a.t', 'b.t']
+
+    @pytest.mark.parametrize('path, is_dir', [
+        ('/toolongname.txt', False), ('/file.text', False), ('/dir.ext', True), ('/', False),
+    ])
+    def test_invalid_name_allocates_nothing(self, path: str, is_dir: bool):
+        """Test a file with an invalid name isn't created and no clusters are reserved for it
+        """
+        free_count = len(self.fat.free_space)
+        with pytest.raises(FATException):
+            self.fat.create_file(path, is_dir=is_dir, size=self.fat.cluster_size * 4)
+        assert len(self.fat.free_space) == free_count
+
     def test_find_dir(self):
         """Test finding a directory by its path
         """
@@ -115,3 +141,170 @@ class TestFAT:
 
         found_file = self.fat.find_file(file_path)
         assert found_file == file_number
+
+    def test_write_file_allocates_contiguous_chain(self):
+        """Test a multi-cluster write gets one contiguous chain and keeps the free index in sync
+        """
+        file_number = self.fat.create_file('/test.txt')
+        free_before = len(self.fat.free_space)
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 3))
+
+        assert self.fat.entries[file_number] == file_number + 1
+        assert self.fat.entries[file_number + 1] == file_number + 2
+        assert self.fat.entries[file_number + 2] == const.EOC
+        assert len(self.fat.free_space) == free_before - 2
+        assert self.fat.find_free_cluster() == file_number + 3
+
+    def test_create_file_with_size(self):
+        """Test a file created with a known size gets all its clusters as one extent
+        """
+        small_file = self.fat.create_file('/small.txt')
+        self.fat.create_file('/gap.txt')
+        # a hole of one cluster is too small for the new file
+        self.fat.free_clusters([small_file])
+
+        file_number = self.fat.create_file('/big.txt', size=self.fat.cluster_size * 2 + 1)
+        assert file_number != small_file
+        assert self.fat.get_cluster_chain(file_number) == [file_number, file_number + 1, file_number + 2]
+        # writing the known size doesn't allocate anything else
+        free_before = len(self.fat.free_space)
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 2 + 1))
+        assert len(self.fat.free_space) == free_before
+
+    def test_mmap_table(self):
+        """Test the memory mapped FAT table sees and persists the same entries as the loaded one
+        """
+        file_number = self.fat.create_file('/test.txt')
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size + 1))
+        self.fat.save()
+
+        with FAT(mmap_table=True) as mapped_fat:
+            assert isinstance(mapped_fat.entries, memoryview)
+            assert mapped_fat.entries[file_number] == file_number + 1
+            assert mapped_fat.find_free_cluster() == file_number + 2
+            new_file = mapped_fat.create_file('/new.txt')
+
+        assert FAT().entries[new_file] == const.EOC
+
+    def test_save_writes_changed_sectors_only(self):
+        """Test `save` rewrites only FAT sectors with changed entries
+        """
+        self.fat.save()
+        fat = FAT()
+        assert not fat._dirty_sectors and not fat.root.dirty
+
+        # a cluster the entry of which lives in the last FAT sector
+        last_sector = (fat.max_clusters * 4 - 1) // const.SECTOR_SIZE
+        fat.set_entry(fat.max_clusters - 1, const.EOC)
+        fat.create_file('/test.txt')
+        assert fat._dirty_sectors == {0, last_sector}
+
+        # put a marker into an untouched FAT sector: it must survive the save
+        marker_position = fat.cluster_size + const.SECTOR_SIZE
+        with open(fat.volume_path, 'r+b') as volume:
+            volume.seek(marker_position)
+            volume.write(b'mark')
+        fat.save()
+        assert not fat._dirty_sectors
+
+        with open(fat.volume_path, 'rb') as volume:
+            volume.seek(marker_position)
+            assert volume.read(4) == b'mark'
+        assert FAT().entries[fat.max_clusters - 1] == const.EOC
+
+    def test_fragmented_file_io_by_runs(self):
+        """Test a fragmented file is read and written with one volume call per contiguous run
+        """
+        file_number = self.fat.create_file('/a.txt')
+        self.fat.create_file('/b.txt')
+        data = bytes(range(256)) * (self.fat.cluster_size * 2 // 256) + b'tail'
+
+        writes = []
+        volume_write = self.fat.volume.write
+        self.fat.volume.write = lambda position, chunk: writes.append(len(chunk)) or volume_write(position, chunk)
+        self.fat.write_file(file_number, data)
+
+        assert self.fat.get_cluster_chain(file_number) == [file_number, file_number + 2, file_number + 3]
+        assert writes == [self.fat.cluster_size, self.fat.cluster_size + 4]
+        assert self.fat.read_file(file_number) == data
+
+    @pytest.mark.parametrize('io_mode', [const.IOMode.PERSISTENT, const.IOMode.MMAP])
+    def test_io_modes(self, io_mode: str):
+        """Test volumes opened once (persistent descriptor or memory map) read and write the same data
+        """
+        self.fat.create_file('/data', is_dir=True)
+        self.fat.save()
+
+        data = b'some dummy data for the test' * 1000
+        with FAT(io_mode=io_mode) as fat:
+            file_number = fat.create_file('/data/test.txt')
+            fat.write_file(file_number, data)
+            assert fat.read_file(file_number)[:len(data)] == data
+
+            with fat.read_file_view(file_number) as view:
+                assert view[:len(data)] == data
+                if io_mode == const.IOMode.MMAP:
+                    # zero-copy view of the mapped volume
+                    assert not isinstance(view.obj, bytes)
+
+        assert FAT().read_file(FAT().find_file('/data/test.txt'))[:len(data)] == data
+
+    def test_find_dir_uses_dentry_cache(self):
+        """Test resolved directories are reused and stay in sync with created entries
+        """
+        self.fat.create_file('/data', is_dir=True)
+        self.fat.create_file('/data/some', is_dir=True)
+        some_dir = self.fat.find_dir('/data/some')
+
+        reads = []
+        read_dir = self.fat.read_dir
+        self.fat.read_dir = lambda number: reads.append(number) or read_dir(number)
+
+        assert self.fat.find_dir('/data/some') is some_dir
+        file_number = self.fat.create_file('/data/some/test.txt')
+        assert self.fat.find_file('/data/some/test.txt') == file_number
+        assert reads == []
+
+        self.fat.dentries.invalidate('/data')
+        assert len(self.fat.dentries) == 0
+        assert self.fat.find_file('/data/some/test.txt') == file_number
+        assert len(reads) == 2
+
+    def test_directory_slots_written_in_place(self):
+        """Test a new entry writes only its slot and a full directory grows by one cluster
+        """
+        self.fat.create_file('/dir', is_dir=True)
+        dir_cluster = self.fat.find_entry('/dir').first_file_cluster
+        slots_per_cluster = self.fat.cluster_size // DirectoryEntry.SIZE
+
+        writes = []
+        volume_write = self.fat.volume.write
+        self.fat.volume.write = lambda position, chunk: writes.append(len(chunk)) or volume_write(position, chunk)
+        for i in range(slots_per_cluster):
+            self.fat.create_file(f'/dir/f{i}.txt')
+        assert writes == [DirectoryEntry.SIZE] * slots_per_cluster
+        assert len(self.fat.get_cluster_chain(dir_cluster)) == 1
+
+        writes.clear()
+        self.fat.create_file('/dir/last.txt')
+        # the new cluster is cleared, then the entry is written into its first slot
+        assert writes == [self.fat.cluster_size, DirectoryEntry.SIZE]
+        assert len(self.fat.get_cluster_chain(dir_cluster)) == 2
+
+        self.fat.save()
+        directory = FAT().find_dir('/dir')
+        assert len(directory.entries) == slots_per_cluster + 1
+        assert directory.find_entry('last', 'txt') is not None
+
+    def test_new_dir_in_reused_cluster_is_empty(self):
+        """Test a directory created in a cluster of a deleted file doesn't see its content
+        """
+        file_number = self.fat.create_file('/old.txt')
+        self.fat.write_file(file_number, b'\xff' * self.fat.cluster_size)
+        self.fat.unlink('/old.txt')
+        # continue allocating from the freed cluster
+        self.fat.fsinfo.last_allocated = file_number - 1
+
+        assert self.fat.create_file('/dir', is_dir=True) == file_number
+        self.fat.save()
+        assert FAT().find_dir('/dir').entries == []
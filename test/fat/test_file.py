@@ -0,0 +1,83 @@
+"""Tests for seekable file streams
+"""
+
+import io
+import os
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.exceptions import FATException
+from fat.file import File
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestFile:
+    """Partial reads and writes through `File`
+    """
+
+    fat: FAT
+
+    def setup_method(self):
+        """Common initialization for every test
+        """
+        self.fat = FAT()
+
+    def test_write_read_across_clusters(self):
+        """Test writing at an offset spanning cluster boundaries and reading it back
+        """
+        cluster_size = self.fat.cluster_size
+        with File.create(self.fat, '/test.txt') as file:
+            file.write(b'a' * cluster_size)
+            assert file.tell() == cluster_size
+            file.seek(cluster_size - 2)
+            assert file.write(b'0123456789') == 10
+            assert file.size == cluster_size * 2
+
+        with self.fat.open_file('/test.txt') as file:
+            file.seek(cluster_size - 4)
+            assert file.read(8) == b'aa012345'
+            buffer = bytearray(4)
+            assert file.readinto(buffer) == 4
+            assert buffer == b'6789'
+            assert isinstance(io.BufferedReader(file), io.BufferedReader)
+
+    def test_chunks_and_seek_end(self):
+        """Test chunked iteration and seeking relative to the end
+        """
+        file_number = self.fat.create_file('/test.txt')
+        self.fat.write_file(file_number, b'x' * (self.fat.cluster_size * 2 + 5))
+
+        file = File(self.fat, file_number)
+        assert file.seek(-1, os.SEEK_END) == self.fat.cluster_size * 3 - 1
+        file.seek(0)
+        chunks = list(file.chunks())
+        assert [len(chunk) for chunk in chunks] == [self.fat.cluster_size, self.fat.cluster_size, 5]
+
+        with pytest.raises(FATException):
+            file.write(b'read only')
+
+    def test_chain_index_invalidated_on_extension(self):
+        """Test the cached chain index follows chains extended by `write_file`
+        """
+        file_number = self.fat.create_file('/test.txt')
+        self.fat.create_file('/other.txt')
+        file = File(self.fat, file_number, 'r+')
+        assert file.size == self.fat.cluster_size
+
+        self.fat.write_file(file_number, b'x' * self.fat.cluster_size * 2)
+        assert file.size == self.fat.cluster_size * 2
+        assert file.chain.lookup(1) == file_number + 2
+
+        file.seek(0, os.SEEK_END)
+        file.write(b'tail')
+        assert self.fat.get_cluster_chain(file_number) == [file_number, file_number + 2, file_number + 3]
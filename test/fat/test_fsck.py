@@ -0,0 +1,129 @@
+"""Tests for the volume consistency check
+"""
+
+from array import array
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat import fsck
+from fat.core import FAT
+from fat.table import ENTRY_TYPECODE
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestFsck:
+    """Checking chains and entries of a volume and repairing them
+    """
+
+    def setup_method(self):
+        self.fat = FAT()
+        self.fat.create_file('/dir', is_dir=True)
+        self.contents = {}
+        for path in ('/a.txt', '/dir/b.txt', '/dir/c.txt'):
+            self.contents[path] = path.encode().ljust(16, b'.') * (self.fat.cluster_size // 8)
+            self.fat.write_file(self.fat.create_file(path), self.contents[path])
+
+    def chain(self, path: str):
+        return self.fat.get_cluster_chain(self.fat.find_entry(path).first_file_cluster)
+
+    def corrupt(self) -> dict:
+        """Break the volume in every possible way, returns clusters of the problems"""
+        a, b, c = self.chain('/a.txt'), self.chain('/dir/b.txt'), self.chain('/dir/c.txt')
+        lost = self.fat.allocate_clusters(3)
+        free, = self.fat.allocate_clusters(1)
+        self.fat.free_clusters([free])
+        with self.fat.table_lock.write:
+            # b.txt runs into the tail of a.txt
+            self.fat.set_entry(b[-1], a[1])
+            # c.txt loops to its start
+            self.fat.set_entry(c[-1], c[0])
+            # a lost chain with a bad value in the middle
+            self.fat.set_entry(lost[1], 1)
+        # an entry of a free cluster
+        self.fat.create_file('/ghost.txt')
+        entry = self.fat.find_entry('/ghost.txt')
+        self.fat.free_clusters([entry.first_file_cluster])
+        entry.first_file_cluster = free
+        directory = self.fat.find_dir('/')
+        directory.mark_dirty(entry)
+        self.fat.save_dir(directory)
+        return {'a': a, 'b': b, 'c': c, 'lost': lost}
+
+    def test_clean(self):
+        """Test a consistent volume has no errors
+        """
+        self.fat.save()
+        report = fsck.check(FAT())
+        assert report['errors'] == 0
+        assert report['directories'] == 1
+        assert report['files'] == 3
+        assert report['used_clusters'] == 2 + 3 * 2
+
+    def test_problems(self):
+        """Test cross links, cycles, bad values, lost chains and bad entries are found
+        """
+        clusters = self.corrupt()
+        report = fsck.check(self.fat)
+
+        assert report['cross_linked'] == [clusters['a'][1]]
+        assert report['cycles'] == clusters['c']
+        assert report['bad_links'] == [clusters['lost'][1]]
+        assert report['lost_chains'] == 2
+        assert report['lost_clusters'] == 3
+        problems = {entry['path']: entry['problem'] for entry in report['bad_entries']}
+        assert problems == {'/ghost.txt': fsck.FREE, '/dir/c.txt': fsck.CYCLE}
+
+    def test_repair(self):
+        """Test a repaired volume is consistent and keeps the content of sound files
+        """
+        clusters = self.corrupt()
+        free_before = len(self.fat.free_space)
+        report = fsck.check(self.fat, repair=True)
+        assert report['errors']
+        assert report['remaining_errors'] == 0
+
+        fat = FAT()
+        assert fsck.check(fat)['errors'] == 0
+        # freed lost clusters and the tail of b.txt which was cut from the cross-linked chain
+        assert fat.free_count == free_before + 3
+        assert fat.read_file(fat.find_file('/a.txt')) == self.contents['/a.txt']
+        assert fat.get_cluster_chain(fat.find_file('/dir/c.txt')) == clusters['c']
+        with pytest.raises(Exception):
+            fat.find_entry('/ghost.txt')
+
+    def test_backends_agree(self):
+        """Test the vectorized check finds the same problems as the loops
+        """
+        numpy = pytest.importorskip('numpy')
+        assert numpy
+        self.corrupt()
+        vectorized = fsck.TableCheck(self.fat.entries, self.fat.max_clusters, use_numpy=True)
+        loops = fsck.TableCheck(self.fat.entries, self.fat.max_clusters, use_numpy=False)
+        for name in ('bad_links', 'free_links', 'cross_linked', 'in_cycles', 'used_count', 'free_count'):
+            assert getattr(vectorized, name) == getattr(loops, name)
+        used = [number for number in range(self.fat.max_clusters) if loops.used[number]]
+        assert [bool(vectorized.ended[number]) for number in used] == [loops.ended[number] for number in used]
+        assert [bool(vectorized.end_ok[number]) for number in used] == [loops.end_ok[number] for number in used]
+        referenced = [const.ROOT_FILE_NUM] + [self.fat.find_entry(path).first_file_cluster for path in self.contents]
+        assert vectorized.lost(referenced) == loops.lost(referenced)
+        assert [int(vectorized.head_of[number]) for number in used] == [loops.head_of[number] for number in used]
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_cross_linked_cluster_head(self, use_numpy: bool):
+        """Test a cross-linked cluster belongs to the chain of its first predecessor in both backends
+        """
+        if use_numpy:
+            pytest.importorskip('numpy')
+        entries = array(ENTRY_TYPECODE, [0, 0, const.EOC, 0, 5, const.EOC, const.EOC, 5])
+        table = fsck.TableCheck(entries, len(entries), use_numpy=use_numpy)
+        assert [int(table.head_of[number]) for number in (4, 5, 7)] == [4, 4, 7]
+        assert table.lost({2, 3, 7}) == [4, 5, 6]
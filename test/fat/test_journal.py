@@ -0,0 +1,200 @@
+"""Tests for the metadata journal
+"""
+
+import os
+import threading
+import time
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat import fsck
+from fat.core import FAT
+from fat.journal import Journal
+from fat.table import ENTRY_SIZE
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestJournal:
+    """Logging, committing and replaying metadata changes
+    """
+
+    def setup_method(self):
+        self.fat = FAT.format(2**20, 512, journal=True, stats=True)
+        self.content = b'journaled'.ljust(self.fat.cluster_size, b'.') * 3
+
+    def crash(self) -> FAT:
+        """Open the volume again without saving it, as after a crash"""
+        return FAT()
+
+    def test_replay_after_crash(self):
+        """Test committed changes are replayed on load and the volume is consistent after it
+        """
+        self.fat.create_file('/dir', is_dir=True)
+        self.fat.write_file(self.fat.create_file('/dir/file.txt'), self.content)
+        self.fat.create_file('/old.txt')
+        self.fat.unlink('/old.txt')
+        assert self.fat.commit()
+        assert not self.fat.commit()
+
+        fat = self.crash()
+        assert fat.read_file(fat.find_file('/dir/file.txt'))[:len(self.content)] == self.content
+        assert [entry.name for entry in fat.scandir('/')] == ['dir']
+        assert not fsck.check(fat)['errors']
+        # the journal is checkpointed and removed when it isn't enabled
+        assert not os.path.exists(self.fat.journal_path)
+
+    def test_not_committed_changes_are_lost(self):
+        """Test changes which weren't committed aren't replayed, the volume stays consistent
+        """
+        self.fat.create_file('/kept.txt')
+        self.fat.commit()
+        self.fat.create_file('/lost.txt')
+
+        fat = self.crash()
+        assert [entry.name for entry in fat.scandir('/')] == ['kept.txt']
+        assert not fsck.check(fat)['errors']
+
+    def test_slots_are_written_after_commit(self):
+        """Test directory slots go in place only after their records are committed, they're read from
+        the live directory meanwhile
+        """
+        self.fat.create_file('/dir', is_dir=True)
+        self.fat.create_file('/dir/file.txt')
+        cluster = self.fat.find_entry('/dir').first_file_cluster
+        on_disk = self.fat.volume.read(self.fat.get_cluster_position(cluster), 16)
+
+        assert self.fat.journal.pending
+        assert [entry.name for entry in self.fat.scandir('/dir')] == ['file.txt']
+        assert self.fat.volume.read(self.fat.get_cluster_position(cluster), 16) == on_disk
+        self.fat.commit()
+        assert self.fat.volume.read(self.fat.get_cluster_position(cluster), 16) != on_disk
+
+    def test_sync_commit(self):
+        """Test every operation is committed with synchronous commits
+        """
+        fat = FAT(journal=True, sync_commit=True, stats=True)
+        fat.create_file('/a.txt')
+        fat.create_file('/b.txt')
+        assert not fat.journal.pending
+        assert fat.stats.counters['journal.commits'] == 2
+
+    def test_freed_cluster_is_not_overwritten(self):
+        """Test slots of a deleted directory which aren't written yet don't go over the file
+        reusing its cluster, neither at the commit nor at replay
+        """
+        dir_cluster = self.fat.create_file('/dir', is_dir=True)
+        self.fat.rmdir('/dir')
+        self.fat.fsinfo.last_allocated = dir_cluster - 1
+        file_cluster = self.fat.create_file('/file.txt')
+        assert file_cluster == dir_cluster
+        self.fat.write_file(file_cluster, self.content)
+        self.fat.commit()
+        assert self.fat.read_file(file_cluster)[:len(self.content)] == self.content
+
+        fat = self.crash()
+        assert fat.read_file(fat.find_file('/file.txt'))[:len(self.content)] == self.content
+
+    def test_torn_group_is_ignored(self):
+        """Test a group cut off or damaged by a crash and all after it aren't read
+        """
+        journal = Journal(self.fat.journal_path + '.test')
+        journal.log_entry(5, 6)
+        journal.commit(lambda writes: None)
+        journal.log_entry(6, const.EOC)
+        journal.log_write(7, 32, b'slot')
+        journal.commit(lambda writes: None)
+        assert list(journal.records()) == [
+            (Journal.ENTRY, 5, 6), (Journal.ENTRY, 6, const.EOC), (Journal.WRITE, 7, 32, b'slot'),
+        ]
+
+        os.truncate(journal.path, journal.size - 1)
+        assert list(Journal(journal.path).records()) == [(Journal.ENTRY, 5, 6)]
+
+        with open(journal.path, 'r+b') as f:
+            f.seek(Journal.GROUP_HEADER.size)
+            f.write(b'\xff')
+        assert list(Journal(journal.path).records()) == []
+
+    def test_checkpoint(self):
+        """Test saving writes the changes in place and empties the journal
+        """
+        self.fat.stats.reset()
+        self.fat.write_file(self.fat.create_file('/file.txt'), self.content)
+        assert os.path.getsize(self.fat.journal_path) == 0
+        self.fat.commit()
+        assert os.path.getsize(self.fat.journal_path) > 0
+        self.fat.save()
+        assert os.path.getsize(self.fat.journal_path) == 0
+        assert self.fat.stats.counters['journal.checkpoints'] == 1
+
+        fat = FAT()
+        assert fat.read_file(fat.find_file('/file.txt'))[:len(self.content)] == self.content
+
+    @pytest.mark.parametrize('mmap_table', [False, True])
+    def test_fat_copies(self, mmap_table: bool):
+        """Test all copies of the FAT are the same after saving
+        """
+        fat = FAT(mmap_table=mmap_table)
+        assert fat.bpb.fat_count == 2
+        fat.write_file(fat.create_file('/file.txt'), self.content)
+        fat.save()
+        fat.close()
+
+        size = fat.max_clusters * ENTRY_SIZE
+        with open(fat.volume_path, 'rb') as volume:
+            volume.seek(fat.bpb.fat_copy_offset(0))
+            first = volume.read(size)
+            volume.seek(fat.bpb.fat_copy_offset(1))
+            assert volume.read(size) == first
+        assert first[const.ROOT_FILE_NUM * ENTRY_SIZE:(const.ROOT_FILE_NUM + 1) * ENTRY_SIZE] != bytes(ENTRY_SIZE)
+
+    def test_group_commit(self, monkeypatch: MonkeyPatch):
+        """Test operations of threads waiting for a commit are committed together
+        """
+        fsync = os.fsync
+
+        def slow_fsync(fd: int):
+            time.sleep(0.005)
+            fsync(fd)
+
+        monkeypatch.setattr(os, 'fsync', slow_fsync)
+        fat = FAT(journal=True, sync_commit=True, stats=True)
+
+        def create(worker: int):
+            fat.create_file(f'/w{worker}', is_dir=True)
+            for i in range(10):
+                fat.create_file(f'/w{worker}/f{i}.txt')
+
+        threads = [threading.Thread(target=create, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert fat.stats.counters['journal.commits'] < 8 * 11
+        fat.close()
+        fat = self.crash()
+        assert sum(1 for _ in fat.walk()) == 8 * 11
+        assert not fsck.check(fat)['errors']
+
+    def test_mapped_table_changes_wait_for_checkpoint(self):
+        """Test FAT changes don't reach the volume before they're committed when the table is mapped
+        """
+        fat = FAT(journal=True, mmap_table=True)
+        fat.write_file(fat.create_file('/a.txt'), self.content)
+        fat.save()
+        fat.unlink('/a.txt')
+
+        fat = self.crash()
+        assert [entry.name for entry in fat.scandir('/')] == ['a.txt']
+        assert fat.read_file(fat.find_file('/a.txt'))[:len(self.content)] == self.content
+        assert not fsck.check(fat)['errors']
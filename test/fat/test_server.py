@@ -0,0 +1,99 @@
+"""Tests for the volume server and its client
+"""
+
+import asyncio
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.client import Client
+from fat.core import FAT
+from fat.exceptions import FATException
+from fat.protocol import read_header
+from fat.server import FATServer
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestFATServer:
+    """Requests served from one resident FAT
+    """
+
+    def test_pipelined_requests(self, tmp_path: PosixPath):
+        """Test pipelined requests of several clients, streamed bodies and errors
+        """
+        socket_path = (tmp_path / 'fat.sock').as_posix()
+        data = bytes(range(256)) * 1000  # a few body chunks
+
+        async def scenario(server: FATServer):
+            await server.start()
+            async with await Client.connect(socket_path) as client:
+                await client.mkdir('/foo')
+                # all of them are sent before the first response is read
+                await asyncio.gather(*(client.touch(f'/foo/f{i}.bin') for i in range(10)))
+                await client.write('/foo/f3.bin', data)
+
+                async with await Client.connect(socket_path) as other:
+                    content, stat = await asyncio.gather(other.read('/foo/f3.bin'), other.stat('/foo/f3.bin'))
+                assert content[:len(data)] == data
+                assert stat['size'] >= len(content) and not stat['is_dir']
+
+                with pytest.raises(FATException, match='already exists'):
+                    await client.touch('/foo/f3.bin')
+                with pytest.raises(FATException, match='does not exist'):
+                    await client.write('/foo/missing.bin', data)
+                await client.commit()
+            await server.close()
+            return server.requests
+
+        assert asyncio.run(scenario(FATServer(FAT(), socket_path))) == 17
+        fat = FAT()
+        assert fat.read_file(fat.find_file('/foo/f3.bin'))[:len(data)] == data
+
+    def test_write_replaces_content(self, tmp_path: PosixPath):
+        """Test a shorter write frees the clusters of the old content
+        """
+        socket_path = (tmp_path / 'fat.sock').as_posix()
+        fat = FAT()
+
+        async def scenario(server: FATServer):
+            await server.start()
+            async with await Client.connect(socket_path) as client:
+                await client.touch('/f.bin')
+                await client.write('/f.bin', b'x' * fat.cluster_size * 3)
+                await client.write('/f.bin', b'short')
+                content, stat = await asyncio.gather(client.read('/f.bin'), client.stat('/f.bin'))
+            await server.close()
+            return content, stat
+
+        free_count = fat.free_count
+        content, stat = asyncio.run(scenario(FATServer(fat, socket_path)))
+        assert content[:5] == b'short'
+        assert stat['size'] == fat.cluster_size
+        assert fat.free_count == free_count - 1
+
+    def test_malformed_requests(self, tmp_path: PosixPath):
+        """Test malformed requests get error responses and the connection keeps serving
+        """
+        socket_path = (tmp_path / 'fat.sock').as_posix()
+        requests = [b'{"op": "stat"}', b'{"op": "mkdir", "path": 1}', b'not json', b'[1, 2]',
+                    b'{"op": "write", "path": "/missing.bin", "size": "big"}', b'{"op": "stat", "path": "/"}']
+
+        async def scenario(server: FATServer):
+            await server.start()
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(b''.join(request + b'\n' for request in requests))
+            responses = [await read_header(reader) for _ in requests]
+            writer.close()
+            await server.close()
+            return responses
+
+        responses = asyncio.run(scenario(FATServer(FAT(), socket_path)))
+        assert [response['ok'] for response in responses] == [False] * 5 + [True]
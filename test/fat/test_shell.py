@@ -0,0 +1,58 @@
+"""Tests for batch and interactive modes of the CLI
+"""
+
+import io
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.exceptions import FATException
+from fat.shell import Shell
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestShell:
+    """Commands executed on one loaded FAT
+    """
+
+    def test_batch_commits_once(self):
+        """Test a batch script runs on one FAT instance and its changes are saved
+        """
+        output = io.StringIO()
+        script = [
+            'mkdir /foo\n',
+            '# comment\n',
+            '\n',
+            'touch /foo/test.txt\n',
+            'write /foo/test.txt "some test data"\n',
+            'read /foo/test.txt\n',
+        ]
+        with FAT() as fat:
+            shell = Shell(fat, stdout=output)
+            shell.run_batch(script)
+        assert shell.operations == 4
+        assert output.getvalue() == 'some test data\n'
+
+        fat = FAT()
+        assert fat.read_file(fat.find_file('/foo/test.txt')) == b'some test data'
+
+    def test_errors(self):
+        """Test a batch stops at a failed line and an interactive command reports it
+        """
+        output = io.StringIO()
+        shell = Shell(FAT(), stdout=output)
+        with pytest.raises(FATException, match='line 2'):
+            shell.run_batch(['touch /a.txt', 'touch /a.txt', 'touch /b.txt'])
+        assert shell.operations == 1
+
+        shell.onecmd('read /missing.txt')
+        assert output.getvalue().startswith('error: /missing.txt file does not exist')
@@ -0,0 +1,75 @@
+"""Tests for instrumentation of FAT operations
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.stats import Histogram
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestStats:
+    """Counters, latencies and trace hooks
+    """
+
+    def setup_method(self):
+        self.fat = FAT(stats=True)
+        self.fat.create_file('/dir', is_dir=True)
+        self.fat.create_file('/dir/a.txt')
+        self.data = b'a' * (self.fat.cluster_size * 3)
+        self.fat.write_file(self.fat.find_file('/dir/a.txt'), self.data)
+        self.fat.stats.reset()
+
+    def test_counters(self):
+        """Test bytes, clusters and chain hops of reading a file are counted
+        """
+        self.fat.read_file(self.fat.find_file('/dir/a.txt'))
+
+        counters = self.fat.collect_stats()['counters']
+        assert counters['read_file.calls'] == 1
+        assert counters['read_file.bytes'] == len(self.data)
+        assert counters['read_file.clusters'] == 3
+        assert counters['chain.hops'] >= 3
+        assert counters['find_dir.calls'] == 1
+
+    def test_latency_and_hooks(self):
+        """Test every timed operation is recorded and passed to hooks
+        """
+        calls = []
+        self.fat.stats.add_hook(lambda operation, seconds: calls.append(operation))
+        self.fat.save()
+
+        assert calls == ['sync', 'save']
+        latency = self.fat.collect_stats()['latency']
+        assert latency['save']['count'] == 1
+        assert latency['save']['max_ms'] >= latency['sync']['max_ms']
+
+    def test_disabled(self):
+        """Test nothing is recorded while statistics are disabled
+        """
+        self.fat.stats.enabled = False
+        self.fat.read_file(self.fat.find_file('/dir/a.txt'))
+        self.fat.save()
+
+        stats = self.fat.collect_stats()
+        assert stats['counters'] == {}
+        assert stats['latency'] == {}
+
+    def test_histogram(self):
+        """Test percentiles are upper bounds of power-of-two buckets
+        """
+        histogram = Histogram()
+        for microseconds in (1, 2, 3, 100, 1000):
+            histogram.add(microseconds / 1e6)
+        assert histogram.count == 5
+        assert histogram.percentile(50) == 4 / 1e6
+        assert histogram.percentile(100) == histogram.max == 1000 / 1e6
@@ -0,0 +1,132 @@
+"""Stress tests of a FAT shared between threads
+"""
+
+import sys
+import threading
+from collections import Counter
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+
+THREADS = 8
+FILES_PER_THREAD = 12
+UNLINKS_PER_THREAD = 100
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+def payload(thread: int, number: int, cluster_size: int) -> bytes:
+    return bytes([thread * 16 + number % 16]) * (cluster_size * (number % 3) + 100 + thread)
+
+
+class TestThreads:
+    """Many threads creating, writing and reading files of one volume
+    """
+
+    @pytest.mark.parametrize('cache_size', [0, const.CACHE_SIZE])
+    def test_parallel_writers_and_readers(self, cache_size: int):
+        """Test concurrent operations don't lose entries, cross-link chains or corrupt data
+        """
+        fat = FAT(cache_size=cache_size, io_mode=const.IOMode.PERSISTENT)
+        fat.create_file('/shared', is_dir=True)
+        errors = []
+
+        def worker(thread: int):
+            try:
+                fat.create_file(f'/t{thread}', is_dir=True)
+                for number in range(FILES_PER_THREAD):
+                    # every thread also adds files to the same directory
+                    directory = '/shared' if number % 2 else f'/t{thread}'
+                    path = f'{directory}/f{thread}_{number}.bin'
+                    file_number = fat.create_file(path)
+                    data = payload(thread, number, fat.cluster_size)
+                    fat.write_file(file_number, data)
+                    assert fat.read_file(fat.find_file(path))[:len(data)] == data
+            except Exception as e:  # pragma: no cover - reported by the main thread
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(THREADS)]
+        # switch threads as often as possible to hit races
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert not errors
+        fat.save()
+        fat.close()
+
+        fat = FAT()
+        shared_entries = [entry for entry in fat.find_dir('/shared').entries if entry.filename]
+        assert len(shared_entries) == THREADS * FILES_PER_THREAD // 2
+        used = Counter()
+        for thread in range(THREADS):
+            for number in range(FILES_PER_THREAD):
+                directory = '/shared' if number % 2 else f'/t{thread}'
+                file_number = fat.find_file(f'{directory}/f{thread}_{number}.bin')
+                data = payload(thread, number, fat.cluster_size)
+                assert fat.read_file(file_number)[:len(data)] == data
+                used.update(fat.get_cluster_chain(file_number))
+
+        # no cluster belongs to two files and the free space index agrees with the table
+        assert max(used.values()) == 1
+        allocated = sum(1 for entry in fat.entries[const.FAT_CLUSTER_TO_USE_FROM:] if entry)
+        assert len(fat.free_space) == fat.max_clusters - const.FAT_CLUSTER_TO_USE_FROM - allocated
+
+    @pytest.mark.parametrize('io_mode', [const.IOMode.DEFAULT, const.IOMode.PERSISTENT, const.IOMode.MMAP])
+    def test_unlinks_with_cache(self, io_mode: str):
+        """Test cached changes of deleted files don't go over the files reusing their clusters
+        """
+        fat = FAT(cache_size=const.CACHE_SIZE, io_mode=io_mode)
+        errors = []
+
+        def worker(thread: int):
+            try:
+                fat.create_file(f'/t{thread}', is_dir=True)
+                for number in range(UNLINKS_PER_THREAD):
+                    path = f'/t{thread}/f{number}.bin'
+                    data = payload(thread, number, fat.cluster_size)
+                    fat.write_file(fat.create_file(path), data)
+                    assert fat.read_file(fat.find_file(path))[:len(data)] == data
+                    # every other file is deleted, its clusters go to the next files of all threads
+                    if number % 2 == 0:
+                        fat.unlink(path)
+            except Exception as e:  # pragma: no cover - reported by the main thread
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(thread,)) for thread in range(THREADS)]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert not errors
+        fat.save()
+        fat.close()
+
+        fat = FAT()
+        used = Counter()
+        for thread in range(THREADS):
+            for number in range(1, UNLINKS_PER_THREAD, 2):
+                file_number = fat.find_file(f'/t{thread}/f{number}.bin')
+                data = payload(thread, number, fat.cluster_size)
+                assert fat.read_file(file_number)[:len(data)] == data
+                used.update(fat.get_cluster_chain(file_number))
+        assert max(used.values()) == 1
@@ -0,0 +1,50 @@
+"""Tests for bulk import/export of directory trees
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.transfer import export_tree, import_tree
+from fat.utils import group_consecutive
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestTransfer:
+    """Copying trees between the host and the volume
+    """
+
+    def test_import_export_round_trip(self, tmp_path: PosixPath):
+        """Test an imported tree has contiguous files and is exported with the same content
+        """
+        fat = FAT()
+        host = tmp_path / 'host'
+        (host / 'sub' / 'deep').mkdir(parents=True)
+        contents = {
+            'a.bin': bytes(range(256)) * 300,
+            'sub/b.txt': b'small file',
+            'sub/deep/c.dat': b'\x01' * (fat.cluster_size * 3),
+        }
+        for name, content in contents.items():
+            (host / name).write_bytes(content)
+
+        report = import_tree(fat, host.as_posix(), '/imp', workers=3)
+        assert (report['dirs'], report['files'], report['bytes']) == (2, 3, sum(map(len, contents.values())))
+        for name, content in contents.items():
+            file_number = fat.find_file(f'/imp/{name}')
+            assert len(list(group_consecutive(fat.get_cluster_chain(file_number)))) == 1
+            assert fat.read_file(file_number)[:len(content)] == content
+
+        out = tmp_path / 'out'
+        report = export_tree(fat, '/imp', out.as_posix(), workers=3)
+        assert (report['dirs'], report['files']) == (2, 3)
+        for name, content in contents.items():
+            assert (out / name).read_bytes()[:len(content)] == content
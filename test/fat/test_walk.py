@@ -0,0 +1,101 @@
+"""Tests for directory listing and walking
+"""
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from pathlib import PosixPath
+
+from fat import constants as const
+from fat.core import FAT
+from fat.dir import DirectoryEntry, DirectoryTable, scan_slots
+
+
+@pytest.fixture(scope='function', autouse=True)
+def global_mocks(monkeypatch: MonkeyPatch, tmp_path: PosixPath):
+    """Gathers all mocks that should be applied to all tests in the file
+    """
+    monkeypatch.setattr(const, 'DATA_PATH', tmp_path.as_posix())
+
+
+class TestWalk:
+    """Lazy scanning of directories and recursive walk
+    """
+
+    def setup_method(self):
+        # small clusters: directories take a few clusters
+        self.fat = FAT.format(2**20, 512)
+        self.slots_per_cluster = self.fat.cluster_size // DirectoryEntry.SIZE
+        self.fat.create_file('/dir', is_dir=True)
+        self.fat.create_file('/dir/sub', is_dir=True)
+        self.fat.create_file('/dir/sub/deep.txt')
+        self.names = [f'f{i}.txt' for i in range(self.slots_per_cluster * 2)]
+        for name in self.names:
+            self.fat.create_file(f'/dir/{name}')
+        self.fat.unlink('/dir/f3.txt')
+        self.fat.create_file('/top.txt')
+        self.fat.save()
+        self.fat = FAT()
+
+    def test_scan_slots(self):
+        """Test slots are scanned up to the end of directory with deleted ones as None
+        """
+        directory = DirectoryTable(2, b'')
+        for i in range(3):
+            directory.add_entry(f'file{i}', 'txt', i + 3)
+        directory.remove_entry('file1', 'txt')
+        data = directory.serialize() + bytes(DirectoryEntry.SIZE) + directory.serialize()
+
+        slots = list(scan_slots(data))
+        assert len(slots) == 3
+        assert slots[1] is None
+        assert slots[2][0].rstrip(b'\0') == b'file2'
+
+    def test_scandir(self):
+        """Test entries are listed in the order of slots without building a directory table
+        """
+        dir_cluster = self.fat.find_entry('/dir').first_file_cluster
+        entries = list(self.fat.scandir('/dir'))
+        assert [entry.name for entry in entries] == ['sub'] + [name for name in self.names if name != 'f3.txt']
+        assert entries[0].is_dir() and entries[0].path == '/dir/sub'
+        assert dir_cluster not in self.fat._dirs
+
+        assert [entry.path for entry in self.fat.scandir('/')] == ['/dir', '/top.txt']
+
+    def test_scandir_stops_at_end(self):
+        """Test clusters after the end of directory are not read
+        """
+        sub_cluster = self.fat.find_entry('/dir/sub').first_file_cluster
+        # a cluster of garbage after the end of directory
+        self.fat.extend_chain(sub_cluster, 1)
+        self.fat.write_extent(self.fat.get_cluster_chain(sub_cluster)[1], 0, b'\xff' * self.fat.cluster_size)
+
+        reads = []
+        read_extent = self.fat.read_extent
+        self.fat.read_extent = lambda number, *args: reads.append(number) or read_extent(number, *args)
+
+        assert [entry.name for entry in self.fat.scandir('/dir/sub')] == ['deep.txt']
+        assert reads == [sub_cluster]
+
+    def test_walk_and_du(self):
+        """Test walk yields every entry with directories before their content, du sums their clusters
+        """
+        paths = [entry.path for entry in self.fat.walk()]
+        assert paths[:4] == ['/dir', '/dir/sub', '/dir/sub/deep.txt', '/dir/f0.txt']
+        assert paths[-1] == '/top.txt'
+        assert len(paths) == len(self.names) + 3
+
+        cluster_size = self.fat.cluster_size
+        assert self.fat.du('/top.txt') == cluster_size
+        assert self.fat.du('/dir/sub') == 2 * cluster_size
+        # /dir takes 3 clusters for its slots
+        assert self.fat.du('/dir') == (3 + 2 + len(self.names) - 1) * cluster_size
+        assert self.fat.du('/') == self.fat.du('/dir') + 2 * cluster_size
+
+    def test_walk_keeps_no_tables(self):
+        """Test walking and du don't build directory tables or cache their paths
+        """
+        dentries, tables = len(self.fat.dentries), set(self.fat._dirs.keys())
+        assert len(list(self.fat.walk())) == len(self.names) + 3
+        self.fat.du('/')
+        assert len(self.fat.dentries) == dentries
+        assert set(self.fat._dirs.keys()) == tables